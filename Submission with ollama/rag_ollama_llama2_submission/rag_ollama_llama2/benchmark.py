@@ -0,0 +1,1314 @@
+"""
+benchmark.py
+-------------
+Performance benchmarks for the RAG pipeline.
+
+    python benchmark.py index [--k 5] [--queries 200] [--json out.json]
+    python benchmark.py startup [--runs 3] [--check] [--json out.json]
+    python benchmark.py throughput [--concurrency 1 2 4 8] [--requests 32]
+                                   [--llm-latency 0.5] [--json out.json]
+    python benchmark.py pipeline [--workers 0] [--json out.json]
+    python benchmark.py search [--sizes 1000 10000 100000] [--k 1 3 5 10]
+    python benchmark.py e2e [--requests 50] [--llm-latency 0]
+    python benchmark.py retrieval [--k 3] [--repeats 5] [--rerank]
+    python benchmark.py ollama [--requests 50] [--llm-latency 0]
+    python benchmark.py shards [--size 100000] [--shards 1 2 4 8] [--k 5]
+    python benchmark.py serve [--workers 1 2] [--concurrency 8] [--requests 200]
+                              [--llm-latency 0.05] [--no-mmap] [--url URL]
+    python benchmark.py download [--files 5] [--size-mb 2] [--bandwidth-mb 4] [--workers 4]
+    python benchmark.py filter [--size 100000] [--index-types flat ivf_flat hnsw] [--k 5]
+    python benchmark.py dedup [--copies 0.2] [--noise 0.02] [--threshold 0.7]
+    python benchmark.py precision [--size 100000] [--index-types flat hnsw] [--k 5]
+    python benchmark.py suite --json BENCH.json [--baseline OLD.json] [--threshold 0.2]
+    python benchmark.py compare OLD.json NEW.json [--threshold 0.2]
+
+index:   recall@k vs. per-query latency of the approximate FAISS index types
+         (IVF-Flat, IVF-PQ, HNSW) against the exact flat index, over the
+         vectors already stored in artifacts/faiss_index. Queries are corpus
+         vectors with a little Gaussian noise, so no embedding model is needed.
+startup: cold-start cost of the bot, each run in a fresh interpreter: time to
+         import chatbot, build a RAGBot, answer the first and second
+         retrieval, and build a second RAGBot. Compared against the budgets
+         below; --check exits non-zero when one is exceeded.
+throughput: requests/sec of RAGBot.aask() with every request in flight at
+         once (one session each), at several scheduler concurrency limits.
+         Retrieval is real; the LLM is fakes.FakeLLM with a fixed latency,
+         so Ollama is not needed. Query caches are cleared per level.
+pipeline: ingest.load_and_chunk pages/sec, build_vector_store chunks/sec
+         (cold embedding cache) and index / model load time, run in fresh
+         interpreters against a temporary RAG_ARTIFACTS_DIR so the real
+         artifacts are untouched.
+search:  FAISS_INDEX_TYPE search latency and QPS at several k over synthetic
+         corpora of several sizes (seeded noise around the saved vectors),
+         plus LangChain similarity_search() on the saved store.
+e2e:     RAGBot.ask() with fakes.FakeLLM, with query caches cleared before
+         each request (uncached) and on a repeat pass (cached).
+retrieval: RAGBot.retrieve() latency in dense and hybrid (FAISS + BM25)
+         mode, with the query-embedding cache warm and the result cache
+         cleared, so the difference is the sparse search and fusion. With
+         --rerank, also dense + cross-encoder reranking (score cache
+         cleared per query, so every pair is scored).
+ollama:  per-request overhead and TCP connections of LangChain's Ollama
+         wrapper vs. the pooled ollama_client, plain and streamed, against
+         fakes.FakeOllamaServer (no Ollama needed), plus one request that
+         succeeds after two 503s.
+shards:  a synthetic corpus split into 1, 2, 4, ... FAISS_INDEX_TYPE shards:
+         parallel build time, fan-out search latency / QPS and recall@k
+         against one unsharded index (sharded_index.py).
+serve:   load test of server.py: for each worker count, starts the server
+         (Ollama replaced by fakes.FakeOllamaServer), keeps --concurrency
+         sessions asking questions back to back over keep-alive HTTP, and
+         reports QPS, latency and, per worker, requests served and memory
+         (RSS, PSS, resident index pages) from /metrics. --no-mmap gives
+         each worker a private copy of the index, for comparison; --url
+         load-tests a server that is already running instead.
+download: downloader.py against fakes.FakeFileServer (bandwidth-capped per
+         response, like a remote host): serial vs. parallel fetch time of
+         the PDF set, a download cut short and resumed with a Range request
+         (bytes fetched twice), and a re-run that verifies the manifest
+         without any request.
+filter:  metadata-filtered search on a synthetic corpus with synthetic
+         papers, years and pages (metadata_filter.py), at several filter
+         selectivities and index types: latency and recall@k of the bitmap
+         prefilter inside FAISS vs. LangChain-style post-filtering (fetch
+         fetch_k rows, drop the ones outside the filter), with an unfiltered
+         search as reference. Ground truth is an exact search restricted to
+         the filtered rows.
+dedup:   dedup.py over the ingest chunk store plus --copies x chunks of
+         near-copies (--noise of their words replaced, like a second version
+         of a paper): chunks dropped, copies caught, originals dropped, dedup
+         time, and embedding + FAISS_INDEX_TYPE build time and index size
+         with and without the duplicates (embedding cache off).
+precision: float32 vs. float16 vs. int8 storage (INDEX_PRECISION) of each
+         index type on a synthetic corpus: index file size (= memory once
+         loaded), load time, search latency and recall@k against exact
+         float32 search, without and with rescoring of RESCORE_FACTOR * k
+         candidates from a memory-mapped float32 file.
+suite:   pipeline + search + e2e into one JSON file with run metadata (git
+         commit, Python, CPU count, config) and a flat "headline" metric set.
+         With --baseline, metrics that got worse by more than --threshold
+         are reported and the exit code is 1; `compare` does the same for
+         two saved files.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from config import (
+    FAISS_INDEX_PATH,
+    FAISS_INDEX_TYPE,
+    EMBEDDING_MODEL_NAME,
+    OLLAMA_MODEL_NAME,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
+from vector_store import VECTORS_FILE, RescoredIndex, make_index, save_vectors, set_search_params
+
+HERE = Path(__file__).resolve().parent
+
+# (index type, build params, [(query-time knob, values), ...])
+INDEX_GRID = [
+    ("ivf_flat", {"nlist": IVF_NLIST}, ("nprobe", [1, 2, 4, 8, 16, 32])),
+    ("ivf_pq", {"nlist": IVF_NLIST, "m": PQ_M, "nbits": PQ_NBITS}, ("nprobe", [1, 2, 4, 8, 16, 32])),
+    ("hnsw", {"hnsw_m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}, ("ef_search", [16, 32, 64, 128, 256])),
+]
+
+
+def load_corpus_vectors() -> np.ndarray:
+    if VECTORS_FILE.exists():
+        # Saved next to scalar-quantized indexes, which only reconstruct approximately
+        return np.load(VECTORS_FILE)
+    index = faiss.read_index(str(FAISS_INDEX_PATH / "index.faiss"))
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        raise SystemExit(
+            "[benchmark] The saved index cannot return its vectors; "
+            "rebuild it with FAISS_INDEX_TYPE = \"flat\" first."
+        )
+
+
+def sample_queries(vectors: np.ndarray, n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)
+    noise = rng.normal(0.0, 0.01, size=(len(rows), vectors.shape[1]))
+    return (vectors[rows] + noise).astype(np.float32)
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """
+    One query at a time, like RAGBot does. Returns (ids, latencies in ms).
+    """
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = found[0]
+    return ids, latencies
+
+
+def recall_at_k(found: np.ndarray, exact: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, exact))
+    return hits / exact.size
+
+
+def latency_summary(latencies) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": statistics.median(ordered),
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))],
+        "mean_ms": statistics.fmean(ordered),
+    }
+
+
+def index_size_bytes(index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def bench_index(k: int = 5, num_queries: int = 200) -> dict:
+    vectors = load_corpus_vectors()
+    queries = sample_queries(vectors, num_queries)
+    print(f"[benchmark] {len(vectors)} vectors, {len(queries)} queries, k={k}")
+
+    flat = make_index(vectors, "flat")
+    flat.add(vectors)
+    exact, flat_lat = timed_search(flat, queries, k)
+    results = [{
+        "index_type": "flat",
+        "param": None,
+        "value": None,
+        "recall": 1.0,
+        "build_s": 0.0,
+        "size_bytes": index_size_bytes(flat),
+        **latency_summary(flat_lat),
+    }]
+
+    for index_type, params, (knob, values) in INDEX_GRID:
+        start = time.perf_counter()
+        index = make_index(vectors, index_type, **params)
+        index.add(vectors)
+        build_s = time.perf_counter() - start
+        size = index_size_bytes(index)
+        for value in values:
+            set_search_params(index, **{knob: value})
+            found, lat = timed_search(index, queries, k)
+            results.append({
+                "index_type": index_type,
+                "param": knob,
+                "value": value,
+                "recall": recall_at_k(found, exact),
+                "build_s": build_s,
+                "size_bytes": size,
+                **latency_summary(lat),
+            })
+
+    print(f"{'index':<10}{'param':<14}{'recall@' + str(k):>10}{'p50 ms':>10}{'p95 ms':>10}{'size KiB':>11}{'build s':>9}")
+    for r in results:
+        param = f"{r['param']}={r['value']}" if r["param"] else "-"
+        print(
+            f"{r['index_type']:<10}{param:<14}{r['recall']:>10.3f}"
+            f"{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+            f"{r['size_bytes'] / 1024:>11.1f}{r['build_s']:>9.2f}"
+        )
+
+    return {"k": k, "num_vectors": len(vectors), "num_queries": len(queries), "results": results}
+
+
+# Cold-start budgets in seconds (median over runs)
+STARTUP_BUDGETS = {
+    "import_s": 0.5,
+    "construct_s": 3.0,
+    "first_query_s": 10.0,
+    "second_query_s": 0.5,
+    "second_bot_s": 0.5,
+}
+
+# Runs in a fresh interpreter; the LLM is never called, only retrieval
+_STARTUP_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import chatbot
+t1 = time.perf_counter()
+bot = chatbot.RAGBot()
+t2 = time.perf_counter()
+bot.retrieve("What is self-attention?")
+t3 = time.perf_counter()
+bot.retrieve("How does BERT pre-training work?")
+t4 = time.perf_counter()
+chatbot.RAGBot().retrieve("What is multi-head attention?")
+t5 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "construct_s": t2 - t1,
+    "first_query_s": t3 - t2,
+    "second_query_s": t4 - t3,
+    "second_bot_s": t5 - t4,
+}))
+"""
+
+
+def run_probe(code: str, *args, env=None) -> dict:
+    """
+    Runs code in a fresh interpreter; its last stdout line is a JSON dict.
+    """
+    out = subprocess.run(
+        [sys.executable, "-c", code, *map(str, args)],
+        cwd=HERE,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(runs: int = 3) -> dict:
+    samples = []
+    for i in range(runs):
+        samples.append(run_probe(_STARTUP_PROBE))
+        print(f"[benchmark] startup run {i + 1}/{runs}: {samples[-1]}")
+
+    medians = {key: statistics.median(s[key] for s in samples) for key in STARTUP_BUDGETS}
+    over = [key for key, budget in STARTUP_BUDGETS.items() if medians[key] > budget]
+
+    print(f"{'stage':<16}{'median s':>10}{'budget s':>10}")
+    for key, budget in STARTUP_BUDGETS.items():
+        flag = "  OVER" if key in over else ""
+        print(f"{key:<16}{medians[key]:>10.3f}{budget:>10.3f}{flag}")
+
+    return {"runs": samples, "median": medians, "budgets": STARTUP_BUDGETS, "over_budget": over}
+
+
+def load_questions() -> list:
+    with open(HERE / "questions.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bench_throughput(levels=(1, 2, 4, 8), num_requests: int = 32, llm_latency: float = 0.5) -> dict:
+    from chatbot import RAGBot, clear_caches, warm_up
+    from fakes import FakeLLM
+
+    questions = load_questions()
+    queries = [questions[i % len(questions)] for i in range(num_requests)]
+    warm_up()
+
+    results = []
+    for level in levels:
+        clear_caches()
+        bot = RAGBot(llm=FakeLLM(latency=llm_latency), max_concurrency=level)
+        latencies = []
+
+        async def one(i):
+            start = time.perf_counter()
+            await bot.aask(queries[i], session_id=f"bench-{i}")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        async def run():
+            await asyncio.gather(*(one(i) for i in range(num_requests)))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        results.append({
+            "max_concurrency": level,
+            "requests": num_requests,
+            "elapsed_s": elapsed,
+            "req_per_s": num_requests / elapsed,
+            **latency_summary(latencies),
+        })
+        print(f"[benchmark] concurrency {level}: {num_requests / elapsed:.2f} req/s")
+
+    print(f"{'concurrency':<13}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in results:
+        print(f"{r['max_concurrency']:<13}{r['req_per_s']:>9.2f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}")
+
+    return {"llm_latency_s": llm_latency, "results": results}
+
+
+# Ingest + full build in a temporary artifacts dir; heavy imports happen
+# before the clock starts
+_PIPELINE_PROBE = """
+import json, sys, time
+import sentence_transformers
+from pypdf import PdfReader
+import ingest, vector_store
+from chunk_store import ChunkStore
+from config import PDF_FILES, CHUNK_STORE_DIR
+pages = sum(len(PdfReader(str(p)).pages) for p in PDF_FILES if p.exists())
+t0 = time.perf_counter()
+ingest.load_and_chunk(full=True, workers=int(sys.argv[1]))
+t1 = time.perf_counter()
+vector_store.build_vector_store(full_rebuild=True)
+t2 = time.perf_counter()
+print(json.dumps({
+    "pages": pages,
+    "chunks": len(ChunkStore(CHUNK_STORE_DIR)),
+    "ingest_s": t1 - t0,
+    "build_s": t2 - t1,
+}))
+"""
+
+_LOAD_PROBE = """
+import json, time
+t0 = time.perf_counter()
+from embedding_engine import get_embedding_engine
+get_embedding_engine()
+t1 = time.perf_counter()
+import vector_store
+t2 = time.perf_counter()
+db = vector_store.load_vector_store()
+t3 = time.perf_counter()
+print(json.dumps({
+    "model_load_s": t1 - t0,
+    "index_load_s": t3 - t2,
+    "num_vectors": db.index.ntotal,
+}))
+"""
+
+
+def bench_pipeline(workers: int = 0, load_runs: int = 3) -> dict:
+    tmp = tempfile.mkdtemp(prefix="rag-bench-")
+    env = {**os.environ, "RAG_ARTIFACTS_DIR": tmp}
+    try:
+        print(f"[benchmark] ingest + build into {tmp}")
+        build = run_probe(_PIPELINE_PROBE, workers, env=env)
+        loads = [run_probe(_LOAD_PROBE, env=env) for _ in range(load_runs)]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {
+        **build,
+        "pages_per_s": build["pages"] / build["ingest_s"],
+        "chunks_per_s": build["chunks"] / build["build_s"],
+        "model_load_s": statistics.median(r["model_load_s"] for r in loads),
+        "index_load_s": statistics.median(r["index_load_s"] for r in loads),
+    }
+    print(
+        f"[benchmark] {result['pages']} pages in {result['ingest_s']:.2f}s "
+        f"({result['pages_per_s']:.1f} pages/s), {result['chunks']} chunks built in "
+        f"{result['build_s']:.2f}s ({result['chunks_per_s']:.1f} chunks/s), "
+        f"index load {result['index_load_s'] * 1000:.1f} ms"
+    )
+    return result
+
+
+def synthetic_corpus(base: np.ndarray, n: int, seed: int = 0) -> np.ndarray:
+    """
+    n vectors scattered around the real ones, so larger corpora keep a
+    realistic distribution.
+    """
+    if n == len(base):
+        return base
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(base), size=n)
+    noise = rng.normal(0.0, 0.02, size=(n, base.shape[1]))
+    return (base[rows] + noise).astype(np.float32)
+
+
+def bench_search(sizes=(1_000, 10_000, 100_000), ks=(1, 3, 5, 10), num_queries: int = 200) -> dict:
+    base = load_corpus_vectors()
+    rows = []
+    for n in sizes:
+        vectors = synthetic_corpus(base, n)
+        index = make_index(vectors, FAISS_INDEX_TYPE)
+        index.add(vectors)
+        set_search_params(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        queries = sample_queries(vectors, num_queries, seed=1)
+        for k in ks:
+            timed_search(index, queries[:10], k)  # warm-up
+            _, lat = timed_search(index, queries, k)
+            start = time.perf_counter()
+            index.search(queries, k)
+            batch_s = time.perf_counter() - start
+            rows.append({
+                "corpus_size": n,
+                "k": k,
+                "qps": len(queries) / (sum(lat) / 1000),
+                "batch_qps": len(queries) / batch_s,
+                **latency_summary(lat),
+            })
+
+    # Full LangChain path on the saved store: embed + search + docstore
+    from vector_store import load_vector_store
+
+    db = load_vector_store()
+    questions = load_questions()
+    db.similarity_search(questions[0], k=1)  # warm-up
+    store_rows = []
+    for k in ks:
+        lat = []
+        for q in questions:
+            start = time.perf_counter()
+            db.similarity_search(q, k=k)
+            lat.append((time.perf_counter() - start) * 1000)
+        store_rows.append({"k": k, "qps": len(lat) / (sum(lat) / 1000), **latency_summary(lat)})
+
+    print(f"{'corpus':>9}{'k':>4}{'p50 ms':>10}{'p95 ms':>10}{'qps':>11}{'batch qps':>12}")
+    for r in rows:
+        print(
+            f"{r['corpus_size']:>9}{r['k']:>4}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+            f"{r['qps']:>11.0f}{r['batch_qps']:>12.0f}"
+        )
+    print(f"similarity_search on the saved store ({db.index.ntotal} vectors):")
+    for r in store_rows:
+        print(f"{'':>9}{r['k']:>4}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['qps']:>11.0f}")
+
+    return {"index_type": FAISS_INDEX_TYPE, "num_queries": num_queries, "index": rows, "store": store_rows}
+
+
+def bench_shards(size: int = 100_000, shard_counts=(1, 2, 4, 8), k: int = 5, num_queries: int = 200) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+    from sharded_index import Shard, ShardedIndex
+
+    vectors = synthetic_corpus(load_corpus_vectors(), size)
+    queries = sample_queries(vectors, num_queries, seed=1)
+    single = make_index(vectors, FAISS_INDEX_TYPE)
+    single.add(vectors)
+    set_search_params(single, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+    exact, _ = timed_search(single, queries, k)
+
+    def build(part):
+        index = make_index(part, FAISS_INDEX_TYPE)
+        index.add(part)
+        set_search_params(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        return index
+
+    rows = []
+    for n in shard_counts:
+        bounds = np.linspace(0, size, n + 1).astype(int)
+        parts = [vectors[bounds[i]:bounds[i + 1]] for i in range(n)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            indexes = list(pool.map(build, parts))
+        build_s = time.perf_counter() - start
+
+        sharded = ShardedIndex([Shard(i, f"part-{i}", "bench", index) for i, index in enumerate(indexes)])
+        timed_search(sharded, queries[:10], k)  # warm-up
+        found, lat = timed_search(sharded, queries, k)
+        # Global id (slot << 32 | row) -> row of the unsharded corpus
+        rows_found = np.where(found >= 0, bounds[found >> 32] + (found & 0xFFFFFFFF), -1)
+        rows.append({
+            "shards": n,
+            "build_s": build_s,
+            "qps": len(queries) / (sum(lat) / 1000),
+            "recall_vs_single": recall_at_k(rows_found, exact),
+            **latency_summary(lat),
+        })
+
+    print(f"{'shards':>7}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'qps':>10}{'recall':>9}")
+    for r in rows:
+        print(
+            f"{r['shards']:>7}{r['build_s']:>10.2f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+            f"{r['qps']:>10.0f}{r['recall_vs_single']:>9.3f}"
+        )
+    return {"index_type": FAISS_INDEX_TYPE, "corpus_size": size, "k": k, "results": rows}
+
+
+# (label, filter) from broad to narrow, over synthetic_metadata()
+FILTER_CASES = [
+    ("2020-2024", {"year": [2020, 2024]}),
+    ("2019", {"year": 2019}),
+    ("one paper", {"paper": "1905.00004"}),
+    ("paper+pages", {"paper": "1905.00004", "page": [0, 2]}),
+]
+
+
+def synthetic_metadata(n: int, num_papers: int = 50, seed: int = 0):
+    """
+    (source codes, sources, pages) for n rows: num_papers papers named like
+    arXiv ids over 2015-2024, of uneven length, 20 pages each.
+    """
+    rng = np.random.default_rng(seed)
+    sources = [f"{15 + i % 10:02d}05.{i:05d}.pdf" for i in range(num_papers)]
+    weights = rng.uniform(0.2, 1.8, size=num_papers)
+    codes = rng.choice(num_papers, size=n, p=weights / weights.sum()).astype(np.int32)
+    pages = rng.integers(0, 20, size=n).astype(np.int32)
+    return codes, sources, pages
+
+
+def _per_query(search, queries: np.ndarray, k: int):
+    """
+    Like timed_search() for any search(query, k) -> rows.
+    """
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    latencies = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        found = search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i, :len(found)] = found
+    return ids, latencies
+
+
+def bench_filter(size: int = 100_000, index_types=("flat", "ivf_flat", "hnsw"), k: int = 5,
+                 num_queries: int = 200, fetch_ks=(20, 100)) -> dict:
+    from metadata_filter import FilterIndex, count, filtered_search, normalize_filters
+
+    vectors = synthetic_corpus(load_corpus_vectors(), size)
+    queries = sample_queries(vectors, num_queries, seed=1)
+    filters = FilterIndex.from_columns(*synthetic_metadata(size))
+    flat = make_index(vectors, "flat")
+    flat.add(vectors)
+
+    cases = []
+    for label, spec in FILTER_CASES:
+        spec = normalize_filters(spec)
+        bitmap = filters.bitmap(spec)
+        matches = count(bitmap)
+        exact = np.full((len(queries), k), -1, dtype=np.int64)
+        _, found = filtered_search(flat, queries, k, bitmap, matches)
+        exact[:, :found.shape[1]] = found
+        cases.append((label, spec, bitmap, filters.mask(spec), matches, exact))
+    print(f"[benchmark] {size} vectors, {len(queries)} queries, k={k}")
+
+    rows = []
+    for index_type in index_types:
+        index = make_index(vectors, index_type)
+        index.add(vectors)
+        set_search_params(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        timed_search(index, queries[:10], k)  # warm-up
+        _, lat = timed_search(index, queries, k)
+        rows.append({"index_type": index_type, "filter": "none", "method": "unfiltered",
+                     "selectivity": 1.0, "recall": None, "returned": float(k), **latency_summary(lat)})
+
+        for label, spec, bitmap, mask, matches, exact in cases:
+            wanted = np.minimum(k, matches)
+            methods = [("prefilter", lambda q, n: [r for r in filtered_search(index, q, n, bitmap, matches)[1][0] if r >= 0])]
+            for fetch_k in fetch_ks:
+                def post(q, n, fetch_k=fetch_k):
+                    _, found = index.search(q, fetch_k)
+                    return [r for r in found[0] if r >= 0 and mask[r]][:n]
+                methods.append((f"post fetch_k={fetch_k}", post))
+            for method, search in methods:
+                _per_query(search, queries[:10], k)  # warm-up
+                found, lat = _per_query(search, queries, k)
+                hits = sum(len(set(f[f >= 0]) & set(e[e >= 0])) for f, e in zip(found, exact))
+                rows.append({
+                    "index_type": index_type,
+                    "filter": label,
+                    "method": method,
+                    "selectivity": matches / size,
+                    "recall": hits / max(1, wanted * len(queries)),
+                    "returned": float((found >= 0).sum(axis=1).mean()),
+                    **latency_summary(lat),
+                })
+
+    print(f"{'index':<10}{'filter':<13}{'rows %':>8}  {'method':<20}{'recall@' + str(k):>10}{'returned':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in rows:
+        recall = f"{r['recall']:.3f}" if r["recall"] is not None else "-"
+        print(
+            f"{r['index_type']:<10}{r['filter']:<13}{r['selectivity'] * 100:>8.2f}  {r['method']:<20}"
+            f"{recall:>10}{r['returned']:>10.2f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+        )
+    return {"corpus_size": size, "k": k, "num_queries": len(queries), "results": rows}
+
+
+def near_copies(docs, fraction: float, noise: float, seed: int = 0) -> list:
+    """
+    Copies of a random fraction of docs with a share `noise` of their words
+    replaced by other corpus words; chunk ids get a "-copy" suffix.
+    """
+    from langchain_core.documents import Document
+
+    rng = np.random.default_rng(seed)
+    vocab = [w for d in docs for w in d.page_content.split()]
+    rows = rng.choice(len(docs), size=int(len(docs) * fraction), replace=False)
+    copies = []
+    for i in sorted(rows):
+        words = docs[i].page_content.split()
+        for j in np.flatnonzero(rng.random(len(words)) < noise):
+            words[j] = vocab[rng.integers(len(vocab))]
+        metadata = {**docs[i].metadata, "chunk_id": docs[i].metadata["chunk_id"] + "-copy"}
+        copies.append(Document(page_content=" ".join(words), metadata=metadata))
+    return copies
+
+
+def bench_dedup(copies: float = 0.2, noise: float = 0.02, threshold: float = None) -> dict:
+    from chunk_store import ChunkStore
+    from config import CHUNK_STORE_DIR, DEDUP_THRESHOLD
+    from dedup import Deduplicator, deduplicate
+    from embedding_engine import EmbeddingEngine
+
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    store = ChunkStore(CHUNK_STORE_DIR)
+    originals = list(store.iter_documents())
+    store.close()
+    extra = near_copies(originals, copies, noise)
+    docs = originals + extra
+    print(f"[benchmark] {len(originals)} chunks + {len(extra)} near-copies ({noise:.0%} of words changed)")
+
+    start = time.perf_counter()
+    kept, dropped = deduplicate(docs, Deduplicator(threshold=threshold))
+    dedup_s = time.perf_counter() - start
+    caught = sum(cid.endswith("-copy") for cid in dropped)
+
+    embeddings = EmbeddingEngine(EMBEDDING_MODEL_NAME, cache_path=None)
+    embeddings.embed_array([d.page_content for d in docs[:32]])  # warm-up
+    builds = {}
+    for label, chunks in (("without dedup", docs), ("with dedup", kept)):
+        start = time.perf_counter()
+        vectors = embeddings.embed_array([d.page_content for d in chunks])
+        index = make_index(vectors, FAISS_INDEX_TYPE)
+        index.add(vectors)
+        builds[label] = {
+            "chunks": len(chunks),
+            "build_s": time.perf_counter() - start,
+            "size_bytes": index_size_bytes(index),
+        }
+
+    result = {
+        "threshold": threshold,
+        "chunks": len(docs),
+        "near_copies": len(extra),
+        "dropped": len(dropped),
+        "copies_caught": caught,
+        "originals_dropped": len(dropped) - caught,
+        "dedup_s": dedup_s,
+        "builds": builds,
+    }
+    full, deduped = builds["without dedup"], builds["with dedup"]
+    print(
+        f"[benchmark] threshold {threshold}: dropped {len(dropped)} of {len(docs)} chunks in {dedup_s:.2f}s "
+        f"({caught}/{len(extra)} copies caught, {len(dropped) - caught} originals dropped)"
+    )
+    print(f"{'':<15}{'chunks':>8}{'build s':>10}{'index KiB':>11}")
+    for label, b in builds.items():
+        print(f"{label:<15}{b['chunks']:>8}{b['build_s']:>10.2f}{b['size_bytes'] / 1024:>11.0f}")
+    print(
+        f"saved          {full['chunks'] - deduped['chunks']:>8}{full['build_s'] - deduped['build_s']:>10.2f}"
+        f"{(full['size_bytes'] - deduped['size_bytes']) / 1024:>11.0f}"
+    )
+    return result
+
+
+def bench_precision(size: int = 100_000, index_types=("flat", "hnsw"), k: int = 5,
+                    num_queries: int = 200, factor: int = None, load_runs: int = 5) -> dict:
+    from config import RESCORE_FACTOR
+
+    factor = factor or RESCORE_FACTOR
+    vectors = synthetic_corpus(load_corpus_vectors(), size)
+    queries = sample_queries(vectors, num_queries, seed=1)
+    exact = make_index(vectors, "flat", precision="float32")
+    exact.add(vectors)
+    truth, _ = timed_search(exact, queries, k)
+    print(f"[benchmark] {size} vectors, {len(queries)} queries, k={k}, rescoring {factor} * k")
+
+    tmp = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    rows = []
+    try:
+        save_vectors(vectors, tmp / "vectors.npy")
+        float32 = np.load(tmp / "vectors.npy", mmap_mode="r")
+        for index_type in index_types:
+            for precision in ("float32", "float16", "int8"):
+                start = time.perf_counter()
+                index = make_index(vectors, index_type, precision=precision)
+                index.add(vectors)
+                build_s = time.perf_counter() - start
+                path = tmp / f"{index_type}-{precision}.faiss"
+                faiss.write_index(index, str(path))
+                del index
+
+                loads = []
+                for _ in range(load_runs):
+                    start = time.perf_counter()
+                    index = faiss.read_index(str(path))
+                    loads.append(time.perf_counter() - start)
+                set_search_params(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+
+                variants = [("-", index)]
+                if precision != "float32":
+                    variants.append((f"{factor}k", RescoredIndex(index, float32, factor)))
+                for rescore, searchable in variants:
+                    timed_search(searchable, queries[:10], k)  # warm-up
+                    found, lat = timed_search(searchable, queries, k)
+                    rows.append({
+                        "index_type": index_type,
+                        "precision": precision,
+                        "rescore": rescore,
+                        "size_bytes": path.stat().st_size,
+                        "load_ms": statistics.median(loads) * 1000,
+                        "build_s": build_s,
+                        "recall": recall_at_k(found, truth),
+                        **latency_summary(lat),
+                    })
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{'index':<9}{'precision':<10}{'rescore':>8}{'size MiB':>10}{'load ms':>9}{'recall@' + str(k):>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for r in rows:
+        print(
+            f"{r['index_type']:<9}{r['precision']:<10}{r['rescore']:>8}{r['size_bytes'] / 2 ** 20:>10.1f}"
+            f"{r['load_ms']:>9.1f}{r['recall']:>10.3f}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}"
+        )
+    print(f"(rescoring reads from a {vectors.nbytes / 2 ** 20:.1f} MiB memory-mapped float32 file)")
+    return {"corpus_size": size, "k": k, "rescore_factor": factor, "results": rows}
+
+
+def bench_e2e(num_requests: int = 50, llm_latency: float = 0.0) -> dict:
+    from chatbot import RAGBot, clear_caches, warm_up
+    from fakes import FakeLLM
+
+    questions = load_questions()
+    queries = [questions[i % len(questions)] for i in range(num_requests)]
+    warm_up()
+    bot = RAGBot(llm=FakeLLM(latency=llm_latency))
+
+    def run(clear: bool) -> dict:
+        latencies = []
+        start = time.perf_counter()
+        for i, q in enumerate(queries):
+            if clear:
+                clear_caches()
+            t = time.perf_counter()
+            bot.ask(q, session_id=f"e2e-{i}")
+            latencies.append((time.perf_counter() - t) * 1000)
+            bot.end_session(f"e2e-{i}")
+        return {"req_per_s": len(queries) / (time.perf_counter() - start), **latency_summary(latencies)}
+
+    result = {"llm_latency_s": llm_latency, "requests": num_requests, "uncached": run(True), "cached": run(False)}
+    for name in ("uncached", "cached"):
+        r = result[name]
+        print(f"[benchmark] ask {name}: p50 {r['p50_ms']:.2f} ms, p95 {r['p95_ms']:.2f} ms, {r['req_per_s']:.1f} req/s")
+    return result
+
+
+def bench_retrieval(k: int = 3, repeats: int = 5, rerank: bool = False) -> dict:
+    import chatbot
+    from fakes import FakeLLM
+
+    questions = load_questions()
+    chatbot.warm_up()
+    if getattr(chatbot.get_vector_store(), "bm25", None) is None:
+        raise SystemExit("[benchmark] No BM25 index; rebuild with `python vector_store.py`.")
+    for q in questions:
+        chatbot.embed_query(q)  # keep embedding out of the comparison
+
+    configs = [("dense", "dense", False), ("hybrid", "hybrid", False)]
+    if rerank:
+        configs.append(("rerank", "dense", True))
+
+    results = {}
+    for name, mode, use_reranker in configs:
+        bot = chatbot.RAGBot(llm=FakeLLM(), retrieval_mode=mode, rerank=use_reranker)
+        if use_reranker:
+            bot.reranker.model  # load outside the timed loop
+        latencies = []
+        for _ in range(repeats):
+            for q in questions:
+                chatbot.clear_caches(embeddings=False)
+                if use_reranker:
+                    bot.reranker.cache.clear()
+                start = time.perf_counter()
+                bot.retrieve(q, k=k)
+                latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = latency_summary(latencies)
+        if use_reranker:
+            results[name]["fallbacks"] = bot.reranker.fallbacks
+
+    ratio = results["hybrid"]["p50_ms"] / results["dense"]["p50_ms"]
+    print(f"{'mode':<8}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}")
+    print(f"[benchmark] hybrid / dense p50: {ratio:.2f}x")
+    return {"k": k, **results, "hybrid_over_dense_p50": ratio}
+
+
+def bench_ollama(num_requests: int = 50, llm_latency: float = 0.0) -> dict:
+    from langchain_community.llms import Ollama
+    from fakes import FakeOllamaServer
+    from ollama_client import OllamaClient
+
+    prompt = "User: What is multi-head attention?\nAssistant:"
+    results = {}
+    with FakeOllamaServer(latency=llm_latency, model=OLLAMA_MODEL_NAME) as server:
+        langchain_llm = Ollama(base_url=server.url, model=OLLAMA_MODEL_NAME)
+        client = OllamaClient(base_url=server.url)
+        calls = {
+            "langchain": langchain_llm.invoke,
+            "langchain_stream": lambda p: "".join(langchain_llm.stream(p)),
+            "pooled": client.generate,
+            "pooled_stream": lambda p: "".join(client.stream(p)),
+        }
+        for name, call in calls.items():
+            call(prompt)  # warm up
+            before = server.connections
+            latencies = []
+            for _ in range(num_requests):
+                start = time.perf_counter()
+                call(prompt)
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[name] = {"connections": server.connections - before, **latency_summary(latencies)}
+
+    with FakeOllamaServer(fail_first=2, model=OLLAMA_MODEL_NAME) as server:
+        client = OllamaClient(base_url=server.url, backoff_s=0.05)
+        start = time.perf_counter()
+        client.generate(prompt)
+        results["retry"] = {"attempts": len(server.bodies), "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+    print(f"{'client':<18}{'p50 ms':>10}{'p95 ms':>10}{'connections':>13}")
+    for name in calls:
+        r = results[name]
+        print(f"{name:<18}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['connections']:>13}")
+    print(f"[benchmark] retry: ok after {results['retry']['attempts']} attempts")
+    return {"requests": num_requests, "llm_latency_s": llm_latency, **results}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _worker_metrics(url: str, workers: int, timeout: float = 180.0) -> dict:
+    """
+    /metrics of every worker, once all of them report ready. Each poll uses
+    a new connection, which any worker may accept.
+    """
+    import requests
+
+    seen = {}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            report = requests.get(f"{url}/metrics", headers={"Connection": "close"}, timeout=5).json()
+            seen[report["worker"]] = report
+        except requests.RequestException:
+            pass
+        if len(seen) >= workers and all(r["ready"] for r in seen.values()):
+            return seen
+        time.sleep(0.05)
+    raise RuntimeError(f"only {sum(r['ready'] for r in seen.values())} of {workers} workers ready at {url}")
+
+
+async def _load_test(url: str, queries: list, concurrency: int, num_requests: int) -> dict:
+    """
+    concurrency sessions, each sending its next question as soon as the
+    previous answer arrives, until num_requests have been sent.
+    """
+    import aiohttp
+
+    latencies, per_worker, errors = [], {}, []
+    sent = 0
+    sessions = [f"bench-{uuid.uuid4().hex[:12]}" for _ in range(concurrency)]
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as http:
+        async def user(session_id):
+            nonlocal sent
+            while sent < num_requests:
+                query = queries[sent % len(queries)]
+                sent += 1
+                start = time.perf_counter()
+                async with http.post(f"{url}/ask", json={"query": query, "session_id": session_id}) as response:
+                    body = await response.json()
+                if response.status != 200:
+                    errors.append(body.get("error", response.status))
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+                per_worker[body["worker"]] = per_worker.get(body["worker"], 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(s) for s in sessions))
+        elapsed = time.perf_counter() - start
+        for session_id in sessions:
+            async with http.delete(f"{url}/sessions/{session_id}"):
+                pass
+    return {
+        "qps": len(latencies) / elapsed,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "requests_per_worker": per_worker,
+        **latency_summary(latencies),
+    }
+
+
+def bench_serve(worker_counts=(1, 2), concurrency: int = 8, num_requests: int = 200,
+                llm_latency: float = 0.05, mmap: bool = True, url=None) -> dict:
+    from fakes import FakeOllamaServer
+
+    queries = load_questions()
+    results = []
+
+    def run(url, workers):
+        idle = _worker_metrics(url, workers)
+        asyncio.run(_load_test(url, queries, concurrency, concurrency))  # warm up
+        load = asyncio.run(_load_test(url, queries, concurrency, num_requests))
+        after = _worker_metrics(url, workers)
+        memory = {
+            w: {"idle": idle[w]["memory_mb"], "loaded": after[w]["memory_mb"], "index_mmap": after[w]["index"]["mmap"]}
+            for w in sorted(after)
+        }
+        results.append({"workers": workers, **load, "memory_mb": memory})
+
+    if url:
+        run(url.rstrip("/"), worker_counts[0])
+    else:
+        with FakeOllamaServer(latency=llm_latency, model=OLLAMA_MODEL_NAME) as fake:
+            env = {**os.environ, "OLLAMA_BASE_URL": fake.url}
+            for workers in worker_counts:
+                port = _free_port()
+                cmd = [sys.executable, str(HERE / "server.py"), "--port", str(port), "--workers", str(workers)]
+                if not mmap:
+                    cmd.append("--no-mmap")
+                server = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL)
+                try:
+                    run(f"http://127.0.0.1:{port}", workers)
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+
+    print(f"{'workers':<9}{'QPS':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    for r in results:
+        print(f"{r['workers']:<9}{r['qps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['errors']:>8}")
+    print(f"\n{'workers':<9}{'worker':<8}{'requests':>9}{'RSS MB':>9}{'PSS MB':>9}{'index MB':>10}")
+    for r in results:
+        for w, m in r["memory_mb"].items():
+            loaded = m["loaded"]
+            print(f"{r['workers']:<9}{w:<8}{r['requests_per_worker'].get(w, 0):>9}"
+                  f"{loaded.get('rss', 0):>9.1f}{loaded.get('pss', 0):>9.1f}{loaded.get('index', 0):>10.1f}")
+        total = sum(m["loaded"].get("pss", 0) for m in r["memory_mb"].values())
+        print(f"{r['workers']:<9}{'total':<8}{'':>9}{'':>9}{total:>9.1f}")
+    if results and results[0]["first_error"]:
+        print(f"[benchmark] first error: {results[0]['first_error']}")
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "llm_latency_s": llm_latency,
+        "mmap": mmap,
+        "runs": results,
+    }
+
+
+def bench_download(num_files: int = 5, size_mb: float = 2.0, bandwidth_mb: float = 4.0, workers: int = 4) -> dict:
+    from downloader import Downloader
+    from fakes import FakeFileServer
+
+    rng = np.random.default_rng(0)
+    size = int(size_mb * 1e6)
+    files = {f"paper{i}.pdf": b"%PDF-1.5\n" + rng.bytes(size) for i in range(num_files)}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, FakeFileServer(files, latency=0.05, bandwidth=bandwidth_mb * 1e6) as server:
+        tmp = Path(tmp)
+        for n in sorted({1, workers}):
+            out = tmp / f"w{n}"
+            out.mkdir()
+            items = [(f"{server.url}/{name}", out / name) for name in files]
+            downloader = Downloader(workers=n, manifest_path=out / "downloads.json", expected_sha256={})
+            before = server.connections
+            start = time.perf_counter()
+            downloader.download_all(items)
+            elapsed = time.perf_counter() - start
+            assert all((out / name).read_bytes() == data for name, data in files.items())
+            results[f"workers_{n}"] = {
+                "seconds": elapsed,
+                "mb_per_s": num_files * size / 1e6 / elapsed,
+                "connections": server.connections - before,
+            }
+
+            requests_before = len(server.requests)
+            start = time.perf_counter()
+            Downloader(workers=n, manifest_path=out / "downloads.json", expected_sha256={}).download_all(items)
+            results[f"workers_{n}"]["verify_ms"] = (time.perf_counter() - start) * 1000
+            results[f"workers_{n}"]["verify_requests"] = len(server.requests) - requests_before
+
+    name = next(iter(files))
+    with tempfile.TemporaryDirectory() as tmp, FakeFileServer(files, truncate={name: size // 2}) as server:
+        path = Path(tmp) / name
+        status = Downloader(manifest_path=Path(tmp) / "downloads.json", expected_sha256={}, backoff_s=0.0).download(
+            f"{server.url}/{name}", path
+        )
+        results["resume"] = {
+            "status": status,
+            "intact": path.read_bytes() == files[name],
+            "requests": [r[2] or "full" for r in server.requests],
+            "overhead_bytes": server.bytes_sent - len(files[name]),
+        }
+
+    print(f"{'workers':<10}{'seconds':>10}{'MB/s':>10}{'connections':>13}{'verify ms':>11}")
+    for n in sorted({1, workers}):
+        r = results[f"workers_{n}"]
+        print(f"{n:<10}{r['seconds']:>10.2f}{r['mb_per_s']:>10.1f}{r['connections']:>13}{r['verify_ms']:>11.1f}")
+    r = results["resume"]
+    print(f"[benchmark] cut at {size // 2} bytes: {r['status']} via {r['requests']}, "
+          f"intact={r['intact']}, {r['overhead_bytes']} bytes sent twice")
+    return {"files": num_files, "size_mb": size_mb, "bandwidth_mb_per_s": bandwidth_mb, **results}
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "faiss": faiss.__version__,
+        "config": {
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "index_type": FAISS_INDEX_TYPE,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+        },
+    }
+
+
+def headline(results: dict) -> dict:
+    """
+    Flat {metric: {"value", "higher_is_better"}} view used for comparisons.
+    """
+    out = {}
+
+    def put(name, value, higher_is_better):
+        out[name] = {"value": value, "higher_is_better": higher_is_better}
+
+    if "pipeline" in results:
+        p = results["pipeline"]
+        put("pipeline.pages_per_s", p["pages_per_s"], True)
+        put("pipeline.chunks_per_s", p["chunks_per_s"], True)
+        put("pipeline.index_load_s", p["index_load_s"], False)
+    if "search" in results:
+        for r in results["search"]["index"]:
+            put(f"search.n{r['corpus_size']}.k{r['k']}.p50_ms", r["p50_ms"], False)
+            put(f"search.n{r['corpus_size']}.k{r['k']}.qps", r["qps"], True)
+        for r in results["search"]["store"]:
+            put(f"similarity_search.k{r['k']}.p50_ms", r["p50_ms"], False)
+    if "e2e" in results:
+        for name in ("uncached", "cached"):
+            put(f"e2e.{name}.p50_ms", results["e2e"][name]["p50_ms"], False)
+            put(f"e2e.{name}.req_per_s", results["e2e"][name]["req_per_s"], True)
+    return out
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Prints old vs. new headline metrics; returns the names of those that got
+    worse by more than threshold (a fraction).
+    """
+    regressions = []
+    print(f"{'metric':<36}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, cur in current["headline"].items():
+        old = baseline.get("headline", {}).get(name)
+        if old is None or not old["value"]:
+            continue
+        change = (cur["value"] - old["value"]) / old["value"]
+        worse = -change if cur["higher_is_better"] else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}{old['value']:>12.3f}{cur['value']:>12.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def bench_suite(workers: int = 0, skip_pipeline: bool = False, baseline_path=None, threshold: float = 0.2) -> dict:
+    results = {}
+    if not skip_pipeline:
+        results["pipeline"] = bench_pipeline(workers=workers)
+    results["search"] = bench_search()
+    results["e2e"] = bench_e2e()
+    report = {"meta": run_metadata(), "results": results, "headline": headline(results)}
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"[benchmark] Against {baseline_path} ({baseline['meta'].get('git_commit')}):")
+        report["regressions"] = compare(baseline, report, threshold)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RAG pipeline benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_index = sub.add_parser("index", help="ANN index recall vs. latency against the flat index")
+    p_index.add_argument("--k", type=int, default=5)
+    p_index.add_argument("--queries", type=int, default=200)
+    p_index.add_argument("--json", help="also write results to this JSON file")
+
+    p_startup = sub.add_parser("startup", help="cold-start import / load / first-query latency")
+    p_startup.add_argument("--runs", type=int, default=3)
+    p_startup.add_argument("--check", action="store_true", help="exit 1 if any stage is over budget")
+    p_startup.add_argument("--json", help="also write results to this JSON file")
+
+    p_tput = sub.add_parser("throughput", help="async RAGBot requests/sec at several concurrency limits")
+    p_tput.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    p_tput.add_argument("--requests", type=int, default=32)
+    p_tput.add_argument("--llm-latency", type=float, default=0.5, help="seconds per fake LLM call")
+    p_tput.add_argument("--json", help="also write results to this JSON file")
+
+    p_pipe = sub.add_parser("pipeline", help="ingest pages/s, build chunks/s and load time (temporary artifacts)")
+    p_pipe.add_argument("--workers", type=int, default=0, help="ingest process pool size (0 = all CPUs)")
+    p_pipe.add_argument("--json", help="also write results to this JSON file")
+
+    p_search = sub.add_parser("search", help="search latency / QPS by k and corpus size")
+    p_search.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    p_search.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    p_search.add_argument("--queries", type=int, default=200)
+    p_search.add_argument("--json", help="also write results to this JSON file")
+
+    p_e2e = sub.add_parser("e2e", help="RAGBot.ask latency with a fake LLM")
+    p_e2e.add_argument("--requests", type=int, default=50)
+    p_e2e.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    p_e2e.add_argument("--json", help="also write results to this JSON file")
+
+    p_retr = sub.add_parser("retrieval", help="dense vs. hybrid (FAISS + BM25) retrieval latency")
+    p_retr.add_argument("--k", type=int, default=3)
+    p_retr.add_argument("--repeats", type=int, default=5)
+    p_retr.add_argument("--rerank", action="store_true", help="also time cross-encoder reranking")
+    p_retr.add_argument("--json", help="also write results to this JSON file")
+
+    p_ollama = sub.add_parser("ollama", help="pooled Ollama client vs. LangChain's wrapper (fake server)")
+    p_ollama.add_argument("--requests", type=int, default=50)
+    p_ollama.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake generation")
+    p_ollama.add_argument("--json", help="also write results to this JSON file")
+
+    p_shards = sub.add_parser("shards", help="sharded build time, fan-out search latency and recall")
+    p_shards.add_argument("--size", type=int, default=100_000)
+    p_shards.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    p_shards.add_argument("--k", type=int, default=5)
+    p_shards.add_argument("--queries", type=int, default=200)
+    p_shards.add_argument("--json", help="also write results to this JSON file")
+
+    p_serve = sub.add_parser("serve", help="load test of the multi-worker HTTP server (fake Ollama)")
+    p_serve.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    p_serve.add_argument("--concurrency", type=int, default=8, help="sessions asking at once")
+    p_serve.add_argument("--requests", type=int, default=200)
+    p_serve.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake generation")
+    p_serve.add_argument("--no-mmap", action="store_true", help="private index copy per worker")
+    p_serve.add_argument("--url", help="load-test this running server (--workers gives its worker count)")
+    p_serve.add_argument("--json", help="also write results to this JSON file")
+
+    p_dl = sub.add_parser("download", help="serial vs. parallel PDF downloads and resume (fake file server)")
+    p_dl.add_argument("--files", type=int, default=5)
+    p_dl.add_argument("--size-mb", type=float, default=2.0)
+    p_dl.add_argument("--bandwidth-mb", type=float, default=4.0, help="MB/s per response")
+    p_dl.add_argument("--workers", type=int, default=4)
+    p_dl.add_argument("--json", help="also write results to this JSON file")
+
+    p_filter = sub.add_parser("filter", help="metadata-filtered search: bitmap prefilter vs. post-filtering")
+    p_filter.add_argument("--size", type=int, default=100_000)
+    p_filter.add_argument("--index-types", nargs="+", default=["flat", "ivf_flat", "hnsw"])
+    p_filter.add_argument("--k", type=int, default=5)
+    p_filter.add_argument("--queries", type=int, default=200)
+    p_filter.add_argument("--fetch-k", type=int, nargs="+", default=[20, 100], help="post-filtering fetch sizes")
+    p_filter.add_argument("--json", help="also write results to this JSON file")
+
+    p_dedup = sub.add_parser("dedup", help="near-duplicate removal: chunks dropped, build time and index size saved")
+    p_dedup.add_argument("--copies", type=float, default=0.2, help="near-copies added, as a fraction of the chunks")
+    p_dedup.add_argument("--noise", type=float, default=0.02, help="share of words changed in each copy")
+    p_dedup.add_argument("--threshold", type=float, help="override DEDUP_THRESHOLD")
+    p_dedup.add_argument("--json", help="also write results to this JSON file")
+
+    p_prec = sub.add_parser("precision", help="float32 / float16 / int8 vectors: size, load time, recall, rescoring")
+    p_prec.add_argument("--size", type=int, default=100_000)
+    p_prec.add_argument("--index-types", nargs="+", default=["flat", "hnsw"])
+    p_prec.add_argument("--k", type=int, default=5)
+    p_prec.add_argument("--queries", type=int, default=200)
+    p_prec.add_argument("--rescore-factor", type=int, help="override RESCORE_FACTOR")
+    p_prec.add_argument("--json", help="also write results to this JSON file")
+
+    p_suite = sub.add_parser("suite", help="pipeline + search + e2e with run metadata, for comparing commits")
+    p_suite.add_argument("--workers", type=int, default=0)
+    p_suite.add_argument("--skip-pipeline", action="store_true", help="skip the (slow) ingest + build run")
+    p_suite.add_argument("--baseline", help="earlier suite JSON to compare against")
+    p_suite.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, as a fraction")
+    p_suite.add_argument("--json", help="also write results to this JSON file")
+
+    p_cmp = sub.add_parser("compare", help="compare two suite JSON files")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, as a fraction")
+    p_cmp.add_argument("--json", help="also write the comparison to this JSON file")
+
+    args = parser.parse_args()
+    if args.command == "index":
+        report = bench_index(k=args.k, num_queries=args.queries)
+    elif args.command == "startup":
+        report = bench_startup(runs=args.runs)
+    elif args.command == "throughput":
+        report = bench_throughput(args.concurrency, num_requests=args.requests, llm_latency=args.llm_latency)
+    elif args.command == "pipeline":
+        report = bench_pipeline(workers=args.workers)
+    elif args.command == "search":
+        report = bench_search(args.sizes, args.k, num_queries=args.queries)
+    elif args.command == "e2e":
+        report = bench_e2e(num_requests=args.requests, llm_latency=args.llm_latency)
+    elif args.command == "retrieval":
+        report = bench_retrieval(k=args.k, repeats=args.repeats, rerank=args.rerank)
+    elif args.command == "ollama":
+        report = bench_ollama(num_requests=args.requests, llm_latency=args.llm_latency)
+    elif args.command == "shards":
+        report = bench_shards(size=args.size, shard_counts=args.shards, k=args.k, num_queries=args.queries)
+    elif args.command == "serve":
+        report = bench_serve(
+            args.workers,
+            concurrency=args.concurrency,
+            num_requests=args.requests,
+            llm_latency=args.llm_latency,
+            mmap=not args.no_mmap,
+            url=args.url,
+        )
+    elif args.command == "download":
+        report = bench_download(args.files, args.size_mb, args.bandwidth_mb, args.workers)
+    elif args.command == "filter":
+        report = bench_filter(args.size, args.index_types, k=args.k, num_queries=args.queries, fetch_ks=args.fetch_k)
+    elif args.command == "dedup":
+        report = bench_dedup(args.copies, args.noise, args.threshold)
+    elif args.command == "precision":
+        report = bench_precision(args.size, args.index_types, k=args.k, num_queries=args.queries, factor=args.rescore_factor)
+    elif args.command == "suite":
+        report = bench_suite(
+            workers=args.workers,
+            skip_pipeline=args.skip_pipeline,
+            baseline_path=args.baseline,
+            threshold=args.threshold,
+        )
+    elif args.command == "compare":
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, "r", encoding="utf-8") as f:
+            current = json.load(f)
+        report = {"regressions": compare(baseline, current, args.threshold)}
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[benchmark] Saved results to {args.json}")
+
+    if getattr(args, "check", False) and report.get("over_budget"):
+        sys.exit(1)
+    if report.get("regressions"):
+        print(f"[benchmark] {len(report['regressions'])} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
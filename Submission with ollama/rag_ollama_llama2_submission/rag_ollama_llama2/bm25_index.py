@@ -0,0 +1,157 @@
+"""
+bm25_index.py
+--------------
+Sparse lexical index over the indexed chunks, for exact-term queries that
+dense search misses (paper IDs, acronyms such as "RoBERTa", equation names).
+
+Document d is FAISS row d. Postings are stored CSR-style as flat arrays:
+
+    offsets.npy   int64[V + 1]   postings of term t are [offsets[t], offsets[t+1])
+    doc_ids.npy   int32[P]       row numbers, ascending within a term
+    tfs.npy       float32[P]     term frequency in that row
+    doc_len.npy   int32[N]       tokens per row
+    vocab.json                   terms in id order
+    meta.json                    num_docs, avgdl, k1, b
+
+Arrays are memory-mapped on load. search() gathers the postings of the
+query terms and scores them with numpy in one pass: no Python loop over
+documents.
+"""
+
+import json
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    """
+    Lower-cased alphanumeric tokens; "1706.03762" and "gpt-3" stay whole.
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, vocab: dict, offsets, doc_ids, tfs, doc_len, k1: float, b: float):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(doc_len)
+        self.avgdl = float(np.mean(doc_len)) if len(doc_len) else 0.0
+        # Per-row length normalisation, k1 * (1 - b + b * dl / avgdl)
+        self._norm = (
+            k1 * (1 - b + b * np.asarray(doc_len, dtype=np.float32) / self.avgdl)
+            if self.avgdl else np.full(self.num_docs, k1, dtype=np.float32)
+        ).astype(np.float32)
+        df = np.diff(np.asarray(offsets)).astype(np.float32)
+        self._idf = np.log(1 + (self.num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    @classmethod
+    def build(cls, texts, k1: float, b: float) -> "BM25Index":
+        vocab = {}
+        terms, docs, freqs, doc_len = [], [], [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                docs.append(row)
+                freqs.append(tf)
+
+        terms = np.asarray(terms, dtype=np.int64)
+        # Stable sort keeps rows ascending within each term
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=offsets[1:])
+        return cls(
+            vocab,
+            offsets,
+            np.asarray(docs, dtype=np.int32)[order],
+            np.asarray(freqs, dtype=np.float32)[order],
+            np.asarray(doc_len, dtype=np.int32),
+            k1,
+            b,
+        )
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "offsets.npy", np.asarray(self.offsets))
+        np.save(path / "doc_ids.npy", np.asarray(self.doc_ids))
+        np.save(path / "tfs.npy", np.asarray(self.tfs))
+        np.save(path / "doc_len.npy", np.asarray(self.doc_len))
+        terms = sorted(self.vocab, key=self.vocab.get)
+        (path / "vocab.json").write_text(json.dumps(terms), encoding="utf-8")
+        meta = {"num_docs": self.num_docs, "avgdl": self.avgdl, "k1": self.k1, "b": self.b}
+        (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @staticmethod
+    def exists(path) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    @classmethod
+    def load(cls, path) -> "BM25Index":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        terms = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        return cls(
+            {t: i for i, t in enumerate(terms)},
+            np.load(path / "offsets.npy", mmap_mode="r"),
+            np.load(path / "doc_ids.npy", mmap_mode="r"),
+            np.load(path / "tfs.npy", mmap_mode="r"),
+            np.load(path / "doc_len.npy", mmap_mode="r"),
+            meta["k1"],
+            meta["b"],
+        )
+
+    def search(self, query: str, k: int, allowed: np.ndarray = None):
+        """
+        (rows, scores) of the top-k rows by BM25, best first. Rows without
+        any query term are never returned, nor rows that are False in the
+        optional bool[rows] mask `allowed`.
+        """
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        spans = [(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s:e] for s, e in spans])
+        tfs = np.concatenate([self.tfs[s:e] for s, e in spans])
+        idf = np.repeat(self._idf[term_ids], [e - s for s, e in spans])
+
+        partial = idf * tfs * (self.k1 + 1) / (tfs + self._norm[docs])
+        rows, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=partial).astype(np.float32)
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, scores = rows[keep], scores[keep]
+
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top].astype(np.int64), scores[top]
+
+
+def reciprocal_rank_fusion(rankings, k: int, rrf_k: int = 60) -> list:
+    """
+    Fuses ranked lists of row ids: score(row) = sum 1 / (rrf_k + rank).
+    Returns the top-k rows; ties keep first-seen order.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda row: -scores[row])[:k]
@@ -1,23 +1,309 @@
-from langchain_community.llms import Ollama
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from vector_store import load_vector_store
+"""
+chatbot.py
+-----------
+RAGBot: FAISS retrieval + LLaMA 2 (via Ollama) with conversational memory.
+
+Startup is kept cheap: LangChain is imported when the first RAGBot is built,
+and the embedding model and FAISS index are loaded on first use, once per
+process, and shared by every RAGBot. RAGBot(warmup=True) loads them in a
+background thread straight away, and asks Ollama to load the model.
+
+Generation goes through one pooled, keep-alive Ollama client per process,
+configured from config.py (ollama_client.py).
+
+Query embeddings and top-k results are kept in process-wide LRU caches
+(see query_cache.py). Result keys include the index version, so a rebuilt
+index never serves stale hits; cache_stats() reports hits and misses.
+
+With SEMANTIC_CACHE_ENABLED, ask() first looks for a stored answer to a
+near-duplicate question over the same context chunks (semantic_cache.py)
+and only calls the LLM on a miss.
+
+Each session_id has its own conversation memory: the last 4 turns
+(MEMORY_MODE = "window") or recent turns plus a rolling summary kept up to
+date in the background (MEMORY_MODE = "summary", conversation_memory.py),
+optionally persisted across restarts (MEMORY_PERSIST). aask() is the asyncio
+entry point: many sessions can be in flight at once, with at most
+OLLAMA_MAX_CONCURRENCY generations running against Ollama (scheduler.py).
+ask_stream() / aask_stream() yield the answer token by token.
+
+With RETRIEVAL_MODE = "hybrid" (or RAGBot(retrieval_mode="hybrid")),
+retrieval fuses the FAISS ranking with the BM25 ranking built next to it
+(bm25_index.py) by reciprocal rank fusion; stores without a BM25 index fall
+back to dense search.
+
+ask(), aask(), the streaming variants, retrieve() and retrieve_batch() take
+filters={"paper": ..., "year": ..., "page": ...} to search only part of the
+corpus (metadata_filter.py). The filter is applied inside the FAISS search
+(and to BM25 in hybrid mode), so k results come back even for a narrow
+filter; a malformed filter raises ValueError.
+
+With RERANK_ENABLED (or RAGBot(rerank=True)), RERANK_CANDIDATES chunks are
+retrieved and a cross-encoder keeps the best k, within a per-query time
+budget (reranker.py).
+
+Prompts are assembled within PROMPT_TOKEN_BUDGET (context_builder.py):
+overlapping and duplicate chunks are merged, and history and context are
+trimmed to their budgets. The estimated prompt size of each request is
+recorded through metrics.py (prompt.* counters, prompt.render span
+attributes); LOG_PROMPT_TOKENS also prints it.
+
+Every stage (retrieval, FAISS search, memory, prompt, LLM) is timed through
+metrics.py when it is enabled.
+"""
+
+import asyncio
+import threading
+import time
+
+import metrics
+
+from config import (
+    EMBEDDING_MODEL_NAME,
+    PROMPT_TOKEN_BUDGET,
+    CONTEXT_TOKEN_BUDGET,
+    HISTORY_TOKEN_BUDGET,
+    LOG_PROMPT_TOKENS,
+    MEMORY_MODE,
+    MEMORY_PERSIST,
+    SESSION_STORE_PATH,
+    OLLAMA_MAX_CONCURRENCY,
+    RETRIEVAL_MODE,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_S,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_REQUIRE_EMPTY_HISTORY,
+)
+from conversation_memory import SessionStore, SummaryMemory
+from context_builder import build_context, estimate_tokens, trim_history
+from query_cache import LRUCache, normalize_query
+from reranker import get_reranker
+from scheduler import RequestScheduler
+
+DEFAULT_SESSION = "default"
+
+_shared_lock = threading.Lock()
+_shared_db = None
+_semantic_cache = None
+
+# (model name, normalized query) -> query vector
+_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S)
+# (normalized query, k, retrieval mode, index version) -> top-k Documents
+_retrieval_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S)
+
+
+def get_vector_store():
+    """
+    The process-wide FAISS store, loaded on first call.
+    """
+    global _shared_db
+    with _shared_lock:
+        if _shared_db is None:
+            from vector_store import load_vector_store
+            _shared_db = load_vector_store()
+    if hasattr(_shared_db, "maybe_refresh"):
+        # Sharded index: swap in shards rebuilt since the last check
+        _shared_db.maybe_refresh()
+    return _shared_db
+
+
+def warm_up() -> None:
+    """
+    Loads the shared index and embedding model and runs one query through
+    them, so the first real question does not pay for it.
+    """
+    get_vector_store().similarity_search("warm up", k=1)
+
+
+def _load_ollama_model() -> None:
+    from ollama_client import get_client
+
+    try:
+        get_client().load_model()
+    except Exception as e:
+        print(f"[RAGBot] Could not preload the Ollama model: {e}")
+
+
+def get_semantic_cache():
+    """
+    The process-wide semantic answer cache, or None when it is disabled.
+    """
+    global _semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _semantic_cache is None:
+            from embedding_engine import cache_key
+            from semantic_cache import SemanticCache
+            _semantic_cache = SemanticCache(
+                SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE, model=cache_key()
+            )
+        return _semantic_cache
+
+
+def cache_stats() -> dict:
+    stats = {
+        "query_embedding": _embedding_cache.stats(),
+        "retrieval": _retrieval_cache.stats(),
+    }
+    if _semantic_cache is not None:
+        stats["semantic_answer"] = _semantic_cache.stats()
+    if get_reranker.cache_info().currsize:
+        stats["rerank"] = get_reranker().stats()
+    return stats
+
+
+def clear_caches(embeddings: bool = True) -> None:
+    """
+    Empties the retrieval cache and, unless embeddings=False, the
+    query-embedding cache (never the semantic cache).
+    """
+    if embeddings:
+        _embedding_cache.clear()
+    _retrieval_cache.clear()
+
+
+def context_ids(docs) -> list:
+    """
+    Stable IDs of retrieved chunks (chunk_id, or a text hash for indexes
+    built before chunk IDs existed).
+    """
+    from embedding_engine import text_hash
+
+    return [d.metadata.get("chunk_id") or text_hash(d.page_content) for d in docs]
+
+
+def embed_query(query: str):
+    key = (EMBEDDING_MODEL_NAME, normalize_query(query))
+    vector = _embedding_cache.get(key)
+    if vector is None:
+        with metrics.span("embed_query"):
+            vector = get_vector_store().embeddings.embed_query(query)
+        _embedding_cache.put(key, vector)
+    return vector
+
+
+def embed_queries(queries):
+    """
+    (len(queries), dim) float32 array, encoded in batches.
+    """
+    import numpy as np
+
+    embeddings = get_vector_store().embeddings
+    if hasattr(embeddings, "embed_array"):
+        return embeddings.embed_array(queries)
+    return np.asarray(embeddings.embed_documents(list(queries)), dtype=np.float32)
+
+
+def search_rows(db, vectors, n: int, filters=None) -> list:
+    """
+    FAISS row ids of the n nearest vectors, one list per query vector;
+    only rows matching filters (normalized) when given.
+    """
+    import faiss
+    import numpy as np
+
+    vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+    if getattr(db, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    with metrics.span("faiss.search", n=len(vectors), k=n, filtered=filters is not None):
+        if filters is None:
+            _, found = db.index.search(vectors, n)
+        else:
+            _, found = db.filters.search(db.index, vectors, n, filters)
+    return [[int(i) for i in row if i != -1] for row in found]
+
+
+def row_documents(db, rows) -> list:
+    with metrics.span("docstore.fetch"):
+        return [db.docstore.search(db.index_to_docstore_id[r]) for r in rows]
+
+
+def fuse_rows(db, query: str, dense_rows: list, k: int, filters=None) -> list:
+    """
+    Top-k rows by reciprocal rank fusion of the dense ranking and BM25.
+    """
+    from bm25_index import reciprocal_rank_fusion
+
+    allowed = db.filters.mask(filters) if filters is not None else None
+    with metrics.span("bm25.search"):
+        sparse_rows, _ = db.bm25.search(query, max(k, HYBRID_CANDIDATES), allowed)
+    return reciprocal_rank_fusion([dense_rows, sparse_rows.tolist()], k, RRF_K)
+
+
+class _Turn:
+    """
+    One request between retrieval and the answer.
+    """
+
+    def __init__(self, memory, query, docs, cache=None, vector=None, ids=None, answer=None):
+        self.memory = memory
+        self.query = query
+        self.docs = docs
+        self.cache = cache
+        self.vector = vector
+        self.ids = ids
+        self.answer = answer  # set on a semantic cache hit
+
 
 class RAGBot:
-    def __init__(self):
-        # LLaMA2 model
-        self.llm = Ollama(model="llama2")
-
-        # Remember last 4 turns
-        self.memory = ConversationBufferWindowMemory(
-            memory_key="chat_history",
-            input_key="user_input",
-            k=4
+    def __init__(
+        self,
+        warmup: bool = False,
+        llm=None,
+        max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+        retrieval_mode: str = RETRIEVAL_MODE,
+        rerank: bool = RERANK_ENABLED,
+        memory_mode: str = MEMORY_MODE,
+        persist_sessions: bool = MEMORY_PERSIST,
+    ):
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
+
+        if warmup:
+            threading.Thread(target=warm_up, daemon=True).start()
+
+        # LLaMA2 model (or a stand-in such as fakes.FakeLLM). The Ollama
+        # client is shared by every RAGBot and keeps its connections open.
+        if llm is None:
+            from ollama_client import get_ollama_llm
+
+            llm = get_ollama_llm()
+            if warmup:
+                threading.Thread(target=_load_ollama_model, daemon=True).start()
+        self.llm = llm
+
+        if memory_mode not in ("window", "summary"):
+            raise ValueError(f"Unknown memory mode: {memory_mode!r}")
+        self.memory_mode = memory_mode
+        # Saved sessions ("summary" memory only)
+        self.session_store = (
+            SessionStore(SESSION_STORE_PATH)
+            if persist_sessions and memory_mode == "summary" else None
         )
 
-        # Vector DB for RAG
-        self.db = load_vector_store()
+        # Caps concurrent generations for aask() and background summaries
+        self.scheduler = RequestScheduler(max_concurrency)
+
+        # One conversation memory per session; ask() uses DEFAULT_SESSION
+        self.sessions = {}
+        self.memory = self.session_memory(DEFAULT_SESSION)
+
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode!r}")
+        self.retrieval_mode = retrieval_mode
+
+        # Cross-encoder reranker (shared; model loaded on first use)
+        self.reranker = get_reranker() if rerank else None
+        if warmup and self.reranker is not None:
+            threading.Thread(target=lambda: self.reranker.model, daemon=True).start()
 
         # Prompt template that includes:
         # - Memory
@@ -39,20 +325,287 @@ Assistant:"""
             input_variables=["chat_history", "context", "user_input"],
         )
 
+        # History is passed in per call, so one chain serves every session
         self.chain = LLMChain(
             llm=self.llm,
             prompt=prompt,
-            memory=self.memory,
             output_key="answer"
         )
+        # Tokens of the template itself, without history/context/question
+        self._template_tokens = estimate_tokens(
+            prompt.format(chat_history="", context="", user_input="")
+        )
+
+    def session_memory(self, session_id):
+        memory = self.sessions.get(session_id)
+        store = self.session_store
+        if memory is not None and store is not None and store.revision(session_id) > memory.revision:
+            # Another process (server.py worker) answered this session since
+            memory.restore(store.load(session_id))
+        if memory is None and self.memory_mode == "summary":
+            # Recent turns verbatim + rolling summary of older ones
+            memory = self.sessions[session_id] = SummaryMemory(self.llm, scheduler=self.scheduler)
+            if store is not None:
+                state = store.load(session_id)
+                if state is not None:
+                    memory.restore(state)
+                memory.on_change = lambda m: store.save(session_id, m)
+        elif memory is None:
+            from langchain.memory import ConversationBufferWindowMemory
+
+            # Remember last 4 turns
+            memory = self.sessions[session_id] = ConversationBufferWindowMemory(
+                memory_key="chat_history",
+                input_key="user_input",
+                k=4
+            )
+        return memory
+
+    def end_session(self, session_id, forget: bool = False) -> None:
+        """
+        Drops the session from this process; with forget=True, also from
+        the session store.
+        """
+        memory = self.sessions.pop(session_id, None)
+        self.scheduler.drop_session(session_id)
+        if forget:
+            if isinstance(memory, SummaryMemory):
+                # A summary still being written must not save the session again
+                memory.on_change = None
+                memory.clear()
+            if self.session_store is not None:
+                self.session_store.delete(session_id)
+
+    @property
+    def db(self):
+        # Vector DB for RAG (shared, loaded on first use)
+        return get_vector_store()
+
+    def _hybrid(self, db) -> bool:
+        return self.retrieval_mode == "hybrid" and getattr(db, "bm25", None) is not None
+
+    def _filters(self, db, filters):
+        """
+        Normalized filters, checked against what the store supports.
+        """
+        from metadata_filter import normalize_filters
+
+        filters = normalize_filters(filters)
+        if filters is not None and getattr(db, "filters", None) is None:
+            raise ValueError("This index has no metadata filters; rebuild it with `python vector_store.py --full`")
+        return filters
+
+    def retrieve(self, query, k=3, filters=None):
+        if self.reranker is None:
+            return self._candidates(query, k, filters)
+        docs = self._candidates(query, max(k, RERANK_CANDIDATES), filters)
+        return self.reranker.rerank(query, docs, k, context_ids(docs))
 
-    def ask(self, query):
+    def _candidates(self, query, k, filters=None):
+        from metadata_filter import filter_key
+
+        db = self.db
+        filters = self._filters(db, filters)
+        hybrid = self._hybrid(db)
+        key = (normalize_query(query), k, hybrid, filter_key(filters), getattr(db, "index_version", None))
+        docs = _retrieval_cache.get(key)
+        if docs is None:
+            vector = embed_query(query)
+            if hybrid:
+                dense = search_rows(db, vector, max(k, HYBRID_CANDIDATES), filters)[0]
+                docs = row_documents(db, fuse_rows(db, query, dense, k, filters))
+            elif filters is not None:
+                docs = row_documents(db, search_rows(db, vector, k, filters)[0])
+            else:
+                with metrics.span("faiss.search", k=k):
+                    docs = db.similarity_search_by_vector(vector, k=k)
+            _retrieval_cache.put(key, docs)
+        else:
+            metrics.count("retrieval_cache.hits")
+        return list(docs)
+
+    def retrieve_batch(self, queries, k=3, filters=None):
+        """
+        Top-k Documents for every query, from one batched embedding pass and
+        one FAISS search (plus BM25 and reranking per query when enabled).
+        Bypasses the query caches.
+        """
+        db = self.db
+        filters = self._filters(db, filters)
+        hybrid = self._hybrid(db)
+        with metrics.span("embed_queries", n=len(queries)):
+            vectors = embed_queries(queries)
+        n = max(k, RERANK_CANDIDATES) if self.reranker is not None else k
+        rows = search_rows(db, vectors, max(n, HYBRID_CANDIDATES) if hybrid else n, filters)
+        if hybrid:
+            rows = [fuse_rows(db, q, dense, n, filters) for q, dense in zip(queries, rows)]
+        docs = [row_documents(db, r) for r in rows]
+        if self.reranker is not None:
+            docs = [self.reranker.rerank(q, d, k, context_ids(d)) for q, d in zip(queries, docs)]
+        return docs
+
+    def cache_stats(self) -> dict:
+        return cache_stats()
+
+    def _semantic_cache(self, memory):
+        cache = get_semantic_cache()
+        if cache is None:
+            return None
+        if SEMANTIC_CACHE_REQUIRE_EMPTY_HISTORY and memory.buffer:
+            return None
+        return cache
+
+    def _prepare(self, query, session_id, filters=None) -> _Turn:
         # Retrieve context from Vector DB
-        docs = self.db.similarity_search(query, k=3)
-        context = "\n\n".join([d.page_content for d in docs])
-
-        # Run the chain (produces and stores memory)
-        return self.chain.invoke({
-            "user_input": query,
-            "context": context
-        })["answer"]
+        with metrics.span("retrieve"):
+            docs = self.retrieve(query, k=3, filters=filters)
+        turn = _Turn(self.session_memory(session_id), query, docs)
+
+        turn.cache = self._semantic_cache(turn.memory)
+        if turn.cache is not None:
+            with metrics.span("semantic_cache.lookup"):
+                turn.ids = context_ids(docs)
+                turn.vector = embed_query(query)
+                turn.answer = turn.cache.lookup(turn.vector, turn.ids)
+        return turn
+
+    def _build_prompt(self, history: str, query: str, docs) -> str:
+        """
+        The prompt for one request: history trimmed to HISTORY_TOKEN_BUDGET,
+        context assembled from docs within what is left of the budgets.
+        """
+        with metrics.span("prompt.render") as span:
+            history = trim_history(history, HISTORY_TOKEN_BUDGET)
+            fixed = self._template_tokens + estimate_tokens(history) + estimate_tokens(query)
+            budget = max(0, min(CONTEXT_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - fixed))
+            context, info = build_context(docs, budget)
+            prompt = self.chain.prompt.format(chat_history=history, context=context, user_input=query)
+            tokens = estimate_tokens(prompt)
+            history_tokens = estimate_tokens(history)
+            span.set(
+                tokens=tokens,
+                context_tokens=info["tokens"],
+                history_tokens=history_tokens,
+                merged=info["merged"],
+            )
+
+        metrics.count("prompt.requests")
+        metrics.count("prompt.tokens", tokens)
+        metrics.count("prompt.context_tokens", info["tokens"])
+        metrics.count("prompt.history_tokens", history_tokens)
+        metrics.count("prompt.chunks_merged", info["merged"] + info["duplicates"])
+        metrics.count("prompt.chunks_trimmed", info["trimmed"] + info["dropped"])
+        if LOG_PROMPT_TOKENS:
+            print(
+                f"[RAGBot] Prompt ~{tokens} tokens: context {info['tokens']} "
+                f"({info['chunks']} chunks, {info['merged']} merged, {info['duplicates']} duplicate, "
+                f"{info['trimmed'] + info['dropped']} trimmed), history {history_tokens}"
+            )
+        return prompt
+
+    def _prompt(self, turn: _Turn) -> str:
+        with metrics.span("memory.load"):
+            history = turn.memory.load_memory_variables({})["chat_history"]
+        return self._build_prompt(history, turn.query, turn.docs)
+
+    def _call_llm(self, prompt: str) -> str:
+        metrics.count("llm.calls")
+        with metrics.span("llm"):
+            return self.llm.invoke(prompt)
+
+    async def _acall_llm(self, prompt: str) -> str:
+        metrics.count("llm.calls")
+        with metrics.span("llm"):
+            return await self.llm.ainvoke(prompt)
+
+    def _finish(self, turn: _Turn, answer: str) -> str:
+        # Cache hits are saved too, so the conversation matches what the user saw
+        with metrics.span("memory.save"):
+            turn.memory.save_context({"user_input": turn.query}, {"answer": answer})
+        if turn.cache is not None and turn.answer is None:
+            with metrics.span("semantic_cache.add"):
+                turn.cache.add(turn.query, turn.vector, turn.ids, answer)
+        return answer
+
+    def ask(self, query, session_id=DEFAULT_SESSION, filters=None):
+        with metrics.span("ask"):
+            turn = self._prepare(query, session_id, filters)
+            if turn.answer is not None:
+                return self._finish(turn, turn.answer)
+
+            answer = self._call_llm(self._prompt(turn))
+            return self._finish(turn, answer)
+
+    async def aask(self, query, session_id=DEFAULT_SESSION, filters=None):
+        """
+        Async ask(). Turns of one session run in order; different sessions
+        run concurrently, with retrieval in a worker thread and generation
+        gated by the scheduler.
+        """
+        with metrics.span("aask"):
+            async with self.scheduler.session_lock(session_id):
+                turn = await asyncio.to_thread(self._prepare, query, session_id, filters)
+                if turn.answer is not None:
+                    return self._finish(turn, turn.answer)
+
+                prompt = self._prompt(turn)
+                answer = await self.scheduler.generate(lambda: self._acall_llm(prompt))
+                return self._finish(turn, answer)
+
+    async def agenerate(self, query, docs) -> str:
+        """
+        One-shot answer over already-retrieved docs, without session memory
+        or the semantic cache; generation goes through the scheduler.
+        """
+        prompt = self._build_prompt("", query, docs)
+        return await self.scheduler.generate(lambda: self._acall_llm(prompt))
+
+    def ask_stream(self, query, session_id=DEFAULT_SESSION, filters=None):
+        """
+        Like ask(), but yields the answer in pieces as Ollama produces them.
+        Memory (and the semantic cache) are updated once the stream has been
+        read to the end; an abandoned stream leaves the session unchanged.
+        """
+        turn = self._prepare(query, session_id, filters)
+        if turn.answer is not None:
+            self._finish(turn, turn.answer)
+            yield turn.answer
+            return
+
+        prompt = self._prompt(turn)
+        metrics.count("llm.calls")
+        parts = []
+        start = time.perf_counter()
+        for token in self.llm.stream(prompt):
+            if not parts:
+                metrics.observe("llm.first_token", time.perf_counter() - start)
+            parts.append(token)
+            yield token
+        metrics.observe("llm.stream", time.perf_counter() - start)
+        metrics.count("llm.stream_chunks", len(parts))
+        self._finish(turn, "".join(parts))
+
+    async def aask_stream(self, query, session_id=DEFAULT_SESSION, filters=None):
+        """
+        Async ask_stream(); holds a scheduler slot while tokens are produced.
+        """
+        async with self.scheduler.session_lock(session_id):
+            turn = await asyncio.to_thread(self._prepare, query, session_id, filters)
+            if turn.answer is not None:
+                self._finish(turn, turn.answer)
+                yield turn.answer
+                return
+
+            prompt = self._prompt(turn)
+            metrics.count("llm.calls")
+            parts = []
+            async with self.scheduler.slot():
+                start = time.perf_counter()
+                async for token in self.llm.astream(prompt):
+                    if not parts:
+                        metrics.observe("llm.first_token", time.perf_counter() - start)
+                    parts.append(token)
+                    yield token
+                metrics.observe("llm.stream", time.perf_counter() - start)
+            metrics.count("llm.stream_chunks", len(parts))
+            self._finish(turn, "".join(parts))
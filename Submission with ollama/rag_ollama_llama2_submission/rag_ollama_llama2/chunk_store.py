@@ -0,0 +1,257 @@
+"""
+chunk_store.py
+---------------
+Columnar, memory-mapped on-disk store for text chunks.
+
+Replaces pickled lists of LangChain Documents (chunks.pkl and the FAISS
+index.pkl docstore). A store is a folder of flat files:
+
+    text.bin     all chunk texts, UTF-8, back to back
+    ends.bin     int64 end offset of each chunk in text.bin
+    source.bin   int32 index into sources.json, per chunk
+    page.bin     int32 page number, per chunk
+    ids.bin      fixed-width chunk_id, per chunk
+    sources.json list of distinct source paths
+
+Opening a store maps the files instead of reading them, so startup cost does
+not depend on corpus size, and a chunk's text is a zero-copy slice of the
+mapped blob until it is decoded.
+"""
+
+import json
+import mmap
+import shutil
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+ID_WIDTH = 40
+
+_COLUMNS = {
+    "ends.bin": np.int64,
+    "source.bin": np.int32,
+    "page.bin": np.int32,
+    "ids.bin": f"S{ID_WIDTH}",
+}
+
+
+def _map_column(path: Path, dtype) -> np.ndarray:
+    if not path.exists() or path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class ChunkStore:
+    """
+    Read-only view of a chunk store folder. Rows are addressed by position.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.sources = json.loads((self.path / "sources.json").read_text(encoding="utf-8"))
+        self._ends = _map_column(self.path / "ends.bin", np.int64)
+        self._source = _map_column(self.path / "source.bin", np.int32)
+        self._page = _map_column(self.path / "page.bin", np.int32)
+        self._ids = _map_column(self.path / "ids.bin", f"S{ID_WIDTH}")
+        self._rows = None
+
+        text_path = self.path / "text.bin"
+        self._mmap = None
+        self._text = memoryview(b"")
+        if text_path.stat().st_size > 0:
+            with open(text_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._text = memoryview(self._mmap)
+
+    @staticmethod
+    def exists(path) -> bool:
+        return (Path(path) / "sources.json").exists()
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def raw(self, i: int) -> memoryview:
+        """
+        UTF-8 bytes of chunk i as a zero-copy slice of the mapped blob.
+        """
+        start = int(self._ends[i - 1]) if i > 0 else 0
+        return self._text[start:int(self._ends[i])]
+
+    def text(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def source(self, i: int) -> str:
+        return self.sources[self._source[i]]
+
+    def page(self, i: int) -> int:
+        return int(self._page[i])
+
+    def source_codes(self) -> np.ndarray:
+        """
+        Per-row index into self.sources (the mapped column).
+        """
+        return self._source
+
+    def pages(self) -> np.ndarray:
+        """
+        Per-row page number (the mapped column).
+        """
+        return self._page
+
+    def chunk_id(self, i: int) -> str:
+        return self._ids[i].decode("ascii")
+
+    def metadata(self, i: int) -> dict:
+        return {"source": self.source(i), "page": self.page(i), "chunk_id": self.chunk_id(i)}
+
+    def document(self, i: int) -> Document:
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def iter_documents(self):
+        for i in range(len(self)):
+            yield self.document(i)
+
+    def row_of(self, chunk_id: str) -> int:
+        """
+        Row of a chunk_id. The id -> row table is built on first use.
+        """
+        if self._rows is None:
+            self._rows = {cid.decode("ascii"): i for i, cid in enumerate(self._ids)}
+        return self._rows[chunk_id]
+
+    def chunk_ids(self) -> list:
+        return [cid.decode("ascii") for cid in self._ids]
+
+    def close(self) -> None:
+        """
+        Unmaps the store. Slices returned by raw() must be released first.
+        """
+        self._text.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+
+class ChunkStoreWriter:
+    """
+    Appends Documents to a chunk store folder.
+
+    Columns are plain append-only files, so a writer can reopen a store and
+    continue from a known row count (truncating anything after it), which is
+    what resumable builds rely on.
+    """
+
+    def __init__(self, path, resume_rows=None):
+        self.path = Path(path)
+        if resume_rows is None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path.mkdir(parents=True)
+            self.sources = []
+            self.rows = 0
+            self._end = 0
+            for name in ("text.bin", *_COLUMNS):
+                (self.path / name).write_bytes(b"")
+        else:
+            store = ChunkStore(self.path)
+            self.sources = list(store.sources)
+            self.rows = resume_rows
+            self._end = int(store._ends[resume_rows - 1]) if resume_rows else 0
+            store.close()
+            self._truncate()
+
+        self._source_index = {s: n for n, s in enumerate(self.sources)}
+        self._files = {
+            name: open(self.path / name, "ab") for name in ("text.bin", *_COLUMNS)
+        }
+
+    def _truncate(self) -> None:
+        with open(self.path / "text.bin", "r+b") as f:
+            f.truncate(self._end)
+        for name, dtype in _COLUMNS.items():
+            with open(self.path / name, "r+b") as f:
+                f.truncate(self.rows * np.dtype(dtype).itemsize)
+
+    def add(self, doc: Document) -> int:
+        data = doc.page_content.encode("utf-8")
+        source = doc.metadata.get("source", "")
+        if source not in self._source_index:
+            self._source_index[source] = len(self.sources)
+            self.sources.append(source)
+        chunk_id = doc.metadata.get("chunk_id", str(self.rows)).encode("ascii")
+        if len(chunk_id) > ID_WIDTH:
+            raise ValueError(f"chunk_id longer than {ID_WIDTH} bytes: {chunk_id!r}")
+
+        self._end += len(data)
+        self._files["text.bin"].write(data)
+        self._files["ends.bin"].write(struct.pack("<q", self._end))
+        self._files["source.bin"].write(struct.pack("<i", self._source_index[source]))
+        self._files["page.bin"].write(struct.pack("<i", int(doc.metadata.get("page", 0))))
+        self._files["ids.bin"].write(chunk_id.ljust(ID_WIDTH, b"\0"))
+        self.rows += 1
+        return self.rows - 1
+
+    def add_documents(self, docs) -> None:
+        for d in docs:
+            self.add(d)
+
+    def flush(self) -> None:
+        for f in self._files.values():
+            f.flush()
+        (self.path / "sources.json").write_text(json.dumps(self.sources), encoding="utf-8")
+
+    def close(self) -> None:
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+def write_chunk_store(path, docs) -> None:
+    writer = ChunkStoreWriter(path)
+    writer.add_documents(docs)
+    writer.close()
+
+
+class _RowIds(Mapping):
+    """
+    index_to_docstore_id for a store whose rows line up with the FAISS index:
+    FAISS position i maps to chunk store row i, without a per-row dict.
+    """
+
+    def __init__(self, n: int):
+        self._n = n
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self._n:
+            raise KeyError(i)
+        return i
+
+    def __iter__(self):
+        return iter(range(self._n))
+
+    def __len__(self) -> int:
+        return self._n
+
+
+class ChunkStoreDocstore(Docstore):
+    """
+    Read-only LangChain Docstore backed by a ChunkStore.
+
+    search() takes a row number (what _RowIds hands out) or a chunk_id.
+    """
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def search(self, search):
+        try:
+            row = search if isinstance(search, (int, np.integer)) else self.store.row_of(search)
+        except KeyError:
+            return f"ID {search} not found."
+        return self.store.document(int(row))
+
+    def index_to_docstore_id(self) -> Mapping:
+        return _RowIds(len(self.store))
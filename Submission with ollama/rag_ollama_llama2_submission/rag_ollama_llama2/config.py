@@ -2,12 +2,14 @@
 Configuration constants for the RAG assignment project using Ollama + LLaMA 2.
 """
 
+import os
 from pathlib import Path
 
 # Base paths
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
-ARTIFACTS_DIR = BASE_DIR / "artifacts"
+# RAG_ARTIFACTS_DIR redirects everything generated (benchmark.py uses a temp dir)
+ARTIFACTS_DIR = Path(os.environ.get("RAG_ARTIFACTS_DIR") or BASE_DIR / "artifacts")
 REPORT_DIR = BASE_DIR / "report"
 
 # Make sure key folders exist (safe, idempotent)
@@ -32,16 +34,231 @@ PDF_FILES = [
     DATA_DIR / "1910.10683.pdf",
 ]
 
+# PDF downloads (downloader.py): DOWNLOAD_WORKERS files at a time over one
+# pooled session, streamed to a .part file that later runs resume with an
+# HTTP Range request. Finished files are recorded with size, ETag and
+# SHA-256 in DOWNLOAD_MANIFEST_PATH and re-checked on the next run.
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_CONNECT_TIMEOUT_S = 10
+DOWNLOAD_READ_TIMEOUT_S = 60  # between bytes
+DOWNLOAD_RETRIES = 3  # per file, resuming where the last attempt stopped
+DOWNLOAD_CHUNK_BYTES = 1 << 16
+# Optional expected SHA-256 per file name; files that do not match are rejected
+PDF_SHA256 = {}
+DOWNLOAD_MANIFEST_PATH = DATA_DIR / "downloads.json"
+
 # Embedding model (lightweight, widely used)
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Embedding engine (embedding_engine.py)
+EMBED_ENCODE_BATCH_SIZE = 32
+EMBED_NORMALIZE = False
+EMBED_TORCH_THREADS = 0  # 0 = leave torch's default
+
 # Ollama model name (must be pulled with `ollama pull`)
 OLLAMA_MODEL_NAME = "llama2"
 
+# Ollama client (ollama_client.py): one pooled keep-alive HTTP client per
+# process. OLLAMA_BASE_URL can be overridden from the environment (e.g. to
+# point benchmarks at fakes.FakeOllamaServer).
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL") or "http://localhost:11434"
+OLLAMA_KEEP_ALIVE = "30m"  # how long Ollama keeps the model loaded after a request
+OLLAMA_NUM_CTX = 2048  # context window; prompts are budgeted to fit (PROMPT_TOKEN_BUDGET)
+OLLAMA_NUM_THREAD = 0  # 0 = Ollama's default (physical cores)
+OLLAMA_OPTIONS = {}  # further generation options, e.g. {"temperature": 0.2, "num_predict": 256}
+OLLAMA_POOL_SIZE = 8  # pooled HTTP connections
+OLLAMA_CONNECT_TIMEOUT_S = 5
+OLLAMA_READ_TIMEOUT_S = 300  # between bytes, so long generations stream fine
+# Connection errors, 429 and 5xx are retried with exponential backoff
+# (OLLAMA_RETRY_BACKOFF_S, doubled per attempt) before the first token only
+OLLAMA_RETRIES = 3
+OLLAMA_RETRY_BACKOFF_S = 0.5
+
+# RAGBot.aask(): generations in flight against Ollama at once, background
+# "summary" memory calls included. Match the server's OLLAMA_NUM_PARALLEL;
+# extra requests queue (after retrieval).
+OLLAMA_MAX_CONCURRENCY = 2
+
+# Chunking
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 150
+
+# Near-duplicate removal at ingest (dedup.py): chunks whose word-shingle
+# Jaccard similarity to an earlier chunk (estimated by MinHash over
+# DEDUP_NUM_PERM hashes, LSH with DEDUP_BANDS bands) reaches DEDUP_THRESHOLD
+# are dropped before embedding. Off by default: it changes which chunks
+# ingest writes (and so retrieval results); re-run `python ingest.py` and
+# rebuild the index after switching it
+DEDUP_ENABLED = False
+DEDUP_THRESHOLD = 0.7
+DEDUP_SHINGLE = 5
+DEDUP_NUM_PERM = 128
+DEDUP_BANDS = 32
+
+# Parallel ingestion: PDFs are loaded and chunked one per process in a pool
+# of INGEST_WORKERS (1 = serial, in-process; 0 = one worker per CPU)
+INGEST_WORKERS = 1
+
+# Streaming build (vector_store.py --stream): chunks are embedded and added
+# to the index EMBED_BATCH_SIZE at a time; the index is saved and the
+# checkpoint advanced every STREAM_COMMIT_EVERY batches
+EMBED_BATCH_SIZE = 64
+STREAM_COMMIT_EVERY = 16
+
+# FAISS index type: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw".
+# IVF/PQ indexes are trained on at most INDEX_TRAIN_SAMPLE vectors.
+FAISS_INDEX_TYPE = "flat"
+INDEX_TRAIN_SAMPLE = 50_000
+IVF_NLIST = 0  # 0 = about 4 * sqrt(num vectors)
+IVF_NPROBE = 8  # lists scanned per query (query time)
+PQ_M = 16  # sub-quantizers; must divide the embedding dimension
+PQ_NBITS = 8
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # candidate list size per query (query time)
+# Stored vector precision: "float32", "float16" (half the memory) or "int8"
+# (a quarter; per-dimension ranges calibrated on the training sample at build
+# time, clipped to the INT8_CLIP_QUANTILE / 1 - INT8_CLIP_QUANTILE quantiles;
+# 0 = min / max). Applies to "flat", "ivf_flat" and "hnsw" ("ivf_pq" is
+# already compressed).
+INDEX_PRECISION = "float32"
+INT8_CLIP_QUANTILE = 0.0
+# With reduced precision, fetch RESCORE_FACTOR * k candidates and re-rank
+# them by exact float32 distance from a memory-mapped copy of the vectors
+# (faiss_index/vectors.npy), which stays on disk apart from the rows read
+INDEX_RESCORE = True
+RESCORE_FACTOR = 4
+# Memory-map the served index read-only instead of loading a private copy,
+# so several processes (server.py workers) share one copy of the vectors
+INDEX_MMAP = True
+
+# Index sharding (sharded_index.py): "none" (one index in faiss_index/),
+# "source" (one shard per PDF) or "size" (SHARD_MAX_CHUNKS chunks each).
+# Shards are rebuilt only when their chunks change, several at a time, and
+# searched with a thread-pool fan-out. A running bot swaps in rebuilt shards
+# within SHARD_REFRESH_S seconds (0 = only on ShardedVectorStore.refresh()).
+INDEX_SHARDING = "none"
+SHARD_MAX_CHUNKS = 50_000
+SHARD_BUILD_WORKERS = 0  # 0 = one per CPU, up to the number of shards
+SHARD_SEARCH_WORKERS = 0  # 0 = one per CPU
+SHARD_REFRESH_S = 10
+
+# Retrieval: "dense" (FAISS only) or "hybrid" (FAISS + BM25, fused with
+# reciprocal rank fusion over HYBRID_CANDIDATES hits from each side)
+RETRIEVAL_MODE = "dense"
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Metadata filters (metadata_filter.py): RAGBot.ask(..., filters={"paper":
+# "bert", "year": [2018, 2019], "page": [0, 4]}). Short names accepted for
+# "paper", and years for files whose name is not an arXiv id (those give the
+# year themselves: 1706.03762 -> 2017).
+PAPER_ALIASES = {
+    "attention": "1706.03762",
+    "bert": "1810.04805",
+    "gpt3": "2005.14165",
+    "roberta": "1907.11692",
+    "t5": "1910.10683",
+}
+PAPER_YEARS = {}
+# HNSW: filters matching fewer than this fraction of rows are searched exactly
+# over the flat storage (a graph walk finds too few of their rows)
+FILTER_EXACT_BELOW = 0.05
+
+# Optional cross-encoder reranking (reranker.py): retrieve RERANK_CANDIDATES
+# chunks, keep the best k. Past RERANK_BUDGET_S per query the dense order is
+# kept instead.
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_S = 0.5
+RERANK_CACHE_SIZE = 20_000  # cached (query, chunk) scores
+
+# Prompt assembly (context_builder.py). Token counts are estimated as
+# characters / CHARS_PER_TOKEN (LLaMA 2 averages ~3.5-4 on English text).
+# PROMPT_TOKEN_BUDGET covers the whole prompt and leaves room for the answer
+# in llama2's 2048-token window; history and context are trimmed to fit.
+PROMPT_TOKEN_BUDGET = 1500
+CONTEXT_TOKEN_BUDGET = 700
+HISTORY_TOKEN_BUDGET = 400
+CHARS_PER_TOKEN = 3.6
+MERGE_MIN_OVERLAP = 20  # chars two chunks must share to be merged
+# Per-request prompt sizes are recorded as prompt.* metrics (metrics.py);
+# LOG_PROMPT_TOKENS also prints them, for debugging (not for serving)
+LOG_PROMPT_TOKENS = False
+
+# Conversation memory: "window" (last 4 turns verbatim) or "summary"
+# (conversation_memory.py): recent turns verbatim up to MEMORY_RECENT_TOKENS,
+# older ones folded into a rolling summary of at most MEMORY_SUMMARY_TOKENS
+# by a background LLM call. Keep both within HISTORY_TOKEN_BUDGET.
+# "summary" costs an extra LLM call every few turns and changes the prompts.
+MEMORY_MODE = "window"
+MEMORY_RECENT_TOKENS = 250
+MEMORY_SUMMARY_TOKENS = 120
+# Save "summary" sessions to SESSION_STORE_PATH and restore them by session id
+MEMORY_PERSIST = False
+
+# RAGBot query caches: query embeddings and top-k results (entries, seconds)
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL_S = 3600
+
+# Semantic answer cache in front of the LLM (semantic_cache.py, off by
+# default). A stored answer is reused when a new query's embedding has at
+# least this cosine similarity to a cached one and retrieval returned the
+# same chunks. Answers depend on chat history, so by default the cache is
+# only used for turns that have none.
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_SIZE = 5000  # least recently used entries are evicted
+SEMANTIC_CACHE_REQUIRE_EMPTY_HISTORY = True
+
+# HTTP serving (server.py): SERVER_WORKERS processes share one listening
+# socket, the memory-mapped index and the session store (sessions are saved
+# after every turn, so any worker can answer the next one). Sessions idle for
+# SERVER_SESSION_IDLE_S are dropped from worker memory (kept in the store).
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_WORKERS = 2
+SERVER_SESSION_IDLE_S = 1800
+SERVER_MAX_QUERY_CHARS = 2000
+
+# evaluation.py: questions retrieved per batched FAISS search, and
+# answers generated concurrently (via the RAGBot scheduler)
+EVAL_BATCH_SIZE = 64
+EVAL_WORKERS = 2
+
+# Per-stage timing (metrics.py). While disabled, instrumentation is a no-op;
+# metrics.enable() turns it on at runtime (evaluation.py always does).
+METRICS_ENABLED = False
+METRICS_MAX_SAMPLES = 10_000  # latest durations kept per stage for p50/p95/p99
+TRACE_EXPORT_PATH = None  # e.g. ARTIFACTS_DIR / "trace.jsonl": one line per span
+TRACE_FORMAT = "jsonl"  # "jsonl" (flat records) or "otel" (OpenTelemetry-style spans)
+
 # Artifacts
-CHUNKS_PATH = ARTIFACTS_DIR / "chunks.pkl"
+# Memory-mapped chunk store written by ingest.py (see chunk_store.py)
+CHUNK_STORE_DIR = ARTIFACTS_DIR / "chunks"
+# Per-file and per-chunk content hashes used for incremental re-ingestion
+MANIFEST_PATH = ARTIFACTS_DIR / "manifest.json"
+STREAM_CHECKPOINT_PATH = ARTIFACTS_DIR / "stream_checkpoint.json"
+# Persistent embedding cache keyed by (model name, chunk text hash)
+EMBEDDING_CACHE_PATH = ARTIFACTS_DIR / "embedding_cache.sqlite"
+SEMANTIC_CACHE_PATH = ARTIFACTS_DIR / "semantic_cache.sqlite"
+SESSION_STORE_PATH = ARTIFACTS_DIR / "sessions.sqlite"
 FAISS_INDEX_PATH = ARTIFACTS_DIR / "faiss_index"
+# One folder per shard when INDEX_SHARDING is on
+FAISS_SHARDS_PATH = ARTIFACTS_DIR / "faiss_shards"
+# Chunk store with one row per FAISS vector, replacing index.pkl
+INDEX_CHUNK_STORE_DIR = FAISS_INDEX_PATH / "chunks"
+# BM25 inverted index over the same rows (see bm25_index.py)
+BM25_INDEX_DIR = FAISS_INDEX_PATH / "bm25"
+# Per-paper / per-year row bitmaps for filtered search (see metadata_filter.py)
+FILTER_INDEX_DIR = FAISS_INDEX_PATH / "filters"
 EVAL_RESULTS_PATH = ARTIFACTS_DIR / "eval_results.json"
+# One JSON record per answered question; lets an interrupted run resume
+EVAL_CHECKPOINT_PATH = ARTIFACTS_DIR / "eval_records.jsonl"
 
 # Final PDF report path
 REPORT_PATH = REPORT_DIR / "report.pdf"
@@ -0,0 +1,160 @@
+"""
+context_builder.py
+-------------------
+Token-budgeted prompt assembly for RAGBot.
+
+Retrieved chunks often repeat each other: neighbouring chunks of a page
+share CHUNK_OVERLAP characters, and the same text can come back twice.
+build_context():
+1. drops chunks whose text is already contained in an earlier passage,
+2. merges chunks from the same page that overlap end-to-start into one
+   passage (the shared text appears once),
+3. keeps passages in retrieval order and stops at the token budget,
+   cutting the last passage at a sentence or word boundary.
+
+trim_history() keeps the most recent conversation turns that fit their own
+budget, after the rolling summary of a "summary" memory (which is cut only
+when it alone is over the budget). Token counts are estimates (characters / CHARS_PER_TOKEN): no
+tokenizer is loaded.
+"""
+
+import math
+
+from config import CHARS_PER_TOKEN, MERGE_MIN_OVERLAP, CHUNK_OVERLAP
+
+# Shortest passage tail worth keeping when the budget cuts a passage
+MIN_TRIMMED_TOKENS = 40
+# First line of a SummaryMemory history (conversation_memory.py)
+SUMMARY_PREFIX = "Summary of earlier conversation: "
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _overlap(a: str, b: str) -> int:
+    """
+    Length of the longest suffix of a that is a prefix of b (at least
+    MERGE_MIN_OVERLAP characters), else 0.
+    """
+    # Splitters cut on whitespace, so allow some slack over CHUNK_OVERLAP
+    tail = a[-(2 * CHUNK_OVERLAP + MERGE_MIN_OVERLAP):]
+    probe = b[:MERGE_MIN_OVERLAP]
+    if len(probe) < MERGE_MIN_OVERLAP:
+        return 0
+    i = tail.find(probe)
+    while i != -1:
+        if b.startswith(tail[i:]):
+            return len(tail) - i
+        i = tail.find(probe, i + 1)
+    return 0
+
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    """
+    text cut to about `tokens` tokens, at a sentence or word boundary.
+    """
+    if estimate_tokens(text) <= tokens:
+        return text
+    cut = text[:int(tokens * CHARS_PER_TOKEN)]
+    end = cut.rfind(". ")
+    if end >= len(cut) // 2:
+        return cut[:end + 1]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > 0 else cut) + " ..."
+
+
+def build_context(docs, budget_tokens: int):
+    """
+    Returns (context, info): the passages joined with blank lines, and
+    counts of merged / duplicate / dropped chunks and the context tokens.
+    """
+    passages = []  # [source, page, text]
+    info = {"chunks": len(docs), "merged": 0, "duplicates": 0, "trimmed": 0, "dropped": 0}
+
+    for d in docs:
+        text = d.page_content.strip()
+        key = (d.metadata.get("source"), d.metadata.get("page"))
+        if any(text in p[2] for p in passages):
+            info["duplicates"] += 1
+            continue
+
+        for p in passages:
+            if (p[0], p[1]) != key:
+                continue
+            if text.find(p[2]) != -1:
+                # The new chunk covers an earlier one from the same page
+                p[2] = text
+                info["duplicates"] += 1
+                break
+            n = _overlap(p[2], text)
+            if n:
+                p[2] = p[2] + text[n:]
+                info["merged"] += 1
+                break
+            n = _overlap(text, p[2])
+            if n:
+                p[2] = text + p[2][n:]
+                info["merged"] += 1
+                break
+        else:
+            passages.append([key[0], key[1], text])
+
+    parts = []
+    used = 0
+    for i, (_, _, text) in enumerate(passages):
+        tokens = estimate_tokens(text)
+        if used + tokens <= budget_tokens:
+            parts.append(text)
+            used += tokens
+            continue
+        remaining = budget_tokens - used
+        if remaining >= MIN_TRIMMED_TOKENS:
+            parts.append(truncate_tokens(text, remaining))
+            used += estimate_tokens(parts[-1])
+            info["trimmed"] += 1
+            i += 1
+        info["dropped"] = len(passages) - i
+        break
+
+    info["tokens"] = used
+    return "\n\n".join(parts), info
+
+
+def trim_history(history: str, budget_tokens: int) -> str:
+    """
+    The most recent "Human: ... / AI: ..." turns that fit the budget; if
+    even the last turn does not fit, its tail. A leading summary line is
+    always kept and the turns fill what it leaves.
+    """
+    if estimate_tokens(history) <= budget_tokens:
+        return history
+    if budget_tokens <= 0:
+        return ""
+    turns = []
+    for line in history.split("\n"):
+        if line.startswith("Human: ") or not turns:
+            turns.append(line)
+        else:
+            turns[-1] += "\n" + line
+
+    summary = []
+    if turns[0].startswith(SUMMARY_PREFIX):
+        # The facts folded out of the verbatim turns only live here
+        summary = [turns.pop(0)]
+        tokens = estimate_tokens(summary[0]) + 1
+        if tokens >= budget_tokens:
+            return truncate_tokens(summary[0], budget_tokens)
+        budget_tokens -= tokens
+
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        tokens = estimate_tokens(turn) + 1
+        if used + tokens > budget_tokens:
+            break
+        kept.append(turn)
+        used += tokens
+    if not kept and turns and budget_tokens > 0:
+        kept = [turns[-1][-int(budget_tokens * CHARS_PER_TOKEN):]]
+    return "\n".join(summary + kept[::-1])
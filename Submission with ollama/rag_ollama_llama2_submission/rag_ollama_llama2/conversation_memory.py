@@ -0,0 +1,286 @@
+"""
+conversation_memory.py
+-----------------------
+Token-bounded conversation memory with a rolling summary.
+
+SummaryMemory keeps the most recent turns verbatim while they fit in
+MEMORY_RECENT_TOKENS. Older turns are folded into a short running summary
+by the LLM on a background thread, so the answer is never delayed by it.
+Until a fold finishes, the turns being folded are still shown verbatim
+as far as the recent budget allows, so a short session loses nothing in
+between and a lagging summarizer cannot grow the prompt. Given RAGBot's
+RequestScheduler, each summary call waits for a generation slot like any
+answer, so summaries never push Ollama past OLLAMA_MAX_CONCURRENCY.
+
+The history it renders is
+
+    Summary of earlier conversation: ...
+    Human: ...
+    AI: ...
+
+and stays about MEMORY_SUMMARY_TOKENS + MEMORY_RECENT_TOKENS tokens however
+long the session runs. It is a drop-in for the LangChain memories RAGBot
+used before (load_memory_variables / save_context / buffer / clear).
+
+Turns are stored as plain (user, answer) string pairs. SessionStore
+persists each session to SQLite as one zlib-compressed JSON row, so
+sessions survive restarts. Rows carry the memory's revision (one per turn):
+an older revision never overwrites a newer one, and a process holding a
+session checks the stored revision to pick up turns another process served
+(server.py workers share one store).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from config import MEMORY_RECENT_TOKENS, MEMORY_SUMMARY_TOKENS
+from context_builder import SUMMARY_PREFIX, estimate_tokens, truncate_tokens
+
+SUMMARY_TEMPLATE = """Progressively summarize the conversation below, adding onto the current summary.
+Keep names and facts the user gave about themselves, and the topics discussed.
+Reply with the new summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+# One background summarizer per process, so folds never compete with each
+# other for the LLM
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _summarizer() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+        return _executor
+
+
+def _format_turns(turns) -> str:
+    return "\n".join(f"Human: {user}\nAI: {answer}" for user, answer in turns)
+
+
+class SummaryMemory:
+    memory_key = "chat_history"
+
+    def __init__(
+        self,
+        llm,
+        recent_tokens: int = MEMORY_RECENT_TOKENS,
+        summary_tokens: int = MEMORY_SUMMARY_TOKENS,
+        on_change=None,
+        scheduler=None,
+    ):
+        self.llm = llm
+        # RequestScheduler whose slots summary calls are counted against
+        self.scheduler = scheduler
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        # Called with the memory after each change (SessionStore.save)
+        self.on_change = on_change
+        self.summary = ""
+        self.turns = deque()  # recent (user, answer) pairs, oldest first
+        self.folding = []  # turns handed to the summarizer, not yet in summary
+        self._recent = 0  # estimated tokens of self.turns
+        self.revision = 0  # bumped by every save_context / clear
+        self._restores = 0  # a fold started before a restore / clear is discarded
+        self._future = None
+        # Reentrant: a fold saves (snapshot()) while still holding it
+        self._lock = threading.RLock()
+
+    # -- LangChain memory interface -------------------------------------
+    def load_memory_variables(self, inputs=None) -> dict:
+        return {self.memory_key: self.buffer}
+
+    @property
+    def buffer(self) -> str:
+        with self._lock:
+            turns = list(self.turns)
+            # Turns still being folded fill what is left of the recent budget
+            used = self._recent
+            for turn in reversed(self.folding):
+                used += self._tokens(turn)
+                if used > self.recent_tokens:
+                    break
+                turns.insert(0, turn)
+            lines = []
+            if self.summary:
+                lines.append(SUMMARY_PREFIX + self.summary)
+            if turns:
+                lines.append(_format_turns(turns))
+        return "\n".join(lines)
+
+    def save_context(self, inputs: dict, outputs: dict) -> None:
+        turn = (inputs["user_input"], outputs["answer"])
+        with self._lock:
+            self.turns.append(turn)
+            self._recent += self._tokens(turn)
+            self.revision += 1
+            # The latest turn always stays verbatim
+            while self._recent > self.recent_tokens and len(self.turns) > 1:
+                old = self.turns.popleft()
+                self._recent -= self._tokens(old)
+                self.folding.append(old)
+            start = bool(self.folding) and self._future is None
+            if start:
+                self._future = _summarizer().submit(self._fold)
+        self._changed()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self.turns.clear()
+            self.folding = []
+            self._recent = 0
+            self.revision += 1
+            self._restores += 1
+        self._changed()
+
+    # -- summary --------------------------------------------------------
+    @staticmethod
+    def _tokens(turn) -> int:
+        return estimate_tokens(turn[0]) + estimate_tokens(turn[1]) + 4
+
+    def _fold(self) -> None:
+        """
+        Folds the pending turns into the summary until none are left.
+        Runs on the summarizer thread.
+        """
+        while True:
+            with self._lock:
+                batch = list(self.folding)
+                summary = self.summary
+                restores = self._restores
+                if not batch:
+                    self._future = None
+                    return
+            prompt = SUMMARY_TEMPLATE.format(
+                words=int(self.summary_tokens * 0.75),
+                summary=summary or "(empty)",
+                lines=_format_turns(batch),
+            )
+            try:
+                metrics.count("memory.summaries")
+                with metrics.span("memory.summarize", turns=len(batch)):
+                    if self.scheduler is not None:
+                        new = self.scheduler.run(self.llm.invoke, prompt).strip()
+                    else:
+                        new = self.llm.invoke(prompt).strip()
+            except Exception as e:
+                # Keep the turns verbatim; the next save_context retries
+                print(f"[SummaryMemory] Summary update failed: {e}")
+                with self._lock:
+                    self._future = None
+                return
+            with self._lock:
+                if restores != self._restores:
+                    # Cleared or replaced by a newer saved state meanwhile
+                    continue
+                self.summary = truncate_tokens(new, self.summary_tokens)
+                del self.folding[:len(batch)]
+                # Saved before the lock is released, so a clear() that
+                # returns has no save of the old state still to come
+                self._changed()
+
+    def wait(self, timeout=None) -> None:
+        """
+        Blocks until pending turns are folded into the summary.
+        """
+        with self._lock:
+            future = self._future
+        if future is not None:
+            future.result(timeout)
+
+    def _changed(self) -> None:
+        if self.on_change is not None:
+            self.on_change(self)
+
+    # -- persistence ----------------------------------------------------
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "revision": self.revision,
+                # Turns not folded yet are kept as recent turns
+                "turns": [list(t) for t in self.folding + list(self.turns)],
+            }
+
+    def restore(self, state: dict) -> None:
+        with self._lock:
+            self.summary = state.get("summary", "")
+            self.turns = deque(tuple(t) for t in state.get("turns", []))
+            self.folding = []
+            self._recent = sum(self._tokens(t) for t in self.turns)
+            self.revision = state.get("revision", 0)
+            self._restores += 1
+
+
+class SessionStore:
+    """
+    SQLite table of session id -> compressed SummaryMemory snapshot.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        # Readers do not wait for writers when several processes share it
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " state BLOB NOT NULL,"
+            " updated REAL NOT NULL,"
+            " revision INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")}
+        if "revision" not in columns:
+            # Stores written before revisions were tracked
+            with self.conn:
+                self.conn.execute("ALTER TABLE sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+    def load(self, session_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT state FROM sessions WHERE id = ?", (str(session_id),)
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def revision(self, session_id) -> int:
+        """
+        Revision of the saved state (-1 if there is none).
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT revision FROM sessions WHERE id = ?", (str(session_id),)
+            ).fetchone()
+        return row[0] if row else -1
+
+    def save(self, session_id, memory: SummaryMemory) -> None:
+        snapshot = memory.snapshot()
+        state = zlib.compress(json.dumps(snapshot).encode("utf-8"))
+        with self._lock, self.conn:
+            # A stale copy (e.g. a late summary from another process) must
+            # not overwrite turns saved since
+            self.conn.execute(
+                "INSERT INTO sessions (id, state, updated, revision) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET"
+                " state = excluded.state, updated = excluded.updated, revision = excluded.revision"
+                " WHERE excluded.revision >= sessions.revision",
+                (str(session_id), state, time.time(), snapshot["revision"]),
+            )
+
+    def delete(self, session_id) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE id = ?", (str(session_id),))
@@ -0,0 +1,139 @@
+"""
+dedup.py
+---------
+Near-duplicate chunk removal before embedding (MinHash + LSH).
+
+Repeated page headers and footers, boilerplate and reference lists that
+appear in several places produce chunks with almost the same text. Each
+chunk is reduced to its set of word DEDUP_SHINGLE-grams (lower-cased,
+punctuation dropped) and a MinHash signature of DEDUP_NUM_PERM values. The
+share of positions where two signatures agree estimates the Jaccard
+similarity of the two sets.
+
+Signatures are cut into DEDUP_BANDS bands (locality-sensitive hashing), and
+chunks that share a band are candidate duplicates. A chunk is dropped when
+its estimated similarity to an earlier kept chunk reaches DEDUP_THRESHOLD.
+Exact repeats always match. Neighbouring chunks only share their
+CHUNK_OVERLAP characters, far below the threshold, so the splitter's overlap
+is left alone.
+
+Deduplicator is incremental (add() one chunk at a time, in corpus order),
+so the batch ingest and the streaming build keep the same chunk: the first
+occurrence.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+from config import DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_SHINGLE, DEDUP_NUM_PERM, DEDUP_BANDS
+
+_WORD = re.compile(r"\w+")
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def settings():
+    """
+    The dedup settings recorded with ingest and streaming-build state (None
+    when dedup is off); chunks are redone when they change.
+    """
+    if not DEDUP_ENABLED:
+        return None
+    return {
+        "threshold": DEDUP_THRESHOLD,
+        "shingle": DEDUP_SHINGLE,
+        "num_perm": DEDUP_NUM_PERM,
+        "bands": DEDUP_BANDS,
+    }
+
+
+def shingle_hashes(text: str, size: int = DEDUP_SHINGLE) -> np.ndarray:
+    """
+    uint64 hashes of the distinct word size-grams of text (the whole text as
+    one shingle when it is shorter than that).
+    """
+    words = np.array([zlib.crc32(w.encode("utf-8")) for w in _WORD.findall(text.lower())], dtype=np.uint64)
+    if len(words) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    size = min(size, len(words))
+    n = len(words) - size + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(size):
+        h = h * _MIX + words[j:j + n]  # wraps mod 2**64
+    return np.unique(h)
+
+
+class Deduplicator:
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        shingle: int = DEDUP_SHINGLE,
+        num_perm: int = DEDUP_NUM_PERM,
+        bands: int = DEDUP_BANDS,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.shingle = shingle
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: h(x) = (a * x + b) >> 32, a odd
+        self._a = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        self._keys = []
+        self._signatures = []
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = shingle_hashes(text, self.shingle)
+        return ((shingles[:, None] * self._a + self._b) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+    def add(self, key, text: str):
+        """
+        Key of the kept chunk that text nearly duplicates, or None, in which
+        case text is kept under key.
+        """
+        signature = self.signature(text)
+        bands = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(len(self._buckets))]
+        candidates = set()
+        for bucket, band in zip(self._buckets, bands):
+            candidates.update(bucket.get(band, ()))
+        best, best_similarity = None, self.threshold
+        for c in sorted(candidates):
+            similarity = float(np.mean(self._signatures[c] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = c, similarity
+                if similarity == 1.0:
+                    break
+        if best is not None:
+            return self._keys[best]
+
+        row = len(self._keys)
+        self._keys.append(key)
+        self._signatures.append(signature)
+        for bucket, band in zip(self._buckets, bands):
+            bucket.setdefault(band, []).append(row)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def deduplicate(docs, dedup: Deduplicator = None):
+    """
+    (kept docs, {dropped chunk_id: chunk_id of the chunk kept instead}),
+    keeping corpus order.
+    """
+    if dedup is None:
+        dedup = Deduplicator()
+    kept, duplicates = [], {}
+    for d in docs:
+        cid = d.metadata["chunk_id"]
+        twin = dedup.add(cid, d.page_content)
+        if twin is None:
+            kept.append(d)
+        else:
+            duplicates[cid] = twin
+    return kept, duplicates
@@ -0,0 +1,268 @@
+"""
+downloader.py
+--------------
+Concurrent, resumable file downloads for ingest.download_pdfs().
+
+- One requests.Session whose connection pool is shared by DOWNLOAD_WORKERS
+  threads.
+- Responses are streamed to <file>.part in DOWNLOAD_CHUNK_BYTES blocks and
+  hashed on the way. The finished file is fsynced and renamed into place,
+  so a file at its final path is always complete.
+- An interrupted download leaves <file>.part plus <file>.part.json (URL,
+  ETag / Last-Modified, total size). The next attempt, whether a retry or a
+  later run, asks for the rest with Range + If-Range. The server sends the
+  missing bytes if the file is unchanged, or the whole new file otherwise.
+- A download only counts if its size matches Content-Length /
+  Content-Range and its SHA-256 matches PDF_SHA256 (when listed). A .pdf
+  must also start with "%PDF-", which catches HTML error pages.
+- DOWNLOAD_MANIFEST_PATH records URL, size, ETag and SHA-256 of every file.
+  On later runs a file is skipped only if it still matches. Files from
+  before the manifest existed are checked once and adopted.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from config import (
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_CONNECT_TIMEOUT_S,
+    DOWNLOAD_READ_TIMEOUT_S,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_CHUNK_BYTES,
+    DOWNLOAD_MANIFEST_PATH,
+    PDF_SHA256,
+)
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+class _Retry(Exception):
+    """
+    A failed attempt worth repeating (the .part file is kept for resume).
+    """
+
+
+def _sha256(path, h=None):
+    h = h or hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h
+
+
+class Downloader:
+    def __init__(
+        self,
+        workers: int = DOWNLOAD_WORKERS,
+        connect_timeout: float = DOWNLOAD_CONNECT_TIMEOUT_S,
+        read_timeout: float = DOWNLOAD_READ_TIMEOUT_S,
+        retries: int = DOWNLOAD_RETRIES,
+        chunk_bytes: int = DOWNLOAD_CHUNK_BYTES,
+        manifest_path=DOWNLOAD_MANIFEST_PATH,
+        expected_sha256: dict = None,
+        backoff_s: float = 0.5,
+    ):
+        self.workers = max(1, workers)
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.chunk_bytes = chunk_bytes
+        self.backoff_s = backoff_s
+        self.expected = PDF_SHA256 if expected_sha256 is None else expected_sha256
+        self.manifest_path = Path(manifest_path)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Byte ranges must refer to the file itself, not a compressed stream
+        self.session.headers["Accept-Encoding"] = "identity"
+
+        self._lock = threading.Lock()
+        self.manifest = {}
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+
+    # -- manifest -------------------------------------------------------
+    def _record(self, path: Path, **fields) -> None:
+        st = path.stat()
+        with self._lock:
+            self.manifest[path.name] = {**fields, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            tmp = self.manifest_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+            tmp.replace(self.manifest_path)
+
+    def _check(self, name: str, data: Path, digest: str) -> None:
+        """
+        Raises DownloadError if data (the file or its .part) is not a good
+        copy of name.
+        """
+        expected = self.expected.get(name)
+        if expected and digest != expected:
+            raise DownloadError(f"{name}: SHA-256 {digest[:12]}... does not match the expected {expected[:12]}...")
+        if name.lower().endswith(".pdf"):
+            with open(data, "rb") as f:
+                if f.read(5) != b"%PDF-":
+                    raise DownloadError(f"{name}: not a PDF")
+
+    def is_complete(self, url: str, path: Path) -> bool:
+        """
+        True if path holds the finished download of url.
+        """
+        if not path.exists():
+            return False
+        record = self.manifest.get(path.name)
+        st = path.stat()
+        if record is not None:
+            if record.get("url") != url or record.get("size") != st.st_size:
+                return False
+            if record.get("mtime_ns") == st.st_mtime_ns:
+                return True
+            # Touched since it was recorded: the hash decides
+            return _sha256(path).hexdigest() == record.get("sha256")
+
+        # Fetched before the manifest existed
+        digest = _sha256(path).hexdigest()
+        try:
+            self._check(path.name, path, digest)
+        except DownloadError as e:
+            print(f"[Downloader] {e}; downloading again")
+            return False
+        self._record(path, url=url, sha256=digest, etag=None)
+        return True
+
+    # -- download -------------------------------------------------------
+    def download(self, url: str, path) -> str:
+        """
+        Makes sure path holds url. Returns "present", "downloaded" or
+        "resumed"; raises DownloadError when every attempt failed.
+        """
+        path = Path(path)
+        if self.is_complete(url, path):
+            return "present"
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff_s * 2 ** (attempt - 1)
+                metrics.count("download.retries")
+                print(f"[Downloader] {path.name}: {error}; retrying in {delay:.2f}s")
+                time.sleep(delay)
+            try:
+                with metrics.span("download.file", file=path.name):
+                    return self._fetch(url, path)
+            except (_Retry, requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+        raise DownloadError(f"{path.name}: failed after {self.retries + 1} attempts: {error}")
+
+    def _fetch(self, url: str, path: Path) -> str:
+        part = path.with_name(path.name + ".part")
+        state_path = path.with_name(path.name + ".part.json")
+
+        state = None
+        if part.exists() and state_path.exists():
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            if state.get("url") != url:
+                state = None
+        offset = part.stat().st_size if state else 0
+        validator = state and (state.get("etag") or state.get("last_modified"))
+
+        headers = {}
+        if offset and validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if r.status_code == 416:
+                # Nothing left to send for our offset: the .part is stale
+                part.unlink(missing_ok=True)
+                state_path.unlink(missing_ok=True)
+                raise _Retry("range not satisfiable; starting over")
+            if r.status_code in _RETRY_STATUS:
+                raise _Retry(f"HTTP {r.status_code}")
+            if r.status_code >= 400:
+                raise DownloadError(f"{path.name}: HTTP {r.status_code} for {url}")
+
+            resumed = r.status_code == 206
+            if resumed:
+                # "bytes start-end/total"
+                span, _, total = r.headers.get("Content-Range", "").partition("/")
+                if not span.startswith(f"bytes {offset}-"):
+                    part.unlink(missing_ok=True)
+                    raise _Retry(f"unexpected Content-Range {r.headers.get('Content-Range')!r}")
+                total = int(total) if total.isdigit() else None
+            else:
+                offset = 0
+                length = r.headers.get("Content-Length")
+                total = int(length) if length and length.isdigit() else None
+
+            state = {
+                "url": url,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "size": total,
+            }
+            state_path.write_text(json.dumps(state), encoding="utf-8")
+
+            h = _sha256(part) if resumed else hashlib.sha256()
+            with open(part, "ab" if resumed else "wb") as f:
+                for block in r.iter_content(self.chunk_bytes):
+                    f.write(block)
+                    h.update(block)
+                    metrics.count("download.bytes", len(block))
+                f.flush()
+                os.fsync(f.fileno())
+
+        size = part.stat().st_size
+        if total is not None and size != total:
+            raise _Retry(f"got {size} of {total} bytes")
+        digest = h.hexdigest()
+        try:
+            self._check(path.name, part, digest)
+        except DownloadError:
+            part.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            raise
+
+        os.replace(part, path)
+        state_path.unlink(missing_ok=True)
+        self._record(path, url=url, sha256=digest, etag=state["etag"])
+        return "resumed" if resumed else "downloaded"
+
+    def download_all(self, items) -> dict:
+        """
+        Downloads (url, path) pairs, DOWNLOAD_WORKERS at a time. Returns
+        {file name: status}; raises DownloadError listing the files that
+        failed, after the others have finished.
+        """
+        items = [(url, Path(path)) for url, path in items]
+        results, failed = {}, []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items) or 1)) as pool:
+            futures = {pool.submit(self.download, url, path): path for url, path in items}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path.name] = future.result()
+                except DownloadError as e:
+                    print(f"[Downloader] {e}")
+                    failed.append(path.name)
+                    continue
+                print(f"[Downloader] {path.name}: {results[path.name]}")
+        if failed:
+            raise DownloadError(f"{len(failed)} download(s) failed: {', '.join(sorted(failed))}")
+        return results
+
+    def close(self) -> None:
+        self.session.close()
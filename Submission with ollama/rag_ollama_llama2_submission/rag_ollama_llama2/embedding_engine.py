@@ -0,0 +1,174 @@
+"""
+embedding_engine.py
+--------------------
+Batched, cached sentence-transformers embeddings.
+
+EmbeddingEngine is a LangChain Embeddings object (it replaces
+HuggingFaceEmbeddings in vector_store.py) that adds:
+- a configurable encode batch size and torch intra-op thread count,
+- optional L2 normalisation,
+- length-sorted batching, so texts in a batch pad to similar lengths,
+- a persistent SQLite cache keyed by (model name, SHA-256 of the text), so
+  unchanged chunks are never re-encoded across builds.
+"""
+
+import functools
+import hashlib
+import sqlite3
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBED_ENCODE_BATCH_SIZE,
+    EMBED_NORMALIZE,
+    EMBED_TORCH_THREADS,
+    EMBEDDING_CACHE_PATH,
+)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(model_name: str = EMBEDDING_MODEL_NAME, normalize: bool = EMBED_NORMALIZE) -> str:
+    """
+    Names the vector space of a model's embeddings in caches: normalised and
+    raw vectors must not share cache entries.
+    """
+    return f"{model_name}|normalized" if normalize else model_name
+
+
+class EmbeddingCache:
+    """
+    float32 vectors in SQLite, keyed by (model key, text hash).
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+
+    def get_many(self, model: str, hashes) -> dict:
+        found = {}
+        hashes = list(hashes)
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            rows = self.conn.execute(
+                "SELECT text_hash, vector FROM embeddings"
+                f" WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                [model, *part],
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: dict) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()],
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    sentence-transformers encoder with batching, thread control and a
+    persistent per-text cache. Pass cache_path=None to disable the cache.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        batch_size: int = EMBED_ENCODE_BATCH_SIZE,
+        normalize: bool = EMBED_NORMALIZE,
+        num_threads: int = EMBED_TORCH_THREADS,
+        cache_path=EMBEDDING_CACHE_PATH,
+    ):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self._cache_key = cache_key(model_name, normalize)
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def _encode(self, texts) -> np.ndarray:
+        """
+        Encodes texts longest-first in batch_size slices, then restores the
+        caller's order.
+        """
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            out[idx] = self.model.encode(
+                [texts[i] for i in idx],
+                batch_size=self.batch_size,
+                normalize_embeddings=self.normalize,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return out
+
+    def embed_array(self, texts) -> np.ndarray:
+        """
+        (len(texts), dim) float32 array; cached texts are not re-encoded.
+        """
+        texts = list(texts)
+        if self.cache is None:
+            self.misses += len(texts)
+            return self._encode(texts)
+
+        hashes = [text_hash(t) for t in texts]
+        cached = self.cache.get_many(self._cache_key, set(hashes))
+
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached:
+                missing.setdefault(h, t)
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            new = dict(zip(missing, vectors))
+            self.cache.put_many(self._cache_key, new)
+            cached.update(new)
+
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            out[i] = cached[h]
+        return out
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_engine(model_name: str = EMBEDDING_MODEL_NAME) -> EmbeddingEngine:
+    """
+    Process-wide, cache-less engine for query embedding; the model is loaded
+    once however many stores or bots ask for it.
+    """
+    return EmbeddingEngine(model_name, cache_path=None)
@@ -4,80 +4,119 @@ evaluation.py
 Task 5: 10-question interaction + simple evaluation (no ragas dependency).
 
 What this script does:
-- Uses the SAME RAGBot as run_chat.py (same personality & behaviour).
-- Asks 10 questions loaded from questions.json.
+- Uses the SAME RAGBot prompt and LLM as run_chat.py (same personality &
+  behaviour); each question is answered on its own, without chat history.
+- Asks the questions loaded from questions.json (10 by default; the runner
+  scales to eval sets of thousands):
+    * retrieval for a batch of EVAL_BATCH_SIZE questions is one batched
+      embedding pass + one FAISS search, done while the previous batch is
+      still generating
+    * answers are generated concurrently, EVAL_WORKERS at a time
 - For each question:
-    * calls bot.ask(question)
-    * collects the answer and retrieved context snippets
+    * collects the answer and the retrieved context snippets
     * computes simple metrics:
         - relevance_score: 0.0 / 0.5 / 1.0 based on answer length
         - answer_length: length of the answer text
         - context_count: how many context chunks were used
-- Aggregates averages across all 10 questions.
+- Each finished record is appended to artifacts/eval_records.jsonl, so an
+  interrupted run picks up where it stopped (--restart starts over).
+- Aggregates averages across all questions.
 - Saves everything into artifacts/eval_results.json with:
     * "scores"   – RAGAS-style metric names
     * "summary"  – our custom aggregate metrics
     * "records"  – per-question Q/A + metrics
+    * "timings"  – per-stage latency (count, mean, p50/p95/p99) and
+                   counters from metrics.py, for the questions answered
+                   in this run
 
 This satisfies the assignment requirement:
 “You may design your own evaluation metric, but ensure you clearly
 document the criteria and methodology.”
 """
 
+import argparse
+import asyncio
 import json
 import statistics
 from typing import List, Dict, Any
 
+import metrics
 from chatbot import RAGBot
-from config import EVAL_RESULTS_PATH
-
-
-def run_evaluation(questions: List[str]) -> Dict[str, Any]:
-    # Use SAME bot as run_chat.py, so personality & behaviour stay identical
-    bot = RAGBot()
-
-    records = []
-
-    for q in questions:
-        print(f"[evaluation] Asking: {q}")
-        res = bot.ask(q)
-
-        # RAGBot.ask(...) returns a dict with keys: "answer", "source_documents"
-        if isinstance(res, dict):
-            answer = res.get("answer", "") or ""
-            contexts = RAGBot.extract_context_snippets(res)
-        else:
-            # very defensive fallback
-            answer = str(res)
-            contexts = []
-
-        answer_text = answer.strip()
-        length = len(answer_text)
-
-        # --- Simple custom "relevance" metric based on answer length ---
-        # 0.0   -> empty answer
-        # 0.5   -> very short answer
-        # 1.0   -> reasonably long answer (>= 30 chars)
-        if length == 0:
-            relevance = 0.0
-        elif length < 30:
-            relevance = 0.5
-        else:
-            relevance = 1.0
-
-        record = {
-            "question": q,
-            "answer": answer_text,
-            "contexts": contexts,
-            "metrics": {
-                "relevance_score": relevance,
-                "answer_length": length,
-                "context_count": len(contexts),
-            },
-        }
-        records.append(record)
-
-    # ---- Aggregate summary across all 10 questions ----
+from config import EVAL_RESULTS_PATH, EVAL_CHECKPOINT_PATH, EVAL_BATCH_SIZE, EVAL_WORKERS
+
+
+def make_record(index: int, question: str, answer: str, contexts: List[str]) -> Dict[str, Any]:
+    answer_text = answer.strip()
+    length = len(answer_text)
+
+    # --- Simple custom "relevance" metric based on answer length ---
+    # 0.0   -> empty answer
+    # 0.5   -> very short answer
+    # 1.0   -> reasonably long answer (>= 30 chars)
+    if length == 0:
+        relevance = 0.0
+    elif length < 30:
+        relevance = 0.5
+    else:
+        relevance = 1.0
+
+    return {
+        "index": index,
+        "question": question,
+        "answer": answer_text,
+        "contexts": contexts,
+        "metrics": {
+            "relevance_score": relevance,
+            "answer_length": length,
+            "context_count": len(contexts),
+        },
+    }
+
+
+def load_checkpoint(questions: List[str]) -> Dict[int, Dict[str, Any]]:
+    """
+    Records already answered for these questions, by question index.
+    """
+    done = {}
+    if not EVAL_CHECKPOINT_PATH.exists():
+        return done
+    with open(EVAL_CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            i = record.get("index")
+            if isinstance(i, int) and i < len(questions) and questions[i] == record["question"]:
+                done[i] = record
+    return done
+
+
+async def _answer_all(bot: RAGBot, pending: List[int], questions: List[str], batch_size: int, out) -> None:
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    async def answer(i, docs):
+        text = await bot.agenerate(questions[i], docs)
+        record = make_record(i, questions[i], text, [d.page_content for d in docs])
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        print(f"[evaluation] Answered {i + 1}/{len(questions)}: {questions[i]}")
+
+    def retrieve(batch):
+        with metrics.span("eval.retrieve_batch", n=len(batch)):
+            return bot.retrieve_batch([questions[i] for i in batch], k=3)
+
+    # Retrieval for batch b+1 runs in a thread while batch b generates
+    next_docs = asyncio.create_task(asyncio.to_thread(retrieve, batches[0]))
+    for b, batch in enumerate(batches):
+        docs = await next_docs
+        if b + 1 < len(batches):
+            next_docs = asyncio.create_task(asyncio.to_thread(retrieve, batches[b + 1]))
+        await asyncio.gather(*(answer(i, d) for i, d in zip(batch, docs)))
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # ---- Aggregate summary across all questions ----
     rels = [r["metrics"]["relevance_score"] for r in records]
     lens = [r["metrics"]["answer_length"] for r in records]
     ctxs = [r["metrics"]["context_count"] for r in records]
@@ -101,22 +140,70 @@ def run_evaluation(questions: List[str]) -> Dict[str, Any]:
         "context_recall": min(1.0, summary["avg_context_count"] / 3.0),
     }
 
-    payload = {
+    return {
         "scores": scores,
         "summary": summary,
         "records": records,
     }
 
+
+def run_evaluation(
+    questions: List[str],
+    workers: int = EVAL_WORKERS,
+    batch_size: int = EVAL_BATCH_SIZE,
+    restart: bool = False,
+    llm=None,
+) -> Dict[str, Any]:
+    # Use SAME prompt + LLM as run_chat.py, so personality & behaviour stay identical
+    bot = RAGBot(llm=llm, max_concurrency=workers)
+
+    if restart and EVAL_CHECKPOINT_PATH.exists():
+        EVAL_CHECKPOINT_PATH.unlink()
+    done = load_checkpoint(questions)
+    pending = [i for i in range(len(questions)) if i not in done]
+    if done:
+        print(f"[evaluation] Resuming: {len(done)} of {len(questions)} questions already answered")
+
+    # Per-stage timings are always recorded for an evaluation run
+    was_enabled = metrics.enabled()
+    if not was_enabled:
+        metrics.enable()
+    metrics.reset()
+    try:
+        if pending:
+            EVAL_CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+            with open(EVAL_CHECKPOINT_PATH, "a", encoding="utf-8") as out:
+                with metrics.span("eval.run", questions=len(pending)):
+                    asyncio.run(_answer_all(bot, pending, questions, batch_size, out))
+            done = load_checkpoint(questions)
+        timings = metrics.stats()
+    finally:
+        if not was_enabled:
+            metrics.disable()
+
+    records = [done[i] for i in range(len(questions))]
+    payload = summarize(records)
+    payload["timings"] = {"questions_timed": len(pending), **timings}
+
     # Save under artifacts/eval_results.json (as defined in config.py)
     EVAL_RESULTS_PATH.write_text(json.dumps(payload, indent=2), encoding="utf-8")
     print(f"[evaluation] Saved evaluation results to {EVAL_RESULTS_PATH}")
+    if pending:
+        metrics.print_stats()
 
     return payload
 
 
 if __name__ == "__main__":
-    # Load 10 test questions from questions.json
-    with open("questions.json", "r", encoding="utf-8") as f:
+    parser = argparse.ArgumentParser(description="Evaluate the RAG bot on a question set.")
+    parser.add_argument("--questions", default="questions.json", help="JSON list of questions")
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS, help="concurrent generations")
+    parser.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE, help="questions per batched retrieval")
+    parser.add_argument("--restart", action="store_true", help="ignore records from an earlier run")
+    args = parser.parse_args()
+
+    # Load test questions (10 by default) from questions.json
+    with open(args.questions, "r", encoding="utf-8") as f:
         questions = json.load(f)
 
-    run_evaluation(questions)
+    run_evaluation(questions, workers=args.workers, batch_size=args.batch_size, restart=args.restart)
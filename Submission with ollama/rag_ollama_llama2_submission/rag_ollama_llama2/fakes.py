@@ -0,0 +1,348 @@
+"""
+fakes.py
+---------
+Local stand-ins for external services, for benchmarks and tests.
+
+FakeLLM replaces the Ollama LLM in RAGBot(llm=...): it answers
+deterministically from the prompt after a fixed delay, in both the sync
+and async LangChain paths, so the rest of the pipeline runs for real.
+Streaming yields the answer word by word, the first after `latency`
+seconds and each further one after `token_delay` seconds. It records every
+prompt and how many generations ran at once (calls, active, peak).
+
+FakeOllamaServer is a local HTTP server speaking the part of the Ollama API
+the client uses (POST /api/generate, streamed or not, and GET /api/tags),
+with the same answers and timing as FakeLLM. It counts requests and TCP
+connections, and can fail its first requests with 503 or break off their
+streams after the first token, to exercise ollama_client.py (pooling,
+keep-alive, retries) without Ollama:
+
+    with FakeOllamaServer(latency=0.2) as server:
+        client = OllamaClient(base_url=server.url)
+
+FakeFileServer serves in-memory files over HTTP/1.1 with ETag, Range /
+If-Range and HEAD support, at a capped bandwidth per response. It can cut
+a file's first response short or answer the first requests with 503, to
+exercise downloader.py (parallelism, resume, retries) without a network:
+
+    with FakeFileServer({"a.pdf": data}, bandwidth=2e6) as server:
+        Downloader().download(server.url + "/a.pdf", path)
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+
+_counter_lock = threading.Lock()
+
+
+class FakeLLM(LLM):
+    latency: float = 0.0  # seconds to the first token
+    token_delay: float = 0.0  # seconds per further token
+    calls: int = 0  # generations started
+    active: int = 0  # generations in progress
+    peak: int = 0  # most generations in progress at once
+    prompts: List[str] = []  # every prompt, in call order
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @staticmethod
+    def answer_for(prompt: str) -> str:
+        question = ""
+        for line in prompt.splitlines():
+            if line.startswith("User:"):
+                question = line[len("User:"):].strip()
+        return f"Fake answer to: {question}"
+
+    @classmethod
+    def tokens_for(cls, prompt: str) -> List[str]:
+        words = cls.answer_for(prompt).split(" ")
+        return [words[0]] + [" " + w for w in words[1:]]
+
+    @contextlib.contextmanager
+    def _generating(self, prompt: str):
+        with _counter_lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.prompts.append(prompt)
+        try:
+            yield
+        finally:
+            with _counter_lock:
+                self.active -= 1
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        tokens = self.tokens_for(prompt)
+        with self._generating(prompt):
+            time.sleep(self.latency + self.token_delay * (len(tokens) - 1))
+        return "".join(tokens)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        tokens = self.tokens_for(prompt)
+        with self._generating(prompt):
+            await asyncio.sleep(self.latency + self.token_delay * (len(tokens) - 1))
+        return "".join(tokens)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        with self._generating(prompt):
+            for i, token in enumerate(self.tokens_for(prompt)):
+                time.sleep(self.token_delay if i else self.latency)
+                yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        with self._generating(prompt):
+            for i, token in enumerate(self.tokens_for(prompt)):
+                await asyncio.sleep(self.token_delay if i else self.latency)
+                yield GenerationChunk(text=token)
+
+
+class FakeFileServer:
+    def __init__(self, files: dict, latency: float = 0.0, bandwidth: float = 0.0, truncate: dict = None, fail_first: int = 0):
+        self.files = dict(files)  # name -> bytes
+        self.latency = latency  # before each response
+        self.bandwidth = bandwidth  # bytes per second per response (0 = unlimited)
+        self.truncate = dict(truncate or {})  # name -> bytes sent before the first response is cut
+        self.fail_first = fail_first  # requests answered with 503 first
+        self.requests = []  # (method, name, Range header) per request
+        self.connections = 0
+        self.bytes_sent = 0
+        self.url = None
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def etag(self, name: str) -> str:
+        return '"%s"' % hashlib.sha256(self.files[name]).hexdigest()[:16]
+
+    def start(self) -> "FakeFileServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _empty(self, status: int, headers=()) -> None:
+                self.send_response(status)
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _range(self, size: int):
+                """
+                (start, end) of a single "bytes=a-" / "bytes=a-b" range, or
+                None to send the whole file.
+                """
+                spec = self.headers.get("Range", "")
+                if not spec.startswith("bytes=") or "," in spec:
+                    return None
+                first, _, last = spec[len("bytes="):].partition("-")
+                if not first.isdigit():
+                    return None
+                return int(first), min(int(last), size - 1) if last.isdigit() else size - 1
+
+            def _serve(self, body: bool) -> None:
+                name = self.path.lstrip("/")
+                with fake._lock:
+                    fake.requests.append((self.command, name, self.headers.get("Range")))
+                    fail = len(fake.requests) <= fake.fail_first
+                    cut = fake.truncate.pop(name, None) if body else None
+                time.sleep(fake.latency)
+                if fail:
+                    self._empty(503, [("Retry-After", "1")])
+                    return
+                if name not in fake.files:
+                    self._empty(404)
+                    return
+                data, etag = fake.files[name], fake.etag(name)
+                if self.headers.get("If-None-Match") == etag:
+                    self._empty(304, [("ETag", etag)])
+                    return
+
+                span = self._range(len(data))
+                if_range = self.headers.get("If-Range")
+                if span is not None and if_range is not None and if_range != etag:
+                    span = None  # changed since the client's copy: send it all
+                if span is not None and span[0] >= len(data):
+                    self._empty(416, [("Content-Range", f"bytes */{len(data)}")])
+                    return
+                start, end = span or (0, len(data) - 1)
+                self.send_response(206 if span else 200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("ETag", etag)
+                self.send_header("Accept-Ranges", "bytes")
+                if span:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                if cut is not None:
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                if not body:
+                    return
+
+                payload = data[start:end + 1]
+                if cut is not None:
+                    payload = payload[:cut]
+                    self.close_connection = True
+                step = 1 << 14
+                for i in range(0, len(payload), step):
+                    block = payload[i:i + step]
+                    if fake.bandwidth:
+                        time.sleep(len(block) / fake.bandwidth)
+                    self.wfile.write(block)
+                    with fake._lock:
+                        fake.bytes_sent += len(block)
+
+            def do_GET(self):
+                self._serve(body=True)
+
+            def do_HEAD(self):
+                self._serve(body=False)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FakeFileServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class FakeOllamaServer:
+    def __init__(self, latency: float = 0.0, token_delay: float = 0.0, fail_first: int = 0,
+                 fail_streams: int = 0, model: str = "llama2"):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.fail_first = fail_first  # generate requests answered with 503 first
+        self.fail_streams = fail_streams  # streams ended by an error after their first token
+        self.model = model
+        self.bodies = []  # JSON body of every generate request
+        self.connections = 0
+        self.url = None
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def start(self) -> "FakeOllamaServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            disable_nagle_algorithm = True  # like Ollama's Go server
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, payload: dict) -> None:
+                data = json.dumps(payload).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": f"{fake.model}:latest", "model": f"{fake.model}:latest"}]})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path != "/api/generate":
+                    self._json(404, {"error": "not found"})
+                    return
+                with fake._lock:
+                    fake.bodies.append(body)
+                    fail = len(fake.bodies) <= fake.fail_first
+                if fail:
+                    self._json(503, {"error": "server busy, please try again"})
+                    return
+                if body.get("model", "").split(":")[0] != fake.model:
+                    self._json(404, {"error": f"model '{body.get('model')}' not found, try pulling it first"})
+                    return
+
+                prompt = body.get("prompt", "")
+                done = {"model": body["model"], "done": True, "response": "", "load_duration": 0}
+                if not prompt:
+                    self._json(200, {**done, "done_reason": "load"})
+                    return
+                tokens = FakeLLM.tokens_for(prompt)
+                done.update(done_reason="stop", prompt_eval_count=len(prompt) // 4, eval_count=len(tokens))
+                stream = body.get("stream", True)
+                with fake._lock:
+                    broken = stream and fake.fail_streams > 0
+                    fake.fail_streams -= broken
+                if not stream:
+                    time.sleep(fake.latency + fake.token_delay * (len(tokens) - 1))
+                    self._json(200, {**done, "response": "".join(tokens)})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    time.sleep(fake.token_delay if i else fake.latency)
+                    self._chunk({"model": body["model"], "response": token, "done": False})
+                    if broken:
+                        break
+                # Ollama reports a failure mid-stream as an error record
+                self._chunk({"error": "model runner has unexpectedly stopped"} if broken else done)
+                self.wfile.write(b"0\r\n\r\n")
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
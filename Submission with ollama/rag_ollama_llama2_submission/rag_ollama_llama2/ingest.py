@@ -1,65 +1,310 @@
 """
 ingest.py
 ----------
-1. Downloads the 5 assignment PDFs if not already present.
+1. Downloads the 5 assignment PDFs if not already present (downloader.py:
+   in parallel, resumable, verified against data/downloads.json).
 2. Extracts text using LangChain's PyPDFLoader.
-3. Splits into semantic chunks.
-4. Saves chunks and embedding model config to disk.
+3. Splits into semantic chunks, optionally one PDF per process.
+4. With DEDUP_ENABLED, drops near-duplicate chunks (dedup.py), so they are
+   never embedded, indexed or retrieved.
+5. Saves chunks to a memory-mapped chunk store (artifacts/chunks/).
+
+Re-runs are incremental: artifacts/manifest.json records a content hash per
+PDF and a content-derived ID per chunk, so unchanged PDFs reuse their chunks
+from the previous run and only new or changed PDFs are parsed again.
 """
 
-import requests
-import pickle
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from config import PDF_URLS, PDF_FILES, DATA_DIR, CHUNKS_PATH, EMBEDDING_MODEL_NAME
+import dedup
+import metrics
+from chunk_store import ChunkStore, write_chunk_store
+from downloader import Downloader
+from config import (
+    PDF_URLS,
+    PDF_FILES,
+    DATA_DIR,
+    DOWNLOAD_WORKERS,
+    CHUNK_STORE_DIR,
+    MANIFEST_PATH,
+    EMBEDDING_MODEL_NAME,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    INGEST_WORKERS,
+    DEDUP_ENABLED,
+)
 
 
-def download_pdfs() -> None:
+def download_pdfs(workers: int = DOWNLOAD_WORKERS) -> None:
     DATA_DIR.mkdir(exist_ok=True, parents=True)
-    for url, path in zip(PDF_URLS, PDF_FILES):
-        if path.exists():
-            print(f"[download_pdfs] Already present: {path.name}")
-            continue
-        print(f"[download_pdfs] Downloading {url} -> {path}")
-        resp = requests.get(url)
-        resp.raise_for_status()
-        path.write_bytes(resp.content)
+    downloader = Downloader(workers=workers)
+    try:
+        with metrics.span("ingest.download"):
+            downloader.download_all(zip(PDF_URLS, PDF_FILES))
+    finally:
+        downloader.close()
     print("[download_pdfs] All PDFs ready.")
 
 
-def load_and_chunk() -> None:
+def file_sha256(path) -> str:
     """
-    Loads the 5 PDFs, turns them into LangChain Documents, and chunks them.
+    SHA-256 of a file's bytes, read in 1 MiB blocks.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def assign_chunk_ids(chunks, file_name: str) -> None:
+    """
+    Stores a content-derived ID in each chunk's metadata["chunk_id"].
+
+    The ID hashes file name, page and text, so an unchanged chunk keeps the
+    same ID across runs (and its vector can be kept in the index). Repeats of
+    the same text on the same page get a "-1", "-2", ... suffix.
+    """
+    seen = {}
+    for d in chunks:
+        key = f"{file_name}\x00{d.metadata.get('page', 0)}\x00{d.page_content}"
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        d.metadata["chunk_id"] = digest if n == 0 else f"{digest}-{n}"
+
+
+def load_manifest() -> dict:
+    if not MANIFEST_PATH.exists():
+        return {}
+    return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+
+
+def save_manifest(manifest: dict) -> None:
+    MANIFEST_PATH.parent.mkdir(exist_ok=True, parents=True)
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
+def _open_previous_chunks():
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=150,
+    Chunk store from the last run, or None if there is none.
+    """
+    if not ChunkStore.exists(CHUNK_STORE_DIR):
+        return None
+    return ChunkStore(CHUNK_STORE_DIR)
+
+
+def _make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
         separators=["\n\n", "\n", ". ", " ", ""],
     )
 
-    docs = []
+
+def iter_pages(start=None):
+    """
+    Yields the pages of all PDFs one at a time, so only a single page of
+    text is held in memory. start=(file name, page) begins mid-corpus (the
+    pages before it in that file are still read, and skipped).
+    """
+    paths = [p for p in PDF_FILES if p.exists()]
+    if start is not None:
+        names = [p.name for p in paths]
+        paths = paths[names.index(start[0]):]
+
+    for n, path in enumerate(paths):
+        pages = PyPDFLoader(str(path)).lazy_load()
+        first = start[1] if start is not None and n == 0 else 0
+        yield from itertools.islice(pages, first, None)
+
+
+def iter_chunks(start=None):
+    """
+    Streaming counterpart of load_and_chunk(): yields chunks page by page,
+    with the same chunk IDs the batch path assigns.
+    """
+    splitter = _make_splitter()
+    for page in iter_pages(start):
+        chunks = splitter.split_documents([page])
+        assign_chunk_ids(chunks, Path(page.metadata["source"]).name)
+        yield from chunks
+
+
+def _chunk_pdf(path: str) -> list:
+    """
+    Worker entry point: load one PDF with PyPDFLoader and chunk it.
+    """
+    return _make_splitter().split_documents(PyPDFLoader(path).load())
+
+
+def _parse_pdfs(paths, workers: int) -> dict:
+    """
+    Chunks the given PDFs and returns {file name: chunks}.
+
+    With workers > 1 each PDF is chunked in its own process, largest first
+    so a big file does not start last. Every worker runs the same
+    PyPDFLoader + splitter pass as the serial path, and chunk IDs are
+    assigned afterwards per file, so chunks, their order and their IDs
+    match the serial path exactly.
+    """
+    if workers > 1 and len(paths) > 1:
+        workers = min(workers, len(paths))
+        print(f"[load_and_chunk] Chunking {len(paths)} PDFs on {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                path.name: pool.submit(_chunk_pdf, str(path))
+                for path in sorted(paths, key=lambda p: p.stat().st_size, reverse=True)
+            }
+            parsed = {path.name: futures[path.name].result() for path in paths}
+    else:
+        parsed = {path.name: _chunk_pdf(str(path)) for path in paths}
+
+    for path in paths:
+        assign_chunk_ids(parsed[path.name], path.name)
+    return parsed
+
+
+def load_and_chunk(full: bool = False, workers: int = INGEST_WORKERS) -> None:
+    """
+    Loads the 5 PDFs, turns them into LangChain Documents, and chunks them.
+
+    PDFs whose content hash matches the manifest reuse their previous chunks.
+    Pass full=True to ignore the manifest and re-parse everything.
+    workers=0 uses one process per CPU; workers=1 stays serial.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunking = {
+        "loader": "PyPDFLoader",
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "dedup": dedup.settings(),
+    }
+
+    manifest = load_manifest()
+    old_files = {}
+    if not full and manifest.get("chunking") == chunking:
+        old_files = manifest.get("files", {})
+    previous = _open_previous_chunks() if old_files else None
+    previous_rows = {}
+    if previous is not None:
+        previous_rows = {cid: i for i, cid in enumerate(previous.chunk_ids())}
+
+    present = []
+    digests = {}
+    unchanged = set()
     for path in PDF_FILES:
-        print(f"[load_and_chunk] Loading {path.name}")
-        loader = PyPDFLoader(str(path))
-        pages = loader.load()
-        chunks = splitter.split_documents(pages)
-        print(f"  -> {len(chunks)} chunks")
-        docs.extend(chunks)
+        if not path.exists():
+            print(f"[load_and_chunk] Missing, skipping: {path.name}")
+            continue
+        present.append(path)
+
+        with metrics.span("ingest.hash", file=path.name):
+            digests[path.name] = digest = file_sha256(path)
+        entry = old_files.get(path.name)
+        if (
+            entry
+            and entry["sha256"] == digest
+            and all(cid in previous_rows for cid in entry["chunk_ids"])
+        ):
+            unchanged.add(path.name)
+
+    # A file's dropped duplicates stand for chunks that may live in another
+    # file; reuse it only if those chunks are reused too
+    owner = {cid: name for name, entry in old_files.items() for cid in entry["chunk_ids"]}
+    changed = True
+    while changed:
+        changed = False
+        for name in sorted(unchanged):
+            if any(owner.get(t) not in unchanged for t in old_files[name].get("duplicates", {}).values()):
+                unchanged.discard(name)
+                changed = True
+
+    reused = {}
+    for path in present:
+        if path.name in unchanged:
+            reused[path.name] = [
+                previous.document(previous_rows[cid]) for cid in old_files[path.name]["chunk_ids"]
+            ]
+            print(f"[load_and_chunk] Unchanged: {path.name} ({len(reused[path.name])} chunks reused)")
+        else:
+            print(f"[load_and_chunk] Loading {path.name}")
+
+    if previous is not None:
+        previous.close()
+
+    to_parse = [p for p in present if p.name not in reused]
+    with metrics.span("ingest.parse", files=len(to_parse), workers=workers):
+        parsed = _parse_pdfs(to_parse, workers)
+
+    by_file = {}
+    duplicates = {}
+    for path in present:
+        if path.name in reused:
+            by_file[path.name] = reused[path.name]
+            duplicates.update(old_files[path.name].get("duplicates", {}))
+        else:
+            by_file[path.name] = parsed[path.name]
+            print(f"  {path.name} -> {len(parsed[path.name])} chunks")
+    docs = [d for chunks in by_file.values() for d in chunks]
+
+    if DEDUP_ENABLED:
+        with metrics.span("ingest.dedup", chunks=len(docs)):
+            kept, dropped = dedup.deduplicate(docs)
+        chars = sum(len(d.page_content) for d in docs) - sum(len(d.page_content) for d in kept)
+        print(
+            f"[load_and_chunk] Dropped {len(dropped)} near-duplicate chunks of {len(docs)} "
+            f"({len(dropped) / max(1, len(docs)):.1%}, {chars} characters not embedded)"
+        )
+        metrics.count("ingest.duplicates", len(dropped))
+        duplicates.update(dropped)
+        docs = kept
+    kept_ids = {d.metadata["chunk_id"] for d in docs}
+    for cid, twin in duplicates.items():
+        # A reused duplicate's twin may itself have been dropped this time
+        while twin not in kept_ids and twin in duplicates:
+            twin = duplicates[twin]
+        duplicates[cid] = twin
+
+    files = {}
+    for path in present:
+        ids = [d.metadata["chunk_id"] for d in by_file[path.name]]
+        if path.name in reused:
+            ids += list(old_files[path.name].get("duplicates", {}))
+        files[path.name] = {
+            "sha256": digests[path.name],
+            "size": path.stat().st_size,
+            "chunk_ids": [cid for cid in ids if cid in kept_ids],
+            "duplicates": {cid: duplicates[cid] for cid in ids if cid in duplicates},
+        }
+
+    for name in sorted(set(old_files) - set(files)):
+        print(f"[load_and_chunk] Removed since last run: {name}")
 
     print(f"[load_and_chunk] Total chunks: {len(docs)}")
+    metrics.count("ingest.chunks", len(docs))
+    metrics.count("ingest.chunks_reused", sum(len(c) for c in reused.values()))
 
-    payload = {
-        "docs": docs,
-        "embedding_model_name": EMBEDDING_MODEL_NAME,
-    }
-    CHUNKS_PATH.parent.mkdir(exist_ok=True, parents=True)
-    with open(CHUNKS_PATH, "wb") as f:
-        pickle.dump(payload, f)
+    with metrics.span("ingest.write_store", chunks=len(docs)):
+        write_chunk_store(CHUNK_STORE_DIR, docs)
 
-    print(f"[load_and_chunk] Saved chunks to {CHUNKS_PATH}")
+    manifest["embedding_model_name"] = EMBEDDING_MODEL_NAME
+    manifest["chunking"] = chunking
+    manifest["files"] = files
+    manifest["dedup"] = {"chunks": len(docs) + len(duplicates), "removed": len(duplicates)}
+    save_manifest(manifest)
+
+    print(f"[load_and_chunk] Saved chunks to {CHUNK_STORE_DIR}")
 
 
 def preview_chunks(n: int = 3) -> None:
@@ -68,17 +313,26 @@ def preview_chunks(n: int = 3) -> None:
     """
     import textwrap
 
-    with open(CHUNKS_PATH, "rb") as f:
-        payload = pickle.load(f)
-
-    docs = payload["docs"]
-    for i, d in enumerate(docs[:n]):
+    store = ChunkStore(CHUNK_STORE_DIR)
+    for i in range(min(n, len(store))):
         print("=" * 80)
         print(f"Chunk {i}")
-        print(textwrap.shorten(d.page_content.replace("\n", " "), width=400))
+        print(textwrap.shorten(store.text(i).replace("\n", " "), width=400))
+    store.close()
 
 
 if __name__ == "__main__":
-    download_pdfs()
-    load_and_chunk()
+    parser = argparse.ArgumentParser(description="Download, parse and chunk the PDFs.")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-parse every PDF")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="process pool size (0 = all CPUs, 1 = serial)")
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS, help="PDFs downloaded at once")
+    parser.add_argument("--timings", action="store_true", help="print per-stage timings at the end")
+    args = parser.parse_args()
+
+    if args.timings:
+        metrics.enable()
+    download_pdfs(workers=args.download_workers)
+    load_and_chunk(full=args.full, workers=args.workers)
     preview_chunks(3)
+    if args.timings:
+        metrics.print_stats()
@@ -5,17 +5,25 @@ Task 4 – Conversational memory smoke test.
 This does NOT change the chatbot's behaviour. It simply imports the
 existing RAGBot and runs a small scripted conversation to show that
 the bot remembers information across turns.
+
+The name is given first and asked for after several unrelated turns, more
+than the default 4-turn window holds, so the bot runs with "summary"
+memory here and the name is carried in the rolling summary.
 """
 
 from chatbot import RAGBot
 
 
 def run_memory_test():
-    bot = RAGBot()
+    bot = RAGBot(memory_mode="summary")
 
     turns = [
         "My name is Ashish, remember this.",
         "What is self-attention in Transformers?",
+        "How is BERT pre-trained?",
+        "What is the main idea of GPT-3?",
+        "How does RoBERTa differ from BERT?",
+        "What is the T5 text-to-text framework?",
         "And what is my name?",
     ]
 
@@ -28,10 +36,15 @@ def run_memory_test():
         print(f"You: {user_q}")
         answer = bot.ask(user_q)
         print("Bot:", answer)
+        if hasattr(bot.memory, "wait"):
+            # Let the background summary catch up, as it would while the user types
+            bot.memory.wait()
 
     print("\n==============================")
     print("Task 4 finished.")
-    print("Check Turn 3: the bot should answer that your name is Ashish.")
+    print(f"Check Turn {len(turns)}: the bot should answer that your name is Ashish.")
+    if getattr(bot.memory, "summary", ""):
+        print(f"Summary of earlier turns: {bot.memory.summary}")
     print("==============================")
 
 if __name__ == "__main__":
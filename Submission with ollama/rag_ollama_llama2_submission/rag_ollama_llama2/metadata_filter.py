@@ -0,0 +1,259 @@
+"""
+metadata_filter.py
+-------------------
+Metadata-filtered search: restrict retrieval to some papers, years or pages
+inside the FAISS search itself instead of over-fetching and discarding.
+
+A filter is a dict; keys are ANDed, list items ORed:
+
+    {"paper": "bert"}                      file stem or PAPER_ALIASES name
+    {"paper": ["bert", "1907.11692"]}
+    {"year": 2019}  /  {"year": [2018, 2019]}      inclusive range
+    {"page": 3}     /  {"page": [0, 4]}            0-based, like metadata["page"]
+
+FilterIndex keeps one bitmap per paper and per year (bit i = FAISS row i),
+built from the chunk store when the index is built and saved next to it:
+
+    meta.json     rows, the values of each field
+    paper.npy     uint8[papers, ceil(rows / 8)]   packed, little-endian bits
+    year.npy      uint8[years, ceil(rows / 8)]
+
+Bitmaps are memory-mapped on load. A filter ORs the bitmaps of its values,
+ANDs the fields, and applies page ranges from the chunk store's page column.
+The result goes to FAISS as an IDSelectorBitmap, so rows outside the filter
+are skipped during the scan. IVF and HNSW only look at part of the index, and
+the nearest matching rows of a narrow filter are often outside that part:
+
+- IVF probes nprobe / selectivity lists (all of them for a filter matching
+  under nprobe / nlist of the rows).
+- HNSW below FILTER_EXACT_BELOW selectivity scans its flat (or
+  scalar-quantized) storage instead of walking the graph: an exhaustive
+  search that computes distances for the matching rows only.
+- When a search still returns fewer than k rows although the filter holds
+  more, it is repeated with every IVF list probed or a wider HNSW beam.
+
+A RescoredIndex (vector_store.py) is searched the same way for its
+RESCORE_FACTOR * k candidates, which are then re-ranked exactly.
+"""
+
+import json
+import re
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from config import PAPER_ALIASES, PAPER_YEARS, FILTER_EXACT_BELOW
+
+FIELDS = ("paper", "year")
+_ARXIV_ID = re.compile(r"^(\d{2})(\d{2})\.\d{4,5}")
+
+
+def paper_name(source: str) -> str:
+    """
+    Filter name of a chunk's source: the file name without ".pdf" (not
+    Path.stem, which would cut "1706.03762" to "1706").
+    """
+    name = Path(source).name
+    return name[:-4] if name.lower().endswith(".pdf") else name
+
+
+def paper_year(name: str):
+    """
+    Publication year from PAPER_YEARS, or from an arXiv id (1706.03762 ->
+    2017); None when unknown.
+    """
+    if name in PAPER_YEARS:
+        return PAPER_YEARS[name]
+    match = _ARXIV_ID.match(name)
+    return 2000 + int(match.group(1)) if match else None
+
+
+def _range(value, field: str):
+    if isinstance(value, bool):
+        raise ValueError(f"'{field}' must be an integer or a [min, max] pair")
+    if isinstance(value, int):
+        return value, value
+    if isinstance(value, (list, tuple)) and len(value) == 2 and all(
+        isinstance(v, int) and not isinstance(v, bool) for v in value
+    ):
+        return min(value), max(value)
+    raise ValueError(f"'{field}' must be an integer or a [min, max] pair")
+
+
+def normalize_filters(filters):
+    """
+    Validated, canonical form of a filter dict (None for no filter).
+    Raises ValueError for unknown keys or malformed values.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be a dict")
+    unknown = set(filters) - {"paper", "year", "page"}
+    if unknown:
+        raise ValueError(f"unknown filter(s): {', '.join(sorted(unknown))}")
+    out = {}
+    if "paper" in filters:
+        papers = filters["paper"]
+        papers = [papers] if isinstance(papers, str) else papers
+        if not isinstance(papers, (list, tuple)) or not papers or not all(isinstance(p, str) for p in papers):
+            raise ValueError("'paper' must be a name or a list of names")
+        aliases = {k.lower(): v for k, v in PAPER_ALIASES.items()}
+        out["paper"] = sorted({aliases.get(p.lower(), paper_name(p)) for p in papers})
+    if "year" in filters:
+        out["year"] = list(_range(filters["year"], "year"))
+    if "page" in filters:
+        out["page"] = list(_range(filters["page"], "page"))
+    return out
+
+
+def filter_key(filters):
+    """
+    Hashable cache key of a normalized filter.
+    """
+    return json.dumps(filters, sort_keys=True) if filters else None
+
+
+class FilterIndex:
+    def __init__(self, rows: int, values: dict, bitmaps: dict, pages: np.ndarray):
+        self.rows = rows
+        self.values = values  # field -> list of values, in bitmap order
+        self.bitmaps = bitmaps  # field -> uint8[len(values), nbytes]
+        self.pages = pages  # int32[rows]
+
+    @classmethod
+    def from_columns(cls, source_codes: np.ndarray, sources: list, pages: np.ndarray) -> "FilterIndex":
+        """
+        Builds the bitmaps from per-row source codes (indexes into sources)
+        and page numbers, as stored in a chunk store.
+        """
+        rows = len(source_codes)
+        codes = np.asarray(source_codes)
+        names = [paper_name(s) for s in sources]
+        per_row = {
+            "paper": names,
+            "year": [paper_year(n) for n in names],
+        }
+        values, bitmaps = {}, {}
+        for field, labels in per_row.items():
+            distinct = sorted({v for v in labels if v is not None})
+            position = {v: i for i, v in enumerate(distinct)}
+            # source code -> bitmap row (-1 when the value is unknown)
+            lookup = np.array([position.get(v, -1) for v in labels] or [-1], dtype=np.int64)
+            of_row = lookup[codes] if rows else np.empty(0, dtype=np.int64)
+            bits = np.zeros((len(distinct), (rows + 7) // 8), dtype=np.uint8)
+            for i in range(len(distinct)):
+                bits[i] = np.packbits(of_row == i, bitorder="little")
+            values[field], bitmaps[field] = distinct, bits
+        return cls(rows, values, bitmaps, np.asarray(pages))
+
+    @classmethod
+    def build(cls, store) -> "FilterIndex":
+        """
+        FilterIndex over the rows of a ChunkStore.
+        """
+        return cls.from_columns(store.source_codes(), store.sources, store.pages())
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for field in FIELDS:
+            np.save(path / f"{field}.npy", self.bitmaps[field])
+        meta = {"rows": self.rows, "values": self.values}
+        (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @staticmethod
+    def exists(path) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    @classmethod
+    def load(cls, path, pages: np.ndarray) -> "FilterIndex":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        bitmaps = {field: np.load(path / f"{field}.npy", mmap_mode="r") for field in FIELDS}
+        return cls(meta["rows"], meta["values"], bitmaps, pages)
+
+    def _any_of(self, field: str, wanted) -> np.ndarray:
+        rows = [i for i, v in enumerate(self.values[field]) if wanted(v)]
+        if not rows:
+            return np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bitmaps[field][rows], axis=0)
+
+    def bitmap(self, filters) -> np.ndarray:
+        """
+        Packed bitmap (uint8[ceil(rows / 8)], little-endian bits) of the rows
+        matching a normalized filter.
+        """
+        bitmap = np.full((self.rows + 7) // 8, 0xFF, dtype=np.uint8)
+        if "paper" in filters:
+            papers = set(filters["paper"])
+            bitmap &= self._any_of("paper", lambda v: v in papers)
+        if "year" in filters:
+            low, high = filters["year"]
+            bitmap &= self._any_of("year", lambda v: low <= v <= high)
+        if "page" in filters:
+            low, high = filters["page"]
+            bitmap &= np.packbits((self.pages >= low) & (self.pages <= high), bitorder="little")
+        if self.rows % 8:
+            bitmap[-1] &= (1 << (self.rows % 8)) - 1
+        return bitmap
+
+    def mask(self, filters) -> np.ndarray:
+        """
+        bool[rows] form of bitmap(filters).
+        """
+        return np.unpackbits(self.bitmap(filters), count=self.rows, bitorder="little").astype(bool)
+
+    def search(self, index, vectors: np.ndarray, k: int, filters):
+        """
+        (distances, rows) of the top-k rows of index matching filters.
+        """
+        return filtered_search(index, vectors, k, self.bitmap(filters))
+
+
+def count(bitmap: np.ndarray) -> int:
+    return int(np.unpackbits(bitmap).sum())
+
+
+def _params(index, selector, selectivity: float, widen: bool):
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        nprobe = ivf.nlist if widen else min(ivf.nlist, int(np.ceil(ivf.nprobe / selectivity)))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        ef = index.hnsw.efSearch
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=min(index.ntotal, ef * 8) if widen else ef)
+    return faiss.SearchParameters(sel=selector)
+
+
+def filtered_search(index, vectors: np.ndarray, k: int, bitmap: np.ndarray, matches: int = None):
+    """
+    index.search() restricted to the rows set in bitmap; same (distances,
+    rows) result, padded with -1 when fewer rows match.
+    """
+    if matches is None:
+        matches = count(bitmap)
+    if matches == 0:
+        return np.full((len(vectors), k), np.inf, dtype=np.float32), np.full((len(vectors), k), -1, dtype=np.int64)
+    if hasattr(index, "rescore"):
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        _, rows = filtered_search(index.index, vectors, min(k * index.factor, index.ntotal), bitmap, matches)
+        return index.rescore(vectors, rows, k)
+
+    # IDSelectorBitmap takes the bitmap's length in bytes
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    selectivity = matches / index.ntotal
+    if isinstance(index, faiss.IndexHNSW) and selectivity < FILTER_EXACT_BELOW:
+        storage = faiss.downcast_index(index.storage)
+        if isinstance(storage, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+            return storage.search(vectors, k, params=faiss.SearchParameters(sel=selector))
+    distances, rows = index.search(vectors, k, params=_params(index, selector, selectivity, widen=False))
+    exhaustive = isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer))
+    if not exhaustive and ((rows >= 0).sum(axis=1) < min(k, matches)).any():
+        # The probed lists / HNSW beam held too few matching rows
+        distances, rows = index.search(vectors, k, params=_params(index, selector, selectivity, widen=True))
+    return distances, rows
@@ -0,0 +1,253 @@
+"""
+metrics.py
+-----------
+Per-stage timers, counters and latency percentiles for the RAG pipeline.
+
+    with metrics.span("retrieve.search", k=3):
+        ...
+    metrics.count("llm.calls")
+    metrics.observe("llm.first_token", seconds)
+    metrics.stats()  # {"stages": {name: count/mean/p50/p95/p99}, "counters": {...}}
+
+Off by default (METRICS_ENABLED). While off, span() returns one shared
+no-op context manager and count()/observe() return at once, so the
+instrumented code costs a function call and a flag check.
+
+enable() switches recording on at runtime and can export every finished
+span to a file, as flat JSON lines ("jsonl") or OpenTelemetry-style span
+records ("otel"). Nested spans share a trace id and point to their parent,
+including across asyncio tasks and asyncio.to_thread() calls.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from config import METRICS_ENABLED, METRICS_MAX_SAMPLES, TRACE_EXPORT_PATH, TRACE_FORMAT
+
+_enabled = False
+_lock = threading.Lock()
+_samples = {}  # stage -> deque of the latest durations (seconds)
+_totals = {}  # stage -> [count, total seconds]
+_counters = {}
+_exporter = None
+_current = contextvars.ContextVar("metrics_span", default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start_ns", "_parent", "_t0")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = self._parent = _current.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        _current.set(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._t0
+        _current.set(self._parent)
+        _record(self.name, elapsed)
+        if _exporter is not None:
+            _exporter.write(self, elapsed, exc_type)
+        return False
+
+
+class _Exporter:
+    def __init__(self, path, fmt: str):
+        if fmt not in ("jsonl", "otel"):
+            raise ValueError(f"Unknown trace format: {fmt!r}")
+        self.fmt = fmt
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, span: Span, elapsed: float, error) -> None:
+        if self.fmt == "jsonl":
+            record = {
+                "ts": span.start_ns / 1e9,
+                "stage": span.name,
+                "duration_ms": elapsed * 1000,
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "attrs": span.attrs,
+            }
+            if error is not None:
+                record["error"] = error.__name__
+        else:
+            record = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "startTimeUnixNano": span.start_ns,
+                "endTimeUnixNano": span.start_ns + int(elapsed * 1e9),
+                "attributes": [_otel_attribute(k, v) for k, v in span.attrs.items()],
+                # 1 = OK, 2 = ERROR
+                "status": {"code": 2 if error is not None else 1},
+            }
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _otel_attribute(key, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": value}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _record(name: str, seconds: float) -> None:
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=METRICS_MAX_SAMPLES)
+            _totals[name] = [0, 0.0]
+        samples.append(seconds)
+        totals = _totals[name]
+        totals[0] += 1
+        totals[1] += seconds
+
+
+def span(name: str, **attrs):
+    """
+    Context manager timing one stage; a shared no-op while disabled.
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def count(name: str, n: int = 1) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(name: str, seconds: float) -> None:
+    """
+    Records a duration measured by the caller (e.g. time to first token).
+    """
+    if not _enabled:
+        return
+    _record(name, seconds)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(export_path=None, fmt: str = TRACE_FORMAT) -> None:
+    """
+    Starts recording; with export_path, also appends each span to that file.
+    """
+    global _enabled, _exporter
+    with _lock:
+        if _exporter is not None:
+            _exporter.close()
+            _exporter = None
+        if export_path is not None:
+            _exporter = _Exporter(export_path, fmt)
+        _enabled = True
+
+
+def disable() -> None:
+    global _enabled, _exporter
+    with _lock:
+        _enabled = False
+        if _exporter is not None:
+            _exporter.close()
+            _exporter = None
+
+
+def reset() -> None:
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+def _percentile(ordered, q: float) -> float:
+    # Nearest-rank on an ascending list
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stats() -> dict:
+    """
+    Per-stage count, total and latency percentiles (ms), plus counters.
+    Percentiles cover the latest METRICS_MAX_SAMPLES durations per stage.
+    """
+    with _lock:
+        snapshot = {name: sorted(s) for name, s in _samples.items()}
+        totals = {name: list(t) for name, t in _totals.items()}
+        counters = dict(_counters)
+
+    stages = {}
+    for name, ordered in snapshot.items():
+        n, total = totals[name]
+        stages[name] = {
+            "count": n,
+            "total_s": total,
+            "mean_ms": total / n * 1000,
+            "p50_ms": _percentile(ordered, 0.50) * 1000,
+            "p95_ms": _percentile(ordered, 0.95) * 1000,
+            "p99_ms": _percentile(ordered, 0.99) * 1000,
+            "max_ms": ordered[-1] * 1000,
+        }
+    return {"stages": stages, "counters": counters}
+
+
+def print_stats() -> None:
+    report = stats()
+    print(f"{'stage':<28}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in sorted(report["stages"]):
+        s = report["stages"][name]
+        print(
+            f"{name:<28}{s['count']:>7}{s['mean_ms']:>10.2f}"
+            f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+        )
+    for name in sorted(report["counters"]):
+        print(f"{name:<28}{report['counters'][name]:>7}")
+
+
+if METRICS_ENABLED:
+    enable(TRACE_EXPORT_PATH, TRACE_FORMAT)
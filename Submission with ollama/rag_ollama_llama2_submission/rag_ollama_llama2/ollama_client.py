@@ -0,0 +1,263 @@
+"""
+ollama_client.py
+-----------------
+Shared, pooled client for the Ollama HTTP API.
+
+LangChain's Ollama wrapper opens a new HTTP connection for every call and
+sends no runtime options unless each bot sets them. OllamaClient keeps one
+requests.Session with a pool of keep-alive connections for the whole
+process and sends every request with the settings from config.py:
+
+- model (OLLAMA_MODEL_NAME) and keep_alive (OLLAMA_KEEP_ALIVE), so llama2
+  stays loaded between requests
+- options: num_ctx, num_thread and OLLAMA_OPTIONS. They are the same on
+  every request, because a different num_ctx makes Ollama reload the model.
+- connect / read timeouts
+- retries with exponential backoff for connection errors, 429 and 5xx.
+  A request is only retried before its first token, so a streamed answer
+  is never repeated.
+
+Async calls run the same client in worker threads and share its pool.
+A cancelled astream() closes its response once the token being read
+arrives, so the connection is not leaked.
+PooledOllama exposes the client as a LangChain LLM, so RAGBot and
+SummaryMemory use it through invoke / ainvoke / stream / astream.
+get_ollama_llm() returns the process-wide instance, and load_model() loads
+the model ahead of the first question.
+"""
+
+import asyncio
+import functools
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+import metrics
+from config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL_NAME,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_THREAD,
+    OLLAMA_OPTIONS,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_CONNECT_TIMEOUT_S,
+    OLLAMA_READ_TIMEOUT_S,
+    OLLAMA_RETRIES,
+    OLLAMA_RETRY_BACKOFF_S,
+)
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_END = object()
+
+
+class OllamaError(RuntimeError):
+    pass
+
+
+def default_options() -> dict:
+    options = {"num_ctx": OLLAMA_NUM_CTX}
+    if OLLAMA_NUM_THREAD:
+        options["num_thread"] = OLLAMA_NUM_THREAD
+    options.update(OLLAMA_OPTIONS)
+    return options
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        model: str = OLLAMA_MODEL_NAME,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        options: Optional[dict] = None,
+        pool_size: int = OLLAMA_POOL_SIZE,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT_S,
+        read_timeout: float = OLLAMA_READ_TIMEOUT_S,
+        retries: int = OLLAMA_RETRIES,
+        backoff_s: float = OLLAMA_RETRY_BACKOFF_S,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = options if options is not None else default_options()
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_s = backoff_s
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.requests = 0
+        self.retried = 0
+        self.last_response = None  # final record of the latest generation (timings, token counts)
+        self._lock = threading.Lock()
+
+    def _body(self, prompt: str, stream: bool, stop=None, options=None) -> dict:
+        merged = {**self.options, **(options or {})}
+        if stop:
+            merged["stop"] = list(stop)
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": merged,
+        }
+
+    def _post(self, path: str, body: dict, stream: bool) -> requests.Response:
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff_s * 2 ** (attempt - 1)
+                with self._lock:
+                    self.retried += 1
+                metrics.count("ollama.retries")
+                print(f"[OllamaClient] {error}; retrying in {delay:.2f}s")
+                time.sleep(delay)
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.session.post(
+                    self.base_url + path, json=body, stream=stream, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            if response.status_code < 400:
+                return response
+            error = OllamaError(f"Ollama returned {response.status_code}: {_error_text(response)}")
+            response.close()
+            if response.status_code not in _RETRY_STATUS:
+                raise error
+        raise OllamaError(f"Ollama request failed after {self.retries + 1} attempts: {error}") from error
+
+    def generate(self, prompt: str, stop=None, **options) -> str:
+        with metrics.span("ollama.generate"):
+            response = self._post("/api/generate", self._body(prompt, False, stop, options), stream=False)
+            data = response.json()
+        self.last_response = data
+        return data.get("response", "")
+
+    def stream(self, prompt: str, stop=None, **options) -> Iterator[str]:
+        response = self._post("/api/generate", self._body(prompt, True, stop, options), stream=True)
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise OllamaError(data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    # Keep reading to the end of the body, so the connection
+                    # goes back to the pool
+                    self.last_response = data
+
+    async def agenerate(self, prompt: str, stop=None, **options) -> str:
+        return await asyncio.to_thread(self.generate, prompt, stop, **options)
+
+    async def astream(self, prompt: str, stop=None, **options) -> AsyncIterator[str]:
+        tokens = self.stream(prompt, stop, **options)
+        # Held while a worker thread is inside next(tokens)
+        busy = threading.Lock()
+
+        def step():
+            with busy:
+                return next(tokens, _END)
+
+        def close():
+            with busy:
+                tokens.close()
+
+        try:
+            while True:
+                token = await asyncio.to_thread(step)
+                if token is _END:
+                    return
+                yield token
+        finally:
+            if busy.acquire(blocking=False):
+                try:
+                    tokens.close()
+                finally:
+                    busy.release()
+            else:
+                # Cancelled while next() is running on a worker thread: the
+                # generator (and its pooled response) is closed there once
+                # that call returns
+                asyncio.get_running_loop().run_in_executor(None, close)
+
+    def load_model(self) -> None:
+        """
+        Loads the model into Ollama's memory (an empty prompt), with the
+        same options as real requests so they do not trigger a reload.
+        """
+        with metrics.span("ollama.load_model"):
+            self._post("/api/generate", self._body("", False), stream=False).close()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "retries": self.retried}
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _error_text(response) -> str:
+    try:
+        return response.json().get("error", response.text)
+    except ValueError:
+        return response.text[:200]
+
+
+class PooledOllama(LLM):
+    client: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-pooled"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.client.model, "base_url": self.client.base_url, **self.client.options}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return self.client.generate(prompt, stop, **kwargs)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return await self.client.agenerate(prompt, stop, **kwargs)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for token in self.client.stream(prompt, stop, **kwargs):
+            chunk = GenerationChunk(text=token)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        async for token in self.client.astream(prompt, stop, **kwargs):
+            chunk = GenerationChunk(text=token)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+@functools.lru_cache(maxsize=None)
+def get_client() -> OllamaClient:
+    """
+    Process-wide client built from config.py.
+    """
+    return OllamaClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_ollama_llm() -> PooledOllama:
+    return PooledOllama(client=get_client())
@@ -0,0 +1,120 @@
+"""
+reranker.py
+------------
+Optional cross-encoder reranking of retrieved chunks.
+
+RAGBot retrieves RERANK_CANDIDATES chunks, the cross-encoder scores each
+(query, chunk) pair in batches, and the best top_n are kept. Scores are
+cached per (query, chunk), so repeated and overlapping queries only score
+new pairs.
+
+Each query has a time budget (RERANK_BUDGET_S). Before every batch the
+reranker estimates the batch's cost from a running estimate of seconds per
+pair (seeded when the model loads, raised at once when scoring slows
+down); if it would overrun the budget it stops and returns the candidates
+in their original (dense) order. Scores computed so far are still cached.
+Loading the model does not count against the budget.
+"""
+
+import functools
+import threading
+import time
+
+import metrics
+from config import (
+    RERANK_MODEL_NAME,
+    RERANK_BATCH_SIZE,
+    RERANK_BUDGET_S,
+    RERANK_CACHE_SIZE,
+    QUERY_CACHE_TTL_S,
+)
+from query_cache import LRUCache, normalize_query
+
+
+class Reranker:
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL_NAME,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget_s: float = RERANK_BUDGET_S,
+        cache_size: int = RERANK_CACHE_SIZE,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_s = budget_s
+        # (normalized query, chunk id) -> score
+        self.cache = LRUCache(cache_size, QUERY_CACHE_TTL_S)
+        self.fallbacks = 0
+        self._pair_s = 0.0  # running average of seconds per scored pair
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                print(f"[Reranker] Loading {self.model_name}")
+                model = CrossEncoder(self.model_name)
+                # Seed the per-pair cost so the first query is budgeted too
+                t = time.perf_counter()
+                model.predict([("warm up", "warm up")], show_progress_bar=False)
+                self._pair_s = time.perf_counter() - t
+                self._model = model
+            return self._model
+
+    def rerank(self, query: str, docs, top_n: int, ids=None) -> list:
+        """
+        The top_n docs by cross-encoder score, or docs[:top_n] unchanged if
+        the budget runs out. ids are stable chunk ids for the cache key
+        (defaults to each doc's chunk_id metadata).
+        """
+        if len(docs) <= 1:
+            return list(docs[:top_n])
+        model = self.model
+        start = time.perf_counter()
+
+        if ids is None:
+            from embedding_engine import text_hash
+
+            ids = [d.metadata.get("chunk_id") or text_hash(d.page_content) for d in docs]
+        q = normalize_query(query)
+        scores = [self.cache.get((q, i)) for i in ids]
+        todo = [n for n, s in enumerate(scores) if s is None]
+        metrics.count("rerank.cache_hits", len(docs) - len(todo))
+
+        with metrics.span("rerank", candidates=len(docs), scored=len(todo)):
+            for b in range(0, len(todo), self.batch_size):
+                batch = todo[b:b + self.batch_size]
+                if time.perf_counter() - start + len(batch) * self._pair_s > self.budget_s:
+                    self.fallbacks += 1
+                    metrics.count("rerank.fallbacks")
+                    print(f"[Reranker] Over the {self.budget_s:.2f}s budget; keeping dense order")
+                    return list(docs[:top_n])
+                t = time.perf_counter()
+                out = model.predict(
+                    [(query, docs[n].page_content) for n in batch],
+                    batch_size=self.batch_size,
+                    show_progress_bar=False,
+                )
+                # Pessimistic average: jumps up at once, decays slowly
+                pair_s = (time.perf_counter() - t) / len(batch)
+                self._pair_s = max(pair_s, 0.8 * self._pair_s + 0.2 * pair_s)
+                for n, score in zip(batch, out):
+                    scores[n] = float(score)
+                    self.cache.put((q, ids[n]), scores[n])
+
+        order = sorted(range(len(docs)), key=lambda n: -scores[n])
+        return [docs[n] for n in order[:top_n]]
+
+    def stats(self) -> dict:
+        return {"score_cache": self.cache.stats(), "fallbacks": self.fallbacks}
+
+
+@functools.lru_cache(maxsize=None)
+def get_reranker(model_name: str = RERANK_MODEL_NAME) -> Reranker:
+    """
+    Process-wide reranker; the model is loaded on first use.
+    """
+    return Reranker(model_name)
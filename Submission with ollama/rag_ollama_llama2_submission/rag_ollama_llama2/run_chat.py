@@ -1,3 +1,5 @@
+import time
+
 from chatbot import RAGBot
 
 def main():
@@ -5,15 +7,30 @@ def main():
     print("Ask questions about the Transformer / BERT / GPT papers.")
     print("Type 'exit' to quit.\n")
 
-    bot = RAGBot()
+    # Load the index and embedding model while the user types
+    bot = RAGBot(warmup=True)
 
     while True:
         user = input("You: ").strip()
         if user.lower() in ["exit", "quit"]:
             break
 
-        response = bot.ask(user)
-        print("\nBot:", response, "\n")
+        # Print tokens as Ollama produces them ("Bot:" after the prompt log line)
+        start = time.perf_counter()
+        first_token = None
+        num_tokens = 0
+        for token in bot.ask_stream(user):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+                print("\nBot: ", end="", flush=True)
+            num_tokens += 1
+            print(token, end="", flush=True)
+        total = time.perf_counter() - start
+
+        if first_token is None:
+            print(f"\n\n[no output after {total:.2f}s]\n")
+        else:
+            print(f"\n\n[first token {first_token:.2f}s, {num_tokens} tokens in {total:.2f}s]\n")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,132 @@
+"""
+scheduler.py
+-------------
+Request scheduler for RAGBot.aask().
+
+- Requests for the same session run one at a time, so each turn sees the
+  previous turn's memory.
+- At most max_concurrency generations are in flight against Ollama; the
+  rest wait for a slot.
+- Retrieval runs before a request asks for a slot, so queued requests do
+  their embedding + FAISS work while earlier ones are still generating.
+- Background LLM calls made from other threads (SummaryMemory folds) take
+  a slot too, through run(), so they count against the same cap.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+
+import metrics
+
+
+class RequestScheduler:
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self._loop = None
+        self._slots = None
+        self._session_locks = {}
+
+    def _bind(self) -> None:
+        # asyncio primitives belong to one event loop; start fresh per loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._session_locks = {}
+
+    def session_lock(self, session_id) -> asyncio.Lock:
+        self._bind()
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+
+    def drop_session(self, session_id) -> None:
+        """
+        Forgets the session's lock unless a turn is holding it.
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is not None and not lock.locked():
+            del self._session_locks[session_id]
+
+    async def _acquire(self) -> None:
+        self._bind()
+        self.queued += 1
+        try:
+            with metrics.span("scheduler.wait"):
+                await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self._slots.release()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """
+        Holds one generation slot for the body of the `async with`.
+        """
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def run(self, fn, *args):
+        """
+        Calls fn(*args) on the calling thread while holding a generation
+        slot of the event loop that aask() runs on. For blocking LLM calls
+        made off the loop (background summaries). Without a running loop
+        there is nothing to share the cap with, and fn is called directly.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return fn(*args)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("RequestScheduler.run() would block the event loop; use slot()")
+        acquired = asyncio.run_coroutine_threadsafe(self._acquire(), loop)
+        while True:
+            try:
+                acquired.result(timeout=1.0)
+                break
+            except concurrent.futures.TimeoutError:
+                # The loop stopped while this call was queued
+                if not loop.is_running() and acquired.cancel():
+                    return fn(*args)
+            except concurrent.futures.CancelledError:
+                return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                # Loop closed meanwhile; nobody is waiting on the semaphore
+                self.in_flight -= 1
+                self.completed += 1
+
+    async def generate(self, make_coro):
+        """
+        Awaits make_coro() once a generation slot is free.
+        """
+        async with self.slot():
+            return await make_coro()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+        }
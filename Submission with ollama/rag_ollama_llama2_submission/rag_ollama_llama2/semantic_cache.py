@@ -0,0 +1,156 @@
+"""
+semantic_cache.py
+------------------
+Answer cache keyed by meaning rather than exact text.
+
+An answer is served again when a new query's embedding has cosine
+similarity >= threshold with a cached query AND retrieval returned the same
+context chunks, so "what is self-attention" and "explain self-attention"
+share one LLM call. Entries live in SQLite (so the cache survives restarts)
+and in an in-memory matrix of unit vectors for the similarity scan. The
+matrix doubles its capacity when full, so adding an entry does not copy
+it; past maxsize entries, the least recently used are evicted.
+
+Each row records the embedding model it was made with (model, as named by
+embedding_engine.cache_key()). Vectors of different models live in
+different spaces, so rows of another model, or of another dimension, are
+deleted when the cache is opened.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class SemanticCache:
+    def __init__(self, path, threshold: float, maxsize: int, model: str = ""):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY,"
+            " query TEXT NOT NULL,"
+            " context_ids TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " model TEXT NOT NULL DEFAULT '')"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+        if "model" not in columns:
+            # Caches written before rows recorded their model
+            with self.conn:
+                self.conn.execute("ALTER TABLE answers ADD COLUMN model TEXT NOT NULL DEFAULT ''")
+        with self.conn:
+            stale = self.conn.execute("DELETE FROM answers WHERE model != ?", (model,)).rowcount
+            # One dimension per model: keep the rows of the newest one
+            dim = self.conn.execute("SELECT length(vector) FROM answers ORDER BY id DESC LIMIT 1").fetchone()
+            if dim is not None:
+                stale += self.conn.execute("DELETE FROM answers WHERE length(vector) != ?", dim).rowcount
+        if stale:
+            print(f"[SemanticCache] Dropped {stale} entries of another embedding model")
+        rows = self.conn.execute(
+            "SELECT id, context_ids, answer, vector, last_used FROM answers ORDER BY id"
+        ).fetchall()
+        self._ids = [r[0] for r in rows]
+        self._contexts = [r[1] for r in rows]
+        self._answers = [r[2] for r in rows]
+        self._last_used = [r[4] for r in rows]
+        # Rows [0, len(self)) of self._matrix hold the entries' unit vectors
+        self._matrix = (
+            np.stack([np.frombuffer(r[3], dtype=np.float32) for r in rows])
+            if rows else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def lookup(self, vector, context_ids):
+        """
+        Cached answer for a similar query with the same contexts, or None.
+        """
+        key = json.dumps(list(context_ids))
+        with self._lock:
+            if self._ids:
+                sims = self._matrix[:len(self._ids)] @ _unit(vector)
+                candidates = np.flatnonzero(sims >= self.threshold)
+                for row in candidates[np.argsort(-sims[candidates])]:
+                    if self._contexts[row] == key:
+                        self._last_used[row] = now = time.time()
+                        with self.conn:
+                            self.conn.execute(
+                                "UPDATE answers SET last_used = ? WHERE id = ?",
+                                (now, self._ids[row]),
+                            )
+                        self.hits += 1
+                        return self._answers[row]
+            self.misses += 1
+            return None
+
+    def add(self, query: str, vector, context_ids, answer: str) -> None:
+        key = json.dumps(list(context_ids))
+        unit = _unit(vector)
+        now = time.time()
+        with self._lock:
+            with self.conn:
+                cur = self.conn.execute(
+                    "INSERT INTO answers (query, context_ids, answer, vector, last_used, model)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (query, key, answer, unit.tobytes(), now, self.model),
+                )
+            self._ids.append(cur.lastrowid)
+            self._contexts.append(key)
+            self._answers.append(answer)
+            self._last_used.append(now)
+            n = len(self._ids)
+            if self._matrix is None:
+                self._matrix = np.empty((16, len(unit)), dtype=np.float32)
+            elif n > len(self._matrix):
+                grown = np.empty((2 * len(self._matrix), self._matrix.shape[1]), dtype=np.float32)
+                grown[:n - 1] = self._matrix[:n - 1]
+                self._matrix = grown
+            self._matrix[n - 1] = unit
+            if n > self.maxsize:
+                self._evict(len(self._ids) - self.maxsize)
+
+    def _evict(self, n: int) -> None:
+        # Stable, so ties go to the older entry
+        drop = set(np.argsort(self._last_used, kind="stable")[:n].tolist())
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM answers WHERE id = ?", [(self._ids[i],) for i in drop]
+            )
+        keep = [i for i in range(len(self._ids)) if i not in drop]
+        self._ids = [self._ids[i] for i in keep]
+        self._contexts = [self._contexts[i] for i in keep]
+        self._answers = [self._answers[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
+        # Compacted in place; the capacity is kept for the next adds
+        self._matrix[:len(keep)] = self._matrix[keep]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,393 @@
+"""
+server.py
+----------
+HTTP/JSON API for RAGBot, served by several worker processes.
+
+    python server.py [--host 127.0.0.1] [--port 8000] [--workers 2] [--no-mmap]
+
+The parent process starts SERVER_WORKERS worker processes and restarts any
+that die, including one whose warm-up (index, models) failed. Where the OS has SO_REUSEPORT (Linux, BSD, macOS) each worker
+listens on the port itself and the kernel balances new connections between
+them; elsewhere they all accept on one socket bound by the parent. Each
+worker runs one RAGBot on an asyncio (aiohttp) server and answers with
+RAGBot.aask(), so a worker keeps many sessions in flight while Ollama
+generates, up to OLLAMA_MAX_CONCURRENCY at a time per worker.
+
+Memory: workers map the FAISS index (INDEX_MMAP), the chunk store and the
+BM25 index read-only, so those pages sit once in the page cache however many
+workers there are. The embedding model is loaded per worker; torch gets
+CPUs / workers threads each unless EMBED_TORCH_THREADS is set.
+
+Sessions: with MEMORY_MODE = "summary", conversation memory is saved to
+SESSION_STORE_PATH after every turn and each worker checks it before the
+next one, so any worker can continue a session. With the default "window"
+memory each worker only remembers the turns it answered. Send a session's
+turns one at a time.
+
+    POST   /ask             {"query": "...", "session_id": "...", "stream": false,
+                             "filters": {"paper": "bert", "year": [2018, 2019]}}
+                            -> {"answer", "session_id", "worker", "elapsed_ms"}
+                            A new session id is returned when none is sent;
+                            "filters" is optional (see metadata_filter.py).
+                            With "stream": true the answer is NDJSON:
+                            {"token": ...} lines, then {"done": true, ...}.
+    DELETE /sessions/<id>   forget a session
+    GET    /healthz         200 while the worker runs
+    GET    /readyz          200 once the index and models are loaded, else 503
+    GET    /metrics         the answering worker's requests, memory (RSS / PSS,
+                            resident index pages), caches, scheduler and
+                            per-stage timings
+
+Each response describes the worker that served it; `benchmark.py serve`
+polls /metrics until it has heard from every worker.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+
+import chatbot
+import metrics
+import vector_store
+from metadata_filter import normalize_filters
+from config import (
+    ARTIFACTS_DIR,
+    EMBED_TORCH_THREADS,
+    MEMORY_MODE,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_SESSION_IDLE_S,
+    SERVER_MAX_QUERY_CHARS,
+)
+
+MAX_SESSION_ID_CHARS = 128
+
+
+def process_memory() -> dict:
+    """
+    This process's memory in MB, from /proc/self/smaps (empty elsewhere).
+    rss counts shared pages in full; pss divides them between the processes
+    mapping them, so the sum of pss over workers is their real footprint.
+    index is the resident part of files mapped from ARTIFACTS_DIR (FAISS
+    index, chunk store, BM25).
+    """
+    smaps = Path("/proc/self/smaps")
+    if not smaps.exists():
+        return {}
+    artifacts = str(ARTIFACTS_DIR)
+    kb = {"rss": 0, "pss": 0, "shared": 0, "index": 0}
+    in_artifacts = False
+    for line in smaps.read_text().splitlines():
+        fields = line.split(None, 5)
+        if not fields[0].endswith(":"):
+            # Mapping header: address perms offset dev inode [path]
+            in_artifacts = len(fields) == 6 and fields[5].startswith(artifacts)
+            continue
+        name = fields[0][:-1]
+        if name == "Rss":
+            kb["rss"] += int(fields[1])
+            if in_artifacts:
+                kb["index"] += int(fields[1])
+        elif name == "Pss":
+            kb["pss"] += int(fields[1])
+        elif name in ("Shared_Clean", "Shared_Dirty"):
+            kb["shared"] += int(fields[1])
+    return {key: round(value / 1024, 1) for key, value in kb.items()}
+
+
+class Worker:
+    def __init__(self, number: int, workers: int):
+        self.number = number
+        self.workers = workers
+        self.bot = chatbot.RAGBot(persist_sessions=True)
+        self.ready = False
+        self.started = time.time()
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+        self.last_seen = {}  # session id -> monotonic time of its last turn
+
+    def warm_up(self) -> None:
+        """
+        Loads the index and embedding model (and asks Ollama to load
+        llama2) before the worker reports ready.
+        """
+        if not EMBED_TORCH_THREADS:
+            import torch
+
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.workers))
+        threading.Thread(target=chatbot._load_ollama_model, daemon=True).start()
+        chatbot.warm_up()
+        self.ready = True
+        print(f"[server] worker {self.number} (pid {os.getpid()}) ready")
+
+    async def drop_idle_sessions(self) -> None:
+        """
+        Drops sessions idle for SERVER_SESSION_IDLE_S from memory; their
+        state stays in the session store.
+        """
+        while True:
+            await asyncio.sleep(max(1.0, min(60.0, SERVER_SESSION_IDLE_S / 4)))
+            cutoff = time.monotonic() - SERVER_SESSION_IDLE_S
+            for session_id, seen in list(self.last_seen.items()):
+                if seen < cutoff:
+                    del self.last_seen[session_id]
+                    self.bot.end_session(session_id)
+
+    def _info(self) -> dict:
+        return {"worker": self.number, "pid": os.getpid()}
+
+    # -- handlers -------------------------------------------------------
+    async def ask(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return _error(400, "the body must be a JSON object")
+        if not isinstance(body, dict):
+            return _error(400, "the body must be a JSON object")
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            return _error(400, "'query' must be a non-empty string")
+        if len(query) > SERVER_MAX_QUERY_CHARS:
+            return _error(413, f"'query' is longer than {SERVER_MAX_QUERY_CHARS} characters")
+        session_id = body.get("session_id") or uuid.uuid4().hex
+        if not isinstance(session_id, str) or len(session_id) > MAX_SESSION_ID_CHARS:
+            return _error(400, f"'session_id' must be a string of at most {MAX_SESSION_ID_CHARS} characters")
+        try:
+            filters = normalize_filters(body.get("filters"))
+        except ValueError as e:
+            return _error(400, f"'filters': {e}")
+        if not self.ready:
+            return _error(503, "still loading", retry_after=1)
+        if filters is not None and getattr(self.bot.db, "filters", None) is None:
+            return _error(400, "'filters': this index has no metadata filters")
+
+        self.last_seen[session_id] = time.monotonic()
+        self.requests += 1
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            if body.get("stream"):
+                return await self._ask_stream(request, query, session_id, filters, start)
+            answer = await self.bot.aask(query, session_id, filters)
+        except Exception as e:
+            self.errors += 1
+            print(f"[server] worker {self.number}: {type(e).__name__}: {e}")
+            return _error(502 if _is_llm_error(e) else 500, str(e))
+        finally:
+            self.in_flight -= 1
+        return web.json_response({
+            "answer": answer,
+            "session_id": session_id,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            **self._info(),
+        })
+
+    async def _ask_stream(self, request, query: str, session_id: str, filters, start: float):
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        async def send(payload: dict) -> None:
+            await response.write(json.dumps(payload).encode("utf-8") + b"\n")
+
+        try:
+            async for token in self.bot.aask_stream(query, session_id, filters):
+                await send({"token": token})
+        except ConnectionResetError:
+            # Client went away; the turn is not saved (see ask_stream())
+            return response
+        except Exception as e:
+            self.errors += 1
+            print(f"[server] worker {self.number}: {type(e).__name__}: {e}")
+            await send({"error": str(e)})
+        else:
+            await send({
+                "done": True,
+                "session_id": session_id,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+                **self._info(),
+            })
+        await response.write_eof()
+        return response
+
+    async def end_session(self, request):
+        session_id = request.match_info["session_id"]
+        self.last_seen.pop(session_id, None)
+        self.bot.end_session(session_id, forget=True)
+        return web.Response(status=204)
+
+    async def healthz(self, request):
+        return web.json_response({"status": "ok", "ready": self.ready, **self._info()})
+
+    async def readyz(self, request):
+        status = 200 if self.ready else 503
+        return web.json_response({"ready": self.ready, **self._info()}, status=status)
+
+    async def metrics(self, request):
+        report = {
+            **self._info(),
+            "uptime_s": round(time.time() - self.started, 1),
+            "ready": self.ready,
+            "requests": {"total": self.requests, "in_flight": self.in_flight, "errors": self.errors},
+            "sessions": len(self.bot.sessions),
+            "memory_mb": process_memory(),
+            "scheduler": self.bot.scheduler.stats(),
+            "caches": self.bot.cache_stats(),
+            "stages": metrics.stats(),
+        }
+        if self.ready:
+            db = chatbot.get_vector_store()
+            report["index"] = {
+                "version": getattr(db, "index_version", None),
+                "vectors": db.index.ntotal,
+                "mmap": vector_store.INDEX_MMAP,
+            }
+        return web.json_response(report)
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024)
+        app.add_routes([
+            web.post("/ask", self.ask),
+            web.delete("/sessions/{session_id}", self.end_session),
+            web.get("/healthz", self.healthz),
+            web.get("/readyz", self.readyz),
+            web.get("/metrics", self.metrics),
+        ])
+        return app
+
+
+def _error(status: int, message: str, retry_after=None):
+    headers = {"Retry-After": str(retry_after)} if retry_after else None
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+def _is_llm_error(e: Exception) -> bool:
+    from ollama_client import OllamaError
+
+    return isinstance(e, OllamaError)
+
+
+async def _serve_worker(worker: Worker, listen) -> int:
+    """
+    Serves until SIGTERM (exit code 0) or until warm-up fails (1).
+    """
+    if isinstance(listen, tuple):
+        # Own socket in the port's SO_REUSEPORT group
+        sock = socket.create_server(listen, backlog=1024, reuse_port=True)
+    else:
+        sock = listen
+    runner = web.AppRunner(worker.app(), access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass  # Windows: terminate() ends the process outright
+    failed = []
+
+    def warmed_up(task) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+        # Without an index or models the worker could only answer 503
+        e = task.exception()
+        print(f"[server] worker {worker.number}: warm-up failed: {type(e).__name__}: {e}")
+        failed.append(e)
+        stop.set()
+
+    warm = asyncio.create_task(asyncio.to_thread(worker.warm_up))
+    warm.add_done_callback(warmed_up)
+    tasks = [warm, asyncio.create_task(worker.drop_idle_sessions())]
+    try:
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await runner.cleanup()
+    return 1 if failed else 0
+
+
+def _run_worker(number: int, workers: int, listen, mmap: bool) -> None:
+    vector_store.INDEX_MMAP = mmap
+    metrics.enable()
+    try:
+        code = asyncio.run(_serve_worker(Worker(number, workers), listen))
+    except KeyboardInterrupt:
+        return
+    if code:
+        # The parent logs the exit code and starts a new worker
+        sys.exit(code)
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS, mmap: bool = True) -> None:
+    workers = max(1, workers)
+    if workers > 1 and MEMORY_MODE != "summary":
+        print('[server] MEMORY_MODE is not "summary": sessions are not shared, so a '
+              "session only remembers the turns its worker answered.")
+
+    if hasattr(socket, "SO_REUSEPORT") and sys.platform != "win32":
+        # Bound (reserving the port) but not listening, so every connection
+        # goes to a worker's socket
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        listen = sock.getsockname()
+    else:
+        sock = listen = socket.create_server((host, port), backlog=1024)
+    # Spawned, not forked: each worker imports torch and FAISS itself
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+
+    def start(number: int) -> None:
+        process = context.Process(
+            target=_run_worker, args=(number, workers, listen, mmap), name=f"rag-worker-{number}"
+        )
+        process.start()
+        processes[number] = process
+
+    # SIGTERM shuts the workers down like Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    for number in range(workers):
+        start(number)
+    print(f"[server] Listening on http://{host}:{sock.getsockname()[1]} with {workers} worker(s)")
+    try:
+        while True:
+            time.sleep(1)
+            for number, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"[server] worker {number} exited with code {process.exitcode}; restarting it")
+                    start(number)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+        sock.close()
+        print("[server] Stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RAGBot over HTTP with several worker processes.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--no-mmap", action="store_true", help="load a private copy of the index per worker")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, mmap=not args.no_mmap)
@@ -0,0 +1,447 @@
+"""
+sharded_index.py
+-----------------
+FAISS index split into shards that are built, searched and replaced
+independently.
+
+INDEX_SHARDING = "source" gives every PDF its own shard; "size" cuts the
+corpus into shards of SHARD_MAX_CHUNKS chunks. Each shard has the same
+layout as faiss_index/ (index.faiss + a chunk store), in a versioned folder:
+
+    faiss_shards/<name>/CURRENT        name of the live version, e.g. "v3"
+    faiss_shards/<name>/v3/index.faiss
+    faiss_shards/<name>/v3/chunks/
+    faiss_shards/<name>/v3/filters/    metadata bitmaps (metadata_filter.py)
+    faiss_shards/<name>/v3/vectors.npy float32 vectors for rescoring (int8 / float16 only)
+    faiss_shards/<name>/v3/meta.json   model, index type, digest of chunk ids
+
+build_shards() only rebuilds shards whose chunks changed (or the ones
+named). Up to SHARD_BUILD_WORKERS of them are built at a time. Embedding
+goes through one shared model, one shard at a time, while index training,
+adding and writing run in parallel. A new version is written next to the
+old one and published by replacing CURRENT, so readers never see a
+half-written shard.
+
+ShardedVectorStore loads every shard and offers the parts of a LangChain
+FAISS store that RAGBot uses (index.search, docstore, similarity_search).
+A search runs on all shards at once on a thread pool (FAISS releases the
+GIL) and the per-shard top-k lists are merged by distance. Row ids are
+(shard slot << 32) | row within the shard. A filtered search applies each
+shard's own bitmaps and skips shards with no matching rows, so a query
+about one paper only searches that paper's shard.
+
+refresh() reloads only the shards whose CURRENT changed, and adds or drops
+shards, then swaps them in at once. The previous generation stays
+reachable, so ids from a search that straddles a swap still resolve.
+Re-indexing one paper does not touch the other shards.
+
+BM25 is not built per shard: hybrid retrieval falls back to dense search on
+a sharded index.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+import metrics
+from chunk_store import ChunkStore, write_chunk_store
+from metadata_filter import FilterIndex, count, filtered_search
+from config import (
+    CHUNK_STORE_DIR,
+    FAISS_SHARDS_PATH,
+    EMBEDDING_MODEL_NAME,
+    FAISS_INDEX_TYPE,
+    INDEX_PRECISION,
+    INDEX_SHARDING,
+    SHARD_MAX_CHUNKS,
+    SHARD_BUILD_WORKERS,
+    SHARD_SEARCH_WORKERS,
+    SHARD_REFRESH_S,
+)
+
+_SLOT_BITS = 32
+_ROW_MASK = (1 << _SLOT_BITS) - 1
+
+_search_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _search_pool
+    with _pool_lock:
+        if _search_pool is None:
+            workers = SHARD_SEARCH_WORKERS or os.cpu_count() or 1
+            _search_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search")
+        return _search_pool
+
+
+# -- build ----------------------------------------------------------------
+
+def shard_name(source: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", Path(source).stem) or "shard"
+
+
+def assign_shards(docs, by: str = INDEX_SHARDING, max_chunks: int = SHARD_MAX_CHUNKS) -> dict:
+    """
+    Shard name -> its Documents, in corpus order.
+    """
+    if by == "source":
+        groups = {}
+        for d in docs:
+            groups.setdefault(shard_name(d.metadata["source"]), []).append(d)
+        return groups
+    if by == "size":
+        docs = list(docs)
+        return {
+            f"part-{i // max_chunks:04d}": docs[i:i + max_chunks]
+            for i in range(0, len(docs), max_chunks)
+        }
+    raise ValueError(f"Unknown sharding: {by!r}")
+
+
+def _digest(ids) -> str:
+    return hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()
+
+
+def current_version(name: str, root: Path = FAISS_SHARDS_PATH):
+    try:
+        return (root / name / "CURRENT").read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def shard_names(root: Path = FAISS_SHARDS_PATH) -> list:
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if (p / "CURRENT").exists())
+
+
+def _read_meta(name: str, root: Path):
+    version = current_version(name, root)
+    if version is None:
+        return None
+    try:
+        return json.loads((root / name / version / "meta.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+def _publish(name: str, version: str, root: Path) -> None:
+    """
+    Points CURRENT at version (atomic rename) and removes versions older
+    than the previous one.
+    """
+    folder = root / name
+    previous = current_version(name, root)
+    tmp = folder / "CURRENT.tmp"
+    tmp.write_text(version, encoding="utf-8")
+    tmp.replace(folder / "CURRENT")
+    for old in folder.iterdir():
+        if old.is_dir() and old.name not in (version, previous):
+            # A process may still map an old version (fails on Windows; retried next time)
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _next_version(name: str, root: Path) -> str:
+    folder = root / name
+    numbers = [int(p.name[1:]) for p in folder.glob("v*") if p.name[1:].isdigit()] if folder.exists() else []
+    return f"v{max(numbers, default=0) + 1}"
+
+
+def build_shards(only=None, full_rebuild: bool = False, workers: int = SHARD_BUILD_WORKERS, root: Path = FAISS_SHARDS_PATH) -> list:
+    """
+    Builds the shards of the ingest chunk store that are missing or out of
+    date (all with full_rebuild, or just the names in `only`). Returns the
+    names built.
+    """
+    from embedding_engine import EmbeddingEngine
+    from vector_store import is_scalar_quantized, make_index, save_vectors
+
+    with metrics.span("build.load_chunks"):
+        store = ChunkStore(CHUNK_STORE_DIR)
+        docs = list(store.iter_documents())
+        store.close()
+    groups = assign_shards(docs)
+
+    if only:
+        unknown = set(only) - set(groups)
+        if unknown:
+            raise SystemExit(f"[build_shards] No such shard(s): {', '.join(sorted(unknown))}")
+
+    todo = []
+    for name, group in groups.items():
+        meta = {
+            "embedding_model_name": EMBEDDING_MODEL_NAME,
+            "index_type": FAISS_INDEX_TYPE,
+            "precision": INDEX_PRECISION,
+            "digest": _digest(d.metadata["chunk_id"] for d in group),
+            "num_vectors": len(group),
+        }
+        if only:
+            if name in only:
+                todo.append((name, group, meta))
+        elif full_rebuild or _read_meta(name, root) != meta:
+            todo.append((name, group, meta))
+
+    if not only:
+        for name in shard_names(root):
+            if name not in groups:
+                print(f"[build_shards] Removing shard {name} (no chunks left)")
+                (root / name / "CURRENT").unlink()
+                shutil.rmtree(root / name, ignore_errors=True)
+
+    print(f"[build_shards] {len(groups)} shards ({INDEX_SHARDING}); building {len(todo)}")
+    if not todo:
+        return []
+
+    embeddings = EmbeddingEngine(EMBEDDING_MODEL_NAME)
+    embed_lock = threading.Lock()
+
+    def build_one(name, group, meta):
+        with metrics.span("build.shard", shard=name, chunks=len(group)):
+            # One shard embeds at a time: the model already uses every core
+            with embed_lock:
+                with metrics.span("build.embed", chunks=len(group)):
+                    vectors = embeddings.embed_array([d.page_content for d in group])
+            with metrics.span("build.index", index_type=FAISS_INDEX_TYPE):
+                index = make_index(vectors, FAISS_INDEX_TYPE)
+                index.add(vectors)
+
+            version = _next_version(name, root)
+            path = root / name / version
+            path.mkdir(parents=True)
+            with metrics.span("build.save", vectors=index.ntotal):
+                write_chunk_store(path / "chunks", group)
+                store = ChunkStore(path / "chunks")
+                FilterIndex.build(store).save(path / "filters")
+                store.close()
+                faiss.write_index(index, str(path / "index.faiss"))
+                if is_scalar_quantized(index):
+                    save_vectors(vectors, path / "vectors.npy")
+                (path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+            _publish(name, version, root)
+        print(f"[build_shards] {name} {version}: {len(group)} chunks")
+
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+        for future in [pool.submit(build_one, *item) for item in todo]:
+            future.result()
+
+    metrics.count("build.embedding_cache_hits", embeddings.hits)
+    metrics.count("build.embedded", embeddings.misses)
+    print(f"[build_shards] Embedding cache: {embeddings.hits} hits, {embeddings.misses} encoded")
+    return [name for name, _, _ in todo]
+
+
+# -- search ---------------------------------------------------------------
+
+class Shard:
+    def __init__(self, slot: int, name: str, version: str, index, store=None, filters=None):
+        self.slot = slot
+        self.name = name
+        self.version = version
+        self.index = index
+        self.store = store
+        self.filters = filters
+
+    @classmethod
+    def load(cls, slot: int, name: str, version: str, root: Path = FAISS_SHARDS_PATH) -> "Shard":
+        from vector_store import load_filter_index, open_index
+
+        path = root / name / version
+        index = open_index(path / "index.faiss", path / "vectors.npy")
+        store = ChunkStore(path / "chunks")
+        filters = load_filter_index(path / "filters", store, index.ntotal)
+        return cls(slot, name, version, index, store, filters)
+
+    def search(self, vectors: np.ndarray, k: int, filters=None):
+        """
+        (distances, global row ids) of this shard's top-k, among the rows
+        matching filters when given.
+        """
+        k = min(k, self.index.ntotal)
+        if filters is None:
+            distances, rows = self.index.search(vectors, k)
+        elif self.filters is None:
+            raise ValueError(f"Shard {self.name} has no metadata filters; rebuild it to filter")
+        else:
+            bitmap = self.filters.bitmap(filters)
+            matches = count(bitmap)
+            if not matches:
+                empty = np.empty((len(vectors), 0))
+                return empty.astype(np.float32), empty.astype(np.int64)
+            distances, rows = filtered_search(self.index, vectors, min(k, matches), bitmap, matches)
+        ids = np.where(rows >= 0, (self.slot << _SLOT_BITS) | rows, -1)
+        return distances, ids
+
+
+def merge_top_k(results, nq: int, k: int):
+    """
+    Merges per-shard (distances, ids) into the k smallest distances per
+    query, padding with (inf, -1) when there are fewer than k hits.
+    """
+    results = [r for r in results if r[0].shape[1]]
+    if not results:
+        return np.full((nq, k), np.inf, dtype=np.float32), np.full((nq, k), -1, dtype=np.int64)
+    distances = np.hstack([r[0] for r in results])
+    ids = np.hstack([r[1] for r in results])
+    distances = np.where(ids >= 0, distances, np.inf)
+    if distances.shape[1] < k:
+        pad = k - distances.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+    top = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+
+class ShardedIndex:
+    """
+    Stands in for a FAISS index: search() fans out to every shard.
+    """
+
+    def __init__(self, shards):
+        self.shards = tuple(shards)
+        self.ntotal = sum(s.index.ntotal for s in self.shards)
+        self.d = self.shards[0].index.d if self.shards else 0
+
+    def search(self, vectors, k: int, filters=None):
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        with metrics.span("shards.search", shards=len(self.shards), k=k):
+            if len(self.shards) == 1:
+                results = [self.shards[0].search(vectors, k, filters)]
+            else:
+                results = list(_pool().map(lambda s: s.search(vectors, k, filters), self.shards))
+            return merge_top_k(results, len(vectors), k)
+
+
+class _ShardFilters:
+    """
+    ShardedVectorStore.filters: filtered search goes through the shards'
+    own bitmaps.
+    """
+
+    def search(self, index, vectors, k: int, filters):
+        return index.search(vectors, k, filters)
+
+
+class _ShardRowIds(Mapping):
+    """
+    index_to_docstore_id: a global row id maps to itself, if its shard is
+    known.
+    """
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0 or (i >> _SLOT_BITS) not in self._owner._slots:
+            raise KeyError(i)
+        return i
+
+    def __iter__(self):
+        for s in self._owner.index.shards:
+            for row in range(s.index.ntotal):
+                yield (s.slot << _SLOT_BITS) | row
+
+    def __len__(self) -> int:
+        return self._owner.index.ntotal
+
+
+class _ShardDocstore:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def search(self, row):
+        row = int(row)
+        shard = self._owner._slots.get(row >> _SLOT_BITS)
+        if shard is None:
+            return f"ID {row} not found."
+        return shard.store.document(row & _ROW_MASK)
+
+
+class ShardedVectorStore:
+    def __init__(self, embeddings, root: Path = FAISS_SHARDS_PATH, refresh_s: float = SHARD_REFRESH_S):
+        self.embeddings = embeddings
+        self.root = Path(root)
+        self.refresh_s = refresh_s
+        self.bm25 = None
+        self.filters = _ShardFilters()
+        self._normalize_L2 = False
+        self.index = ShardedIndex(())
+        self.index_to_docstore_id = _ShardRowIds(self)
+        self.docstore = _ShardDocstore(self)
+        self._slots = {}  # slot -> Shard, current generation plus the previous one
+        self._next_slot = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @property
+    def index_version(self) -> str:
+        return ",".join(f"{s.name}:{s.version}" for s in self.index.shards)
+
+    def refresh(self) -> list:
+        """
+        Loads shards that are new or have a new CURRENT version and drops
+        removed ones. Returns the names that changed.
+        """
+        with self._lock:
+            self._checked = time.monotonic()
+            live = {s.name: s for s in self.index.shards}
+            wanted = {name: current_version(name, self.root) for name in shard_names(self.root)}
+            changed = [n for n, v in wanted.items() if v and (n not in live or live[n].version != v)]
+            removed = [n for n in live if n not in wanted]
+            if not changed and not removed:
+                return []
+
+            shards = []
+            for name, version in sorted(wanted.items()):
+                if name in changed:
+                    with metrics.span("shards.load", shard=name):
+                        shards.append(Shard.load(self._next_slot, name, version, self.root))
+                    self._next_slot += 1
+                else:
+                    shards.append(live[name])
+            previous = self.index.shards
+            # Searches already running keep using the old generation
+            self._slots = {s.slot: s for s in previous + tuple(shards)}
+            self.index = ShardedIndex(shards)
+            if previous:
+                print(f"[ShardedVectorStore] Swapped in {changed or '-'}, removed {removed or '-'}")
+            return changed + removed
+
+    def maybe_refresh(self) -> None:
+        if self.refresh_s and time.monotonic() - self._checked >= self.refresh_s:
+            self.refresh()
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs):
+        distances, rows = self.index.search(np.asarray([embedding], dtype=np.float32), k)
+        return [
+            (self.docstore.search(r), float(d))
+            for d, r in zip(distances[0], rows[0]) if r != -1
+        ]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k)
+
+
+def load_sharded_store(embeddings) -> ShardedVectorStore:
+    db = ShardedVectorStore(embeddings)
+    if not db.index.shards:
+        raise FileNotFoundError(f"No shards in {FAISS_SHARDS_PATH}; run `python vector_store.py` first.")
+    print(f"[load_sharded_store] {len(db.index.shards)} shards, {db.index.ntotal} vectors")
+    return db
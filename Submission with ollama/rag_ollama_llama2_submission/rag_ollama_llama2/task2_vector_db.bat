@@ -38,7 +38,7 @@ if errorlevel 1 (
 echo.
 
 REM --- 4) Build the vector database using vector_store.py ---
-echo [INFO] Building FAISS vector index from chunks.pkl ...
+echo [INFO] Building FAISS vector index from artifacts\chunks ...
 python vector_store.py
 if errorlevel 1 (
     echo.
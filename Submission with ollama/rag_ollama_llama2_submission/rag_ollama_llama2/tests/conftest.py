@@ -0,0 +1,120 @@
+"""
+Shared test setup.
+
+The project is a folder of flat modules, so it is put on sys.path here.
+RAG_ARTIFACTS_DIR points config.py at a temporary folder before anything
+imports it, so tests never touch artifacts/. write_pdf() makes small text
+PDFs that pypdf (and PyPDFLoader) can read.
+"""
+
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["RAG_ARTIFACTS_DIR"] = tempfile.mkdtemp(prefix="rag-tests-")
+
+WORDS = (
+    "attention transformer encoder decoder token embedding layer model training "
+    "corpus sequence vector query key value head residual dropout batch gradient "
+    "pretraining finetuning benchmark dataset masking objective translation"
+).split()
+
+
+def sample_text(seed: int, lines: int = 40, width: int = 80) -> str:
+    """
+    Deterministic filler text of `lines` lines, at most `width` characters each.
+    """
+    rng = random.Random(seed)
+    out = []
+    for _ in range(lines):
+        line = []
+        while sum(len(w) + 1 for w in line) < width - 12:
+            line.append(rng.choice(WORDS))
+        out.append(" ".join(line))
+    return "\n".join(out)
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages) -> Path:
+    """
+    Writes a PDF with one page per string in pages (lines split on "\\n").
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "40 780 Td"]
+        ops += [f"({_escape(line)}) Tj T*" for line in text.split("\n")]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792]"
+            b" /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path = Path(path)
+    path.write_bytes(bytes(out))
+    return path
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    """
+    Points ingest.py at a temporary chunk store and manifest. Call the
+    returned function with the PDF paths to ingest, in corpus order.
+    """
+    import ingest
+
+    monkeypatch.setattr(ingest, "CHUNK_STORE_DIR", tmp_path / "chunks")
+    monkeypatch.setattr(ingest, "MANIFEST_PATH", tmp_path / "manifest.json")
+
+    def use(*paths):
+        monkeypatch.setattr(ingest, "PDF_FILES", [Path(p) for p in paths])
+
+    return use
+
+
+@pytest.fixture
+def fake_store(monkeypatch):
+    """
+    A small in-memory FAISS store over a deterministic fake embedding,
+    installed as the process-wide store RAGBot retrieves from.
+    """
+    import chatbot
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    texts = [sample_text(i, lines=6) for i in range(20)]
+    metadatas = [{"chunk_id": f"c{i}", "source": f"paper{i % 2}.pdf", "page": i} for i in range(20)]
+    db = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=32), metadatas=metadatas)
+    monkeypatch.setattr(chatbot, "_shared_db", db)
+    chatbot.clear_caches()
+    yield db
+    chatbot.clear_caches()
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+import config
+from chatbot import RAGBot
+from fakes import FakeLLM
+
+
+def make_bot(latency=0.05, token_delay=0.0, **kwargs):
+    return RAGBot(llm=FakeLLM(latency=latency, token_delay=token_delay), memory_mode="window", **kwargs)
+
+
+def test_same_session_turns_run_in_order(fake_store):
+    bot = make_bot(max_concurrency=4)
+
+    async def main():
+        return await asyncio.gather(*(bot.aask(f"question {i}", "s") for i in range(4)))
+
+    answers = asyncio.run(main())
+
+    assert answers == [f"Fake answer to: question {i}" for i in range(4)]
+    assert bot.llm.peak == 1
+    # Each turn sees every earlier turn of its session
+    for i, prompt in enumerate(bot.llm.prompts):
+        assert f"User: question {i}\n" in prompt
+        for j in range(i):
+            assert f"Human: question {j}\n" in prompt
+
+
+def test_sessions_are_isolated_and_run_concurrently(fake_store):
+    sessions = ["a", "b", "c", "d"]
+    bot = make_bot(latency=0.1, max_concurrency=len(sessions))
+
+    async def main():
+        await asyncio.gather(*(bot.aask(f"first from {s}", s) for s in sessions))
+        await asyncio.gather(*(bot.aask(f"second from {s}", s) for s in sessions))
+
+    asyncio.run(main())
+
+    assert bot.llm.peak == len(sessions)
+    for prompt in bot.llm.prompts[len(sessions):]:
+        own = prompt.rsplit("User: second from ", 1)[1].split("\n")[0]
+        assert f"Human: first from {own}\n" in prompt
+        assert not any(f"from {s}" in prompt for s in sessions if s != own)
+    for s in sessions:
+        history = bot.session_memory(s).buffer
+        assert history.count("Human:") == 2
+        assert all(f"from {o}" not in history for o in sessions if o != s)
+
+
+def test_generations_are_capped_by_ollama_max_concurrency(fake_store):
+    bot = make_bot()
+    cap = config.OLLAMA_MAX_CONCURRENCY
+    assert bot.scheduler.max_concurrency == cap
+
+    async def main():
+        await asyncio.gather(*(bot.aask("question", f"s{i}") for i in range(3 * cap)))
+
+    asyncio.run(main())
+
+    assert bot.llm.calls == 3 * cap
+    assert bot.llm.peak == cap
+    assert bot.scheduler.stats() == {"max_concurrency": cap, "queued": 0, "in_flight": 0, "completed": 3 * cap}
+
+
+def test_cancel_while_queued_leaves_no_trace(fake_store):
+    bot = make_bot(latency=0.2, max_concurrency=1)
+
+    async def main():
+        first = asyncio.create_task(bot.aask("first", "a"))
+        while bot.scheduler.in_flight == 0:
+            await asyncio.sleep(0.005)
+        # Waits for the session lock of "a"
+        behind = asyncio.create_task(bot.aask("behind", "a"))
+        # Retrieves, then waits for the only generation slot
+        queued = asyncio.create_task(bot.aask("queued", "b"))
+        while bot.scheduler.queued == 0:
+            await asyncio.sleep(0.005)
+        behind.cancel()
+        queued.cancel()
+        for task in (behind, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert bot.scheduler.queued == 0
+
+        assert await first == "Fake answer to: first"
+        # Neither the slot nor the session lock was leaked
+        assert await asyncio.wait_for(bot.aask("again", "a"), 2) == "Fake answer to: again"
+        assert await asyncio.wait_for(bot.aask("again", "b"), 2) == "Fake answer to: again"
+
+    asyncio.run(main())
+
+    assert [p.rsplit("User: ", 1)[1].split("\n")[0] for p in bot.llm.prompts] == ["first", "again", "again"]
+    assert "behind" not in bot.session_memory("a").buffer
+    assert "queued" not in bot.session_memory("b").buffer
+    assert bot.scheduler.stats()["in_flight"] == 0
+
+
+def test_aask_stream_saves_the_turn_only_when_read_to_the_end(fake_store):
+    bot = make_bot(latency=0.01, token_delay=0.005)
+
+    async def read_all():
+        return [token async for token in bot.aask_stream("hello there", "s")]
+
+    async def abandon():
+        stream = bot.aask_stream("dropped", "s")
+        await stream.__anext__()
+        await stream.aclose()
+
+    tokens = asyncio.run(read_all())
+    asyncio.run(abandon())
+
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Fake answer to: hello there"
+    history = bot.session_memory("s").buffer
+    assert "Human: hello there" in history
+    assert "dropped" not in history
+    assert bot.llm.active == 0
+    assert bot.scheduler.stats()["in_flight"] == 0
+
+
+def test_prompt_size_goes_to_metrics_not_stdout(fake_store, capsys):
+    import metrics
+
+    bot = make_bot(latency=0)
+    metrics.reset()
+    metrics.enable()
+    try:
+        asyncio.run(bot.aask("question", "s"))
+        counters = metrics.stats()["counters"]
+    finally:
+        metrics.disable()
+        metrics.reset()
+
+    assert counters["prompt.requests"] == 1
+    assert counters["prompt.tokens"] > counters["prompt.context_tokens"] > 0
+    assert "Prompt ~" not in capsys.readouterr().out
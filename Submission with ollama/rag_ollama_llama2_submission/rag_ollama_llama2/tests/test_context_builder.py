@@ -0,0 +1,57 @@
+from config import HISTORY_TOKEN_BUDGET
+from context_builder import SUMMARY_PREFIX, estimate_tokens, trim_history
+from conversation_memory import SummaryMemory
+from conftest import sample_text
+
+SUMMARY = SUMMARY_PREFIX + "The user is called Ashish and asked about BERT."
+
+
+def turn(question: str, answer: str) -> str:
+    return f"Human: {question}\nAI: {answer}"
+
+
+def test_oldest_turns_go_first():
+    turns = [turn(f"question {i}", sample_text(i, lines=2)) for i in range(6)]
+    history = "\n".join(turns)
+
+    trimmed = trim_history(history, 100)
+
+    assert estimate_tokens(trimmed) <= 100
+    assert trimmed.endswith(turns[-1])
+    assert "question 0" not in trimmed
+
+
+def test_summary_is_kept_when_the_last_turn_is_long():
+    long_turn = turn("Explain attention. " + sample_text(1, lines=30), "It weighs tokens.")
+    history = "\n".join([SUMMARY, turn("What is BERT?", "A model."), long_turn])
+
+    trimmed = trim_history(history, 200)
+
+    assert trimmed.startswith(SUMMARY + "\n")
+    assert estimate_tokens(trimmed) <= 200
+    assert trimmed.endswith("AI: It weighs tokens.")
+    assert "What is BERT?" not in trimmed
+
+
+def test_summary_alone_over_budget_loses_its_tail():
+    summary = SUMMARY + " " + sample_text(2, lines=20).replace("\n", " ")
+    history = "\n".join([summary, turn("Hi", "Hello")])
+
+    trimmed = trim_history(history, 50)
+
+    assert trimmed.startswith(SUMMARY)
+    assert estimate_tokens(trimmed) <= 52  # " ..." marks the cut
+    assert "Human:" not in trimmed
+
+
+def test_summary_memory_keeps_folded_facts_in_the_prompt():
+    memory = SummaryMemory(llm=None)
+    memory.restore({"summary": "The user is called Ashish.", "turns": []})
+    # The latest turn stays verbatim, even over MEMORY_RECENT_TOKENS
+    memory.save_context({"user_input": sample_text(3, lines=40)}, {"answer": "Noted."})
+    assert estimate_tokens(memory.buffer) > HISTORY_TOKEN_BUDGET
+
+    trimmed = trim_history(memory.buffer, HISTORY_TOKEN_BUDGET)
+
+    assert "Ashish" in trimmed
+    assert trimmed.endswith("AI: Noted.")
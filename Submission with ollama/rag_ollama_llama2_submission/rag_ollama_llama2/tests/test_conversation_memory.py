@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import chatbot
+from chatbot import RAGBot
+from conversation_memory import SessionStore, SummaryMemory
+from fakes import FakeLLM
+
+LONG = " ".join(["words"] * 250)  # well over MEMORY_RECENT_TOKENS on its own
+
+# Summary calls of BlockingSummaries wait for `release`
+started = threading.Event()
+release = threading.Event()
+
+
+class BlockingSummaries(FakeLLM):
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        if prompt.startswith("Progressively"):
+            started.set()
+            assert release.wait(5)
+            return "The user is called Ashish."
+        return super()._call(prompt, stop, run_manager, **kwargs)
+
+
+def reset_events():
+    started.clear()
+    release.clear()
+
+
+def test_clear_discards_an_in_flight_summary():
+    reset_events()
+    saved = []
+    memory = SummaryMemory(BlockingSummaries(), recent_tokens=50,
+                           on_change=lambda m: saved.append(m.snapshot()))
+    memory.save_context({"user_input": "My name is Ashish. " + LONG}, {"answer": "Noted."})
+    memory.save_context({"user_input": "What is BERT?"}, {"answer": "A model."})
+    assert started.wait(5)
+
+    memory.clear()
+    cleared = len(saved)
+    release.set()
+    memory.wait(5)
+
+    assert memory.summary == ""
+    assert memory.buffer == ""
+    assert saved[cleared - 1]["turns"] == []
+    assert len(saved) == cleared
+
+
+def test_forgotten_session_is_not_saved_again(fake_store, tmp_path, monkeypatch):
+    reset_events()
+    monkeypatch.setattr(chatbot, "SESSION_STORE_PATH", tmp_path / "sessions.sqlite")
+    bot = RAGBot(llm=BlockingSummaries(), memory_mode="summary", persist_sessions=True)
+
+    bot.ask("My name is Ashish. " + LONG, session_id="s")
+    bot.ask("What is BERT? " + LONG, session_id="s")
+    assert started.wait(5)
+    memory = bot.sessions["s"]
+
+    bot.end_session("s", forget=True)
+    release.set()
+    memory.wait(5)
+
+    assert SessionStore(tmp_path / "sessions.sqlite").load("s") is None
+
+
+def test_summaries_count_against_the_concurrency_cap(fake_store):
+    bot = RAGBot(llm=FakeLLM(latency=0.05), memory_mode="summary", max_concurrency=1)
+    sessions = ["a", "b", "c"]
+
+    async def main():
+        for turn in range(3):
+            await asyncio.gather(*(bot.aask(f"{s} turn {turn} {LONG}", s) for s in sessions))
+            await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    for s in sessions:
+        bot.sessions[s].wait(5)
+
+    summaries = [p for p in bot.llm.prompts if p.startswith("Progressively")]
+    assert summaries
+    assert all(bot.sessions[s].summary for s in sessions)
+    assert bot.llm.peak == 1
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import random
+
+import pytest
+import requests
+
+from downloader import Downloader, DownloadError
+from fakes import FakeFileServer
+
+
+def pdf_bytes(seed: int, size: int = 200_000) -> bytes:
+    return b"%PDF-1.4\n" + random.Random(seed).randbytes(size)
+
+
+def downloader(tmp_path, **kwargs):
+    kwargs.setdefault("retries", 0)
+    kwargs.setdefault("expected_sha256", {})
+    return Downloader(backoff_s=0.0, chunk_bytes=1 << 14, manifest_path=tmp_path / "downloads.json", **kwargs)
+
+
+def leftovers(path):
+    return sorted(p.name for p in path.parent.iterdir() if p.name.startswith(path.name))
+
+
+def test_truncated_download_resumes_where_it_stopped(tmp_path):
+    data = pdf_bytes(1)
+    path = tmp_path / "a.pdf"
+    with FakeFileServer({"a.pdf": data}, truncate={"a.pdf": 70_000}) as server:
+        status = downloader(tmp_path, retries=1).download(server.url + "/a.pdf", path)
+
+    assert status == "resumed"
+    assert path.read_bytes() == data
+    assert leftovers(path) == ["a.pdf"]
+    (_, _, first), (_, _, second) = server.requests
+    assert first is None
+    offset = int(second[len("bytes="):-1])
+    assert 0 < offset <= 70_000
+    assert server.bytes_sent < len(data) + 70_000
+    record = json.loads((tmp_path / "downloads.json").read_text())["a.pdf"]
+    assert record["sha256"] == hashlib.sha256(data).hexdigest()
+    assert record["etag"] == server.etag("a.pdf")
+
+
+def test_interrupted_download_resumes_on_the_next_run(tmp_path):
+    data = pdf_bytes(2)
+    path = tmp_path / "a.pdf"
+    with FakeFileServer({"a.pdf": data}, truncate={"a.pdf": 70_000}) as server:
+        url = server.url + "/a.pdf"
+        with pytest.raises(DownloadError):
+            downloader(tmp_path).download(url, path)
+
+        # Nothing at the final path; the .part and its sidecar are kept
+        assert leftovers(path) == ["a.pdf.part", "a.pdf.part.json"]
+        state = json.loads(path.with_name("a.pdf.part.json").read_text())
+        assert state == {"url": url, "etag": server.etag("a.pdf"), "last_modified": None, "size": len(data)}
+
+        assert downloader(tmp_path).download(url, path) == "resumed"
+        assert downloader(tmp_path).download(url, path) == "present"
+
+    assert path.read_bytes() == data
+    assert leftovers(path) == ["a.pdf"]
+
+
+def test_changed_etag_restarts_the_download(tmp_path):
+    old, new = pdf_bytes(3), pdf_bytes(4, size=150_000)
+    path = tmp_path / "a.pdf"
+    with FakeFileServer({"a.pdf": old}, truncate={"a.pdf": 70_000}) as server:
+        url = server.url + "/a.pdf"
+        with pytest.raises(DownloadError):
+            downloader(tmp_path).download(url, path)
+        server.files["a.pdf"] = new
+
+        # Range + If-Range with the old ETag: the server sends the new file whole
+        assert downloader(tmp_path).download(url, path) == "downloaded"
+        assert server.requests[-1][2] is not None
+
+    assert path.read_bytes() == new
+    assert leftovers(path) == ["a.pdf"]
+
+
+def test_checksum_failure_leaves_no_file(tmp_path):
+    path = tmp_path / "a.pdf"
+    with FakeFileServer({"a.pdf": pdf_bytes(5)}) as server:
+        with pytest.raises(DownloadError, match="SHA-256"):
+            downloader(tmp_path, retries=2, expected_sha256={"a.pdf": "0" * 64}).download(server.url + "/a.pdf", path)
+
+    assert leftovers(path) == []
+    assert len(server.requests) == 1  # a wrong checksum is not retried
+    assert not (tmp_path / "downloads.json").exists()
+
+
+def test_short_body_is_not_renamed_into_place(tmp_path, monkeypatch):
+    iter_content = requests.Response.iter_content
+
+    def first_block_only(self, *args, **kwargs):
+        # A body that ends early without a connection error
+        yield next(iter_content(self, *args, **kwargs))
+
+    monkeypatch.setattr(requests.Response, "iter_content", first_block_only)
+    path = tmp_path / "a.pdf"
+    with FakeFileServer({"a.pdf": pdf_bytes(6)}) as server:
+        with pytest.raises(DownloadError, match=r"got 16384 of 200009 bytes"):
+            downloader(tmp_path).download(server.url + "/a.pdf", path)
+
+    assert leftovers(path) == ["a.pdf.part", "a.pdf.part.json"]
+
+
+def test_non_pdf_is_rejected(tmp_path):
+    path = tmp_path / "a.pdf"
+    page = b"<html><body>Please sign in</body></html>"
+    with FakeFileServer({"a.pdf": page}) as server:
+        with pytest.raises(DownloadError, match="not a PDF"):
+            downloader(tmp_path).download(server.url + "/a.pdf", path)
+
+    assert leftovers(path) == []
+
+
+def test_busy_server_is_retried(tmp_path):
+    data = pdf_bytes(7)
+    path = tmp_path / "a.pdf"
+    with FakeFileServer({"a.pdf": data}, fail_first=2) as server:
+        assert downloader(tmp_path, retries=2).download(server.url + "/a.pdf", path) == "downloaded"
+
+    assert path.read_bytes() == data
+    assert len(server.requests) == 3
@@ -0,0 +1,111 @@
+import pytest
+
+import dedup
+import ingest
+from chunk_store import ChunkStore
+from conftest import sample_text, write_pdf
+
+
+def stored_chunks():
+    store = ChunkStore(ingest.CHUNK_STORE_DIR)
+    try:
+        return [(d.metadata["chunk_id"], d.metadata["source"], d.metadata["page"], d.page_content)
+                for d in store.iter_documents()]
+    finally:
+        store.close()
+
+
+def test_parallel_ingest_matches_serial(tmp_path, corpus):
+    pdfs = [
+        write_pdf(tmp_path / f"paper{i}.pdf", [sample_text(10 * i + p) for p in range(2 + i)])
+        for i in range(3)
+    ]
+    corpus(*pdfs)
+
+    ingest.load_and_chunk(full=True, workers=1)
+    serial = stored_chunks()
+    ingest.load_and_chunk(full=True, workers=3)
+    parallel = stored_chunks()
+
+    assert len(serial) > 3 * len(pdfs)
+    assert [c[0] for c in parallel] == [c[0] for c in serial]
+    assert parallel == serial
+
+
+def test_pages_come_from_pypdfloader(tmp_path, corpus):
+    from langchain_community.document_loaders import PyPDFLoader
+
+    pdf = write_pdf(tmp_path / "paper.pdf", [sample_text(1), sample_text(2)])
+    corpus(pdf)
+    ingest.load_and_chunk(full=True, workers=1)
+
+    pages = PyPDFLoader(str(pdf)).load()
+    expected = ingest._make_splitter().split_documents(pages)
+    assert [c[3] for c in stored_chunks()] == [d.page_content for d in expected]
+    assert [p.page_content for p in ingest.iter_pages()] == [p.page_content for p in pages]
+
+
+def ingest_result():
+    manifest = ingest.load_manifest()
+    return [c[0] for c in stored_chunks()], manifest["files"], manifest["dedup"]
+
+
+def assert_incremental_matches_full():
+    ingest.load_and_chunk(workers=1)
+    incremental = ingest_result()
+    ingest.load_and_chunk(full=True, workers=1)
+    assert incremental == ingest_result()
+
+    kept, files, _ = incremental
+    assert sorted(kept) == sorted(cid for entry in files.values() for cid in entry["chunk_ids"])
+    for entry in files.values():
+        assert set(entry["duplicates"].values()) <= set(kept)
+        assert not set(entry["duplicates"]) & set(kept)
+    return files
+
+
+@pytest.fixture
+def dedup_on(monkeypatch):
+    monkeypatch.setattr(ingest, "DEDUP_ENABLED", True)
+    monkeypatch.setattr(dedup, "DEDUP_ENABLED", True)
+
+
+def test_dedup_is_off_by_default(tmp_path, corpus):
+    shared = sample_text(100)
+    corpus(write_pdf(tmp_path / "a.pdf", [shared]), write_pdf(tmp_path / "b.pdf", [shared]))
+    ingest.load_and_chunk(workers=1)
+
+    files = ingest.load_manifest()["files"]
+    assert files["a.pdf"]["duplicates"] == files["b.pdf"]["duplicates"] == {}
+    assert len(files["a.pdf"]["chunk_ids"]) == len(files["b.pdf"]["chunk_ids"])
+
+
+def test_reingest_after_the_owner_file_changes_or_goes(tmp_path, corpus, dedup_on):
+    shared, moved = sample_text(100), sample_text(101)
+    a = write_pdf(tmp_path / "a.pdf", [sample_text(1), shared])
+    b = write_pdf(tmp_path / "b.pdf", [shared, sample_text(2)])
+    c = write_pdf(tmp_path / "c.pdf", [sample_text(3), moved])
+
+    corpus(a, b, c)
+    files = assert_incremental_matches_full()
+    # b's copy of the shared page is dropped in favour of a's
+    assert files["b.pdf"]["duplicates"]
+    assert set(files["b.pdf"]["duplicates"].values()) <= set(files["a.pdf"]["chunk_ids"])
+
+    # The owner gains a page c had: c's copy is dropped although c is unchanged
+    write_pdf(a, [sample_text(1), shared, moved])
+    files = assert_incremental_matches_full()
+    assert set(files["c.pdf"]["duplicates"].values()) <= set(files["a.pdf"]["chunk_ids"])
+
+    # The owner loses the shared page: b keeps its copy again
+    write_pdf(a, [sample_text(1)])
+    files = assert_incremental_matches_full()
+    assert files["b.pdf"]["duplicates"] == {}
+    assert files["c.pdf"]["duplicates"] == {}
+
+    # The owner is removed altogether
+    write_pdf(a, [sample_text(1), shared])
+    assert_incremental_matches_full()
+    corpus(b, c)
+    files = assert_incremental_matches_full()
+    assert all(entry["duplicates"] == {} for entry in files.values())
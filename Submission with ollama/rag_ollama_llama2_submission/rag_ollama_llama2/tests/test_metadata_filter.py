@@ -0,0 +1,100 @@
+import faiss
+import numpy as np
+import pytest
+
+from config import FILTER_EXACT_BELOW, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, HNSW_M
+from metadata_filter import FilterIndex, count, filtered_search, normalize_filters
+
+ROWS, DIM, K = 1003, 16, 10  # not a multiple of 8, so the last bitmap byte is partial
+PAPERS = [f"paper{i}.pdf" for i in range(40)]
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((ROWS, DIM)).astype(np.float32)
+    queries = rng.standard_normal((20, DIM)).astype(np.float32)
+    codes = rng.integers(0, len(PAPERS), ROWS)
+    pages = rng.integers(0, 30, ROWS).astype(np.int32)
+    return vectors, queries, FilterIndex.from_columns(codes, PAPERS, pages)
+
+
+def brute_force(vectors, queries, mask, k):
+    rows = np.flatnonzero(mask)
+    distances = ((queries[:, None, :] - vectors[None, rows, :]) ** 2).sum(axis=2)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), rows[order]
+
+
+def flat(vectors):
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors)
+    return index
+
+
+def hnsw(vectors):
+    # As vector_store.make_index() builds it
+    index = faiss.IndexHNSWFlat(DIM, HNSW_M)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.add(vectors)
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+FILTERS = {
+    name: normalize_filters(filters) for name, filters in {
+        "wide": {"paper": [name[:-4] for name in PAPERS[:20]]},  # about half the rows
+        "narrow": {"paper": "paper3"},  # under FILTER_EXACT_BELOW
+        "pages": {"paper": [name[:-4] for name in PAPERS[:10]], "page": [0, 9]},
+    }.items()
+}
+
+
+@pytest.mark.parametrize("name", FILTERS)
+def test_flat_search_matches_brute_force(data, name):
+    vectors, queries, filters = data
+    bitmap = filters.bitmap(FILTERS[name])
+
+    distances, rows = filtered_search(flat(vectors), queries, K, bitmap)
+    expected_distances, expected_rows = brute_force(vectors, queries, filters.mask(FILTERS[name]), K)
+
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+
+
+def test_hnsw_below_the_threshold_is_exact(data):
+    vectors, queries, filters = data
+    bitmap = filters.bitmap(FILTERS["narrow"])
+    assert count(bitmap) / ROWS < FILTER_EXACT_BELOW
+
+    _, rows = filtered_search(hnsw(vectors), queries, K, bitmap)
+    _, expected = brute_force(vectors, queries, filters.mask(FILTERS["narrow"]), K)
+
+    np.testing.assert_array_equal(rows, expected)
+
+
+@pytest.mark.parametrize("name", ["wide", "pages"])
+def test_hnsw_returns_matching_rows_with_high_recall(data, name):
+    vectors, queries, filters = data
+    mask = filters.mask(FILTERS[name])
+    assert mask.mean() >= FILTER_EXACT_BELOW
+
+    _, rows = filtered_search(hnsw(vectors), queries, K, filters.bitmap(FILTERS[name]))
+    _, expected = brute_force(vectors, queries, mask, K)
+
+    assert (rows >= 0).all()
+    assert mask[rows].all()
+    recall = np.mean([len(set(r) & set(e)) / K for r, e in zip(rows, expected)])
+    assert recall >= 0.9
+
+
+def test_fewer_matches_than_k_are_padded(data):
+    vectors, queries, filters = data
+    mask = np.zeros(ROWS, dtype=bool)
+    mask[[5, 500, ROWS - 1]] = True
+    bitmap = np.packbits(mask, bitorder="little")
+
+    for index in (flat(vectors), hnsw(vectors)):
+        distances, rows = filtered_search(index, queries, K, bitmap)
+        assert (np.sort(rows[:, :3], axis=1) == [5, 500, ROWS - 1]).all()
+        assert (rows[:, 3:] == -1).all()
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+import config
+from fakes import FakeLLM, FakeOllamaServer
+from ollama_client import OllamaClient, OllamaError, default_options
+
+PROMPT = "Context: ...\nUser: What is attention?\nAssistant:"
+ANSWER = FakeLLM.answer_for(PROMPT)
+
+
+def client_for(server, **kwargs):
+    kwargs.setdefault("backoff_s", 0.0)
+    return OllamaClient(base_url=server.url, model="llama2", **kwargs)
+
+
+async def collect(client, prompt):
+    return [token async for token in client.astream(prompt)]
+
+
+def test_generate_retries_until_the_server_answers():
+    with FakeOllamaServer(fail_first=2) as server:
+        client = client_for(server, retries=3)
+        assert client.generate(PROMPT) == ANSWER
+
+    assert len(server.bodies) == 3
+    assert client.stats() == {"requests": 3, "retries": 2}
+
+
+def test_generate_gives_up_after_the_last_retry():
+    with FakeOllamaServer(fail_first=5) as server:
+        client = client_for(server, retries=1)
+        with pytest.raises(OllamaError, match="after 2 attempts"):
+            client.generate(PROMPT)
+
+    assert len(server.bodies) == 2
+
+
+def test_streams_are_retried_before_the_first_token():
+    with FakeOllamaServer(fail_first=1) as server:
+        client = client_for(server)
+        assert "".join(client.stream(PROMPT)) == ANSWER
+        assert client.retried == 1
+
+    with FakeOllamaServer(fail_first=1) as server:
+        client = client_for(server)
+        assert "".join(asyncio.run(collect(client, PROMPT))) == ANSWER
+        assert client.retried == 1
+        assert len(server.bodies) == 2
+
+
+def test_streams_are_not_retried_after_the_first_token():
+    with FakeOllamaServer(fail_streams=1) as server:
+        client = client_for(server)
+        received = []
+        with pytest.raises(OllamaError, match="unexpectedly stopped"):
+            for token in client.stream(PROMPT):
+                received.append(token)
+        assert received == FakeLLM.tokens_for(PROMPT)[:1]
+        assert len(server.bodies) == 1 and client.retried == 0
+
+    with FakeOllamaServer(fail_streams=1) as server:
+        client = client_for(server)
+        with pytest.raises(OllamaError):
+            asyncio.run(collect(client, PROMPT))
+        assert len(server.bodies) == 1 and client.retried == 0
+
+
+def test_every_request_carries_keep_alive_and_options():
+    options = {"num_ctx": 2048, "num_thread": 4, "temperature": 0.1}
+    with FakeOllamaServer() as server:
+        client = client_for(server, keep_alive="30m", options=options)
+        client.generate(PROMPT)
+        "".join(client.stream(PROMPT, stop=["User:"]))
+        asyncio.run(collect(client, PROMPT))
+        client.generate(PROMPT, temperature=0.7)
+
+    for body in server.bodies:
+        assert body["model"] == "llama2"
+        assert body["keep_alive"] == "30m"
+        assert body["options"]["num_ctx"] == 2048
+        assert body["options"]["num_thread"] == 4
+    assert [b["stream"] for b in server.bodies] == [False, True, True, False]
+    assert server.bodies[1]["options"]["stop"] == ["User:"]
+    assert server.bodies[3]["options"]["temperature"] == 0.7
+
+
+def test_default_options_come_from_config():
+    with FakeOllamaServer() as server:
+        client = client_for(server)
+        client.generate(PROMPT)
+
+    assert server.bodies[0]["keep_alive"] == config.OLLAMA_KEEP_ALIVE
+    assert server.bodies[0]["options"] == default_options()
+    assert default_options()["num_ctx"] == config.OLLAMA_NUM_CTX
+    assert ("num_thread" in default_options()) == bool(config.OLLAMA_NUM_THREAD)
+
+
+def test_requests_reuse_one_connection():
+    with FakeOllamaServer() as server:
+        client = client_for(server)
+        for _ in range(3):
+            assert client.generate(PROMPT) == ANSWER
+            assert "".join(client.stream(PROMPT)) == ANSWER
+        assert "".join(asyncio.run(collect(client, PROMPT))) == ANSWER
+        client.load_model()
+
+    assert len(server.bodies) == 8
+    assert server.connections == 1
+
+
+def test_cancelled_astream_releases_its_connection():
+    async def main(client):
+        received = []
+
+        async def consume():
+            async for token in client.astream(PROMPT):
+                received.append(token)
+
+        task = asyncio.create_task(consume())
+        while not received:
+            await asyncio.sleep(0.01)
+        # The next token is being read on a worker thread
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return received
+
+    with FakeOllamaServer(token_delay=0.3) as server:
+        client = client_for(server, pool_size=2)
+        assert len(asyncio.run(main(client))) == 1
+        pool = client.session.get_adapter(server.url).poolmanager.connection_from_url(server.url)
+        # Every connection is back in the pool
+        assert pool.pool.qsize() == 2
+        assert client.generate(PROMPT) == ANSWER
@@ -0,0 +1,78 @@
+import asyncio
+
+from scheduler import RequestScheduler
+
+
+def test_slots_bound_concurrency():
+    scheduler = RequestScheduler(2)
+    running = []
+    peak = 0
+
+    async def job(i):
+        nonlocal peak
+        async with scheduler.slot():
+            running.append(i)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(i)
+
+    async def main():
+        await asyncio.gather(*(job(i) for i in range(6)))
+
+    asyncio.run(main())
+
+    assert peak == 2
+    assert scheduler.stats() == {"max_concurrency": 2, "queued": 0, "in_flight": 0, "completed": 6}
+
+
+def test_generate_releases_the_slot_on_error():
+    scheduler = RequestScheduler(1)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def main():
+        for _ in range(2):
+            try:
+                await scheduler.generate(fail)
+            except RuntimeError:
+                pass
+        return await asyncio.wait_for(scheduler.generate(lambda: asyncio.sleep(0, "ok")), 1)
+
+    assert asyncio.run(main()) == "ok"
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_drop_session_keeps_a_held_lock():
+    scheduler = RequestScheduler(1)
+
+    async def main():
+        lock = scheduler.session_lock("s")
+        async with lock:
+            scheduler.drop_session("s")
+            assert scheduler.session_lock("s") is lock
+        scheduler.drop_session("s")
+        assert scheduler.session_lock("s") is not lock
+
+    asyncio.run(main())
+
+
+def test_run_from_another_thread_takes_a_slot():
+    scheduler = RequestScheduler(1)
+    order = []
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        async with scheduler.slot():
+            thread = loop.run_in_executor(None, scheduler.run, order.append, "thread")
+            await asyncio.sleep(0.1)
+            assert scheduler.stats()["queued"] == 1
+            order.append("slot holder")
+        await thread
+
+    asyncio.run(main())
+
+    assert order == ["slot holder", "thread"]
+    assert scheduler.stats() == {"max_concurrency": 1, "queued": 0, "in_flight": 0, "completed": 2}
+    # Without a running loop the call is made directly
+    assert scheduler.run(len, "abc") == 3
@@ -0,0 +1,92 @@
+import sqlite3
+
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+
+def vector(seed: int, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def open_cache(path, model="model-a", maxsize=100):
+    return SemanticCache(path, threshold=0.9, maxsize=maxsize, model=model)
+
+
+def test_hits_survive_a_restart_under_the_same_model(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = open_cache(path)
+    cache.add("what is attention", vector(1), ["c1", "c2"], "answer")
+    cache.close()
+
+    cache = open_cache(path)
+    assert len(cache) == 1
+    assert cache.lookup(vector(1) * 3, ["c1", "c2"]) == "answer"
+    assert cache.lookup(vector(1), ["c1"]) is None
+    assert cache.lookup(vector(2), ["c1", "c2"]) is None
+
+
+def test_rows_of_another_model_are_dropped_on_open(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = open_cache(path, model="model-a")
+    cache.add("what is attention", vector(1, dim=8), ["c1"], "answer")
+    cache.close()
+
+    # Another model with another dimension: no error, no stale hit
+    cache = open_cache(path, model="model-b")
+    assert len(cache) == 0
+    assert cache.lookup(vector(1, dim=16), ["c1"]) is None
+    cache.add("what is attention", vector(1, dim=16), ["c1"], "new answer")
+    assert cache.lookup(vector(1, dim=16), ["c1"]) == "new answer"
+    cache.close()
+
+    # Same dimension, different space: not served either
+    cache = open_cache(path, model="model-c")
+    assert cache.lookup(vector(1, dim=16), ["c1"]) is None
+    cache.close()
+
+
+def test_rows_from_before_models_were_recorded_are_dropped(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE answers (id INTEGER PRIMARY KEY, query TEXT NOT NULL, context_ids TEXT NOT NULL,"
+        " answer TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+    )
+    with conn:
+        conn.execute(
+            "INSERT INTO answers (query, context_ids, answer, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+            ("q", '["c1"]', "old", vector(1).tobytes(), 0.0),
+        )
+    conn.close()
+
+    cache = open_cache(path)
+    assert len(cache) == 0
+    assert cache.lookup(vector(1), ["c1"]) is None
+
+
+def test_growth_and_eviction_keep_vectors_aligned(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = open_cache(path, maxsize=20)
+    for i in range(50):
+        cache.add(f"q{i}", vector(i, dim=32), [f"c{i}"], f"a{i}")
+
+    assert len(cache) == 20
+    for i in range(50):
+        assert cache.lookup(vector(i, dim=32), [f"c{i}"]) == (f"a{i}" if i >= 30 else None)
+    cache.close()
+
+    cache = open_cache(path, maxsize=20)
+    cache.add("q50", vector(50, dim=32), ["c50"], "a50")
+    assert cache.lookup(vector(49, dim=32), ["c49"]) == "a49"
+    assert cache.lookup(vector(50, dim=32), ["c50"]) == "a50"
+
+
+def test_the_most_similar_match_wins(tmp_path):
+    cache = open_cache(tmp_path / "cache.sqlite")
+    base = vector(1)
+    cache.add("far", base + 0.3 * vector(2), ["c1"], "far")
+    cache.add("near", base + 0.05 * vector(3), ["c1"], "near")
+    cache.add("other contexts", base, ["c2"], "other")
+
+    assert cache.lookup(base, ["c1"]) == "near"
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import metrics
+import server
+import vector_store
+from chatbot import RAGBot
+from fakes import FakeLLM
+
+
+def make_worker():
+    worker = server.Worker(0, 1)
+    worker.bot = RAGBot(llm=FakeLLM(), memory_mode="window")
+    worker.ready = True
+    return worker
+
+
+def post(worker, body):
+    async def main():
+        async with TestClient(TestServer(worker.app())) as client:
+            response = await client.post("/ask", json=body)
+            return response.status, await response.json()
+
+    return asyncio.run(main())
+
+
+def test_ask_answers(fake_store):
+    status, body = post(make_worker(), {"query": "What is attention?", "session_id": "s"})
+
+    assert status == 200
+    assert body["answer"] == "Fake answer to: What is attention?"
+    assert body["session_id"] == "s"
+
+
+def test_bad_filters_are_rejected_before_the_bot_runs(fake_store):
+    worker = make_worker()
+
+    status, body = post(worker, {"query": "q", "filters": {"colour": "red"}})
+    assert status == 400 and "unknown filter" in body["error"]
+    # The test store was built without filter bitmaps
+    status, body = post(worker, {"query": "q", "filters": {"paper": "bert"}})
+    assert status == 400 and "no metadata filters" in body["error"]
+
+    assert worker.requests == 0
+    assert worker.bot.llm.calls == 0
+
+
+def test_internal_errors_are_not_reported_as_bad_requests(fake_store):
+    worker = make_worker()
+
+    async def broken(*args):
+        raise ValueError("could not convert string to float")
+
+    worker.bot.aask = broken
+    status, body = post(worker, {"query": "q"})
+
+    assert status == 500
+    assert "could not convert" in body["error"]
+    assert worker.errors == 1
+
+
+def test_failed_warm_up_ends_the_worker(fake_store, monkeypatch, capsys):
+    worker = make_worker()
+    worker.ready = False
+
+    def warm_up():
+        raise FileNotFoundError("No chunk store in artifacts/chunks")
+
+    worker.warm_up = warm_up
+    monkeypatch.setattr(server, "Worker", lambda number, workers: worker)
+    monkeypatch.setattr(vector_store, "INDEX_MMAP", vector_store.INDEX_MMAP)
+    try:
+        with pytest.raises(SystemExit) as exit:
+            server._run_worker(0, 1, ("127.0.0.1", 0), mmap=True)
+    finally:
+        metrics.disable()
+
+    assert exit.value.code == 1
+    assert "warm-up failed: FileNotFoundError: No chunk store" in capsys.readouterr().out
+    assert not worker.ready
@@ -2,43 +2,761 @@
 vector_store.py
 ----------------
 Builds and loads a FAISS vector store from the preprocessed chunks.
+
+On disk the index is artifacts/faiss_index/index.faiss plus a chunk store
+(faiss_index/chunks/, see chunk_store.py) whose row i is FAISS vector i.
+Loading maps that store read-only instead of unpickling a docstore.
+
+Builds are incremental when possible: vectors whose chunk_id is no longer in
+the ingest chunk store are deleted, and only chunks not yet in the index are
+embedded.
+
+FAISS_INDEX_TYPE picks the index: exact "flat", or approximate "ivf_flat",
+"ivf_pq" and "hnsw" (see make_index()). nprobe / efSearch are applied at
+load time and can be changed per query with set_search_params().
+
+INDEX_PRECISION = "float16" or "int8" stores the vectors of those indexes
+scalar-quantized (FAISS ScalarQuantizer; int8 ranges are calibrated per
+dimension on the training sample). Builds then also save the float32
+vectors to faiss_index/vectors.npy. With INDEX_RESCORE the loaded index is
+a RescoredIndex: it fetches RESCORE_FACTOR * k candidates and re-ranks them
+by exact distance, reading only those rows from the memory-mapped file.
+
+With INDEX_MMAP the served index is memory-mapped read-only (read_index()),
+so processes on one machine (server.py workers) share its vectors through
+the page cache. index.faiss is always replaced by rename, never rewritten in
+place, so a mapped copy stays valid while a build runs.
+
+build_vector_store_streaming() is the bounded-memory alternative: it goes
+straight from PDF pages to chunks to fixed-size embedding batches to the
+index, and can resume from its last committed batch. It drops near-duplicate
+chunks on the way (dedup.py), as ingest does for the batch build.
+
+Both builds also write a BM25 inverted index over the same rows
+(faiss_index/bm25/, see bm25_index.py) and per-paper / per-year row bitmaps
+(faiss_index/filters/, see metadata_filter.py); load_vector_store() attaches
+them as .bm25 for hybrid retrieval and .filters for filtered search.
+
+With INDEX_SHARDING set, the index is split into shards instead
+(sharded_index.py): `python vector_store.py` rebuilds only the shards whose
+chunks changed, `--shard NAME` forces one, and load_vector_store() returns
+a ShardedVectorStore.
 """
 
-import pickle
+import argparse
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+
+import math
 
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import faiss
+import numpy as np
+
+import dedup
+import metrics
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 
-from config import CHUNKS_PATH, FAISS_INDEX_PATH, EMBEDDING_MODEL_NAME
+from bm25_index import BM25Index
+from chunk_store import ChunkStore, ChunkStoreDocstore, ChunkStoreWriter, write_chunk_store
+from metadata_filter import FilterIndex
+from config import (
+    CHUNK_STORE_DIR,
+    FAISS_INDEX_PATH,
+    INDEX_CHUNK_STORE_DIR,
+    BM25_INDEX_DIR,
+    FILTER_INDEX_DIR,
+    BM25_K1,
+    BM25_B,
+    EMBEDDING_MODEL_NAME,
+    PDF_FILES,
+    EMBED_BATCH_SIZE,
+    DEDUP_ENABLED,
+    STREAM_COMMIT_EVERY,
+    STREAM_CHECKPOINT_PATH,
+    FAISS_INDEX_TYPE,
+    INDEX_SHARDING,
+    INDEX_MMAP,
+    INDEX_PRECISION,
+    INT8_CLIP_QUANTILE,
+    INDEX_RESCORE,
+    RESCORE_FACTOR,
+    INDEX_TRAIN_SAMPLE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
+from embedding_engine import EmbeddingEngine, get_embedding_engine
+
+INDEX_FILE = FAISS_INDEX_PATH / "index.faiss"
+VECTORS_FILE = FAISS_INDEX_PATH / "vectors.npy"
+LEGACY_DOCSTORE_FILE = FAISS_INDEX_PATH / "index.pkl"
+
+
+def make_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE, **params):
+    """
+    Returns an empty, trained FAISS index for these vectors (not added yet).
+
+    All types use L2 distance, like LangChain's default IndexFlatL2. IVF and
+    PQ quantizers and int8 ranges are trained on a seeded sample of at
+    most INDEX_TRAIN_SAMPLE vectors. Corpora too small to train IVF on fall
+    back to the flat index. Keyword params override the config values
+    (nlist, m, nbits, hnsw_m, ef_construction, precision).
+    """
+    n, dim = vectors.shape
+    qtype = _sq_type(params.get("precision", INDEX_PRECISION), index_type)
+    if index_type == "flat":
+        if qtype is None:
+            return faiss.IndexFlatL2(dim)
+        return _train(faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2), vectors)
+
+    if index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, params.get("hnsw_m", HNSW_M))
+        else:
+            index = faiss.IndexHNSWSQ(dim, qtype, params.get("hnsw_m", HNSW_M))
+        index.hnsw.efConstruction = params.get("ef_construction", HNSW_EF_CONSTRUCTION)
+        return _train(index, vectors)
+
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        raise ValueError(f"Unknown FAISS index type: {index_type!r}")
+
+    # k-means wants ~39 points per centroid; PQ needs 2**nbits per codebook
+    nlist = params.get("nlist", IVF_NLIST) or int(4 * math.sqrt(n))
+    nlist = max(1, min(nlist, n // 39))
+    nbits = params.get("nbits", PQ_NBITS)
+    if n < 39 or (index_type == "ivf_pq" and n < 2 ** nbits):
+        print(f"[make_index] {n} vectors is too few to train {index_type}; using flat")
+        return make_index(vectors, "flat", **params)
+
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat" and qtype is not None:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype, faiss.METRIC_L2)
+    elif index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, params.get("m", PQ_M), nbits)
+    index.nprobe = IVF_NPROBE
+    return _train(index, vectors)
+
+
+def _sq_type(precision: str, index_type: str):
+    """
+    FAISS ScalarQuantizer type for a precision (None for float32).
+    """
+    if precision not in ("float32", "float16", "int8"):
+        raise ValueError(f"Unknown index precision: {precision!r}")
+    if precision == "float32" or index_type == "ivf_pq":
+        return None
+    return faiss.ScalarQuantizer.QT_fp16 if precision == "float16" else faiss.ScalarQuantizer.QT_8bit
+
+
+def _train(index, vectors: np.ndarray):
+    if index.is_trained:
+        return index
+    sample = vectors
+    if len(vectors) > INDEX_TRAIN_SAMPLE:
+        rows = np.random.default_rng(0).choice(len(vectors), INDEX_TRAIN_SAMPLE, replace=False)
+        sample = vectors[np.sort(rows)]
+    sq = _scalar_quantizer(index)
+    if sq is not None and sq.qtype == faiss.ScalarQuantizer.QT_8bit and INT8_CLIP_QUANTILE > 0:
+        # Calibrate on quantiles so a few outliers do not stretch the range
+        sq.rangestat = faiss.ScalarQuantizer.RS_quantiles
+        sq.rangestat_arg = INT8_CLIP_QUANTILE
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return index
+
+
+def _scalar_quantizer(index):
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    return getattr(index, "sq", None)
+
+
+def is_scalar_quantized(index) -> bool:
+    return _scalar_quantizer(index) is not None
+
+
+class RescoredIndex:
+    """
+    A reduced-precision FAISS index whose top candidates are re-ranked by
+    exact L2 distance to float32 vectors in a memory-mapped array. Offers
+    the parts of a FAISS index that LangChain and RAGBot use.
+    """
 
+    def __init__(self, index, vectors: np.ndarray, factor: int = RESCORE_FACTOR):
+        self.index = index
+        self.vectors = vectors
+        self.factor = factor
 
-def build_vector_store() -> None:
-    with open(CHUNKS_PATH, "rb") as f:
-        payload = pickle.load(f)
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
 
-    docs = payload["docs"]
-    model_name = payload.get("embedding_model_name", EMBEDDING_MODEL_NAME)
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def rescore(self, queries: np.ndarray, rows: np.ndarray, k: int):
+        """
+        (distances, rows) of the k candidates in rows closest to each query.
+        """
+        with metrics.span("faiss.rescore", candidates=rows.size):
+            found = np.where(rows >= 0, rows, 0)
+            # One read per distinct row, in file order
+            unique, inverse = np.unique(found, return_inverse=True)
+            candidates = np.asarray(self.vectors[unique])[inverse.reshape(found.shape)]
+            distances = ((candidates - queries[:, None, :]) ** 2).sum(axis=2, dtype=np.float32)
+            distances[rows < 0] = np.inf
+            top = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(distances, top, axis=1)
+            rows = np.take_along_axis(rows, top, axis=1)
+        if rows.shape[1] < k:
+            pad = ((0, 0), (0, k - rows.shape[1]))
+            distances = np.pad(distances, pad, constant_values=np.inf)
+            rows = np.pad(rows, pad, constant_values=-1)
+        return distances, rows
+
+    def search(self, queries, k: int, params=None):
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        _, rows = self.index.search(queries, min(k * self.factor, self.ntotal), params=params)
+        return self.rescore(queries, rows, k)
+
+
+def save_vectors(vectors: np.ndarray, path) -> None:
+    """
+    Writes the float32 vectors for rescoring (row i = FAISS row i), by rename.
+    """
+    tmp = Path(f"{path}.tmp.npy")
+    np.save(tmp, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp, path)
+
+
+def open_index(path, vectors_path=None, mmap: bool = None):
+    """
+    read_index() with the configured search params, wrapped in a
+    RescoredIndex when it is scalar-quantized, INDEX_RESCORE is on and the
+    float32 vectors were saved.
+    """
+    index = read_index(path, mmap)
+    set_search_params(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+    if INDEX_RESCORE and vectors_path is not None and is_scalar_quantized(index):
+        if Path(vectors_path).exists():
+            vectors = np.load(vectors_path, mmap_mode="r")
+            if len(vectors) == index.ntotal:
+                return RescoredIndex(index, vectors)
+        print(f"[open_index] No float32 vectors for {path}; searching without rescoring.")
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None) -> None:
+    """
+    Sets query-time knobs on an index; those that do not apply are ignored.
+    """
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def read_index(path, mmap: bool = None):
+    """
+    Reads a saved FAISS index. With mmap (default INDEX_MMAP), its vectors (flat and HNSW
+    storage, IVF lists) are mapped read-only from the file instead of copied
+    into private memory; such an index cannot be added to.
+    """
+    if mmap is None:
+        mmap = INDEX_MMAP
+    if mmap and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC)
+    if mmap:
+        print("[read_index] This FAISS version cannot map indexes; loading a private copy.")
+    return faiss.read_index(str(path))
+
+
+def write_index(index, path) -> None:
+    """
+    Writes a FAISS index next to path and renames it into place, so readers
+    that mapped the old file keep a complete copy.
+    """
+    tmp = Path(f"{path}.tmp")
+    faiss.write_index(index, str(tmp))
+    os.replace(tmp, path)
+
+
+def _build_vectordb(docs, embeddings) -> FAISS:
+    """
+    FAISS.from_documents() equivalent that builds a FAISS_INDEX_TYPE index.
+    """
+    with metrics.span("build.embed", chunks=len(docs)):
+        vectors = embeddings.embed_array([d.page_content for d in docs])
+    with metrics.span("build.index", index_type=FAISS_INDEX_TYPE):
+        index = make_index(vectors, FAISS_INDEX_TYPE)
+        index.add(vectors)
+    ids = [d.metadata["chunk_id"] for d in docs]
+    return FAISS(
+        embeddings,
+        index,
+        InMemoryDocstore(dict(zip(ids, docs))),
+        dict(enumerate(ids)),
+    )
+
+
+def build_vector_store(full_rebuild: bool = False) -> None:
+    # Imported here so loading an index does not pull in the PDF tooling
+    from ingest import load_manifest, save_manifest
+
+    if not ChunkStore.exists(CHUNK_STORE_DIR):
+        # Trees from before the chunk store only have artifacts/chunks.pkl
+        raise FileNotFoundError(f"No chunk store in {CHUNK_STORE_DIR}; run `python ingest.py` first")
+
+    start = time.perf_counter()
+    with metrics.span("build.load_chunks"):
+        store = ChunkStore(CHUNK_STORE_DIR)
+        docs = list(store.iter_documents())
+        store.close()
+    ids = [d.metadata["chunk_id"] for d in docs]
+
+    manifest = load_manifest()
+    model_name = manifest.get("embedding_model_name", EMBEDDING_MODEL_NAME)
 
     print(f"[build_vector_store] Using embedding model: {model_name}")
-    embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    embeddings = EmbeddingEngine(model_name)
 
-    print("[build_vector_store] Building FAISS index...")
-    vectordb = FAISS.from_documents(docs, embeddings)
-    FAISS_INDEX_PATH.mkdir(exist_ok=True, parents=True)
-    vectordb.save_local(str(FAISS_INDEX_PATH))
+    index_info = manifest.get("index", {})
+    incremental = (
+        not full_rebuild
+        and index_info.get("embedding_model_name") == model_name
+        and index_info.get("index_type", "flat") == FAISS_INDEX_TYPE
+        and index_info.get("precision", "float32") == INDEX_PRECISION
+        and ChunkStore.exists(INDEX_CHUNK_STORE_DIR)
+    )
+
+    vectordb = None
+    if incremental:
+        vectordb = _load_for_update(embeddings)
+        indexed = set(vectordb.index_to_docstore_id.values())
+        stale = sorted(indexed - set(ids))
+        new_docs = [d for d in docs if d.metadata["chunk_id"] not in indexed]
+        print(
+            f"[build_vector_store] Incremental update: "
+            f"{len(new_docs)} new, {len(stale)} stale, "
+            f"{len(indexed) - len(stale)} unchanged"
+        )
+        if stale and not isinstance(vectordb.index, faiss.IndexFlat):
+            # Only flat indexes renumber rows on removal the way LangChain
+            # expects; rebuild instead (vectors come from the embedding cache)
+            print(f"[build_vector_store] {FAISS_INDEX_TYPE} index cannot drop vectors in place; rebuilding")
+            vectordb = None
+        else:
+            if stale:
+                with metrics.span("build.delete", vectors=len(stale)):
+                    vectordb.delete(stale)
+            if new_docs:
+                with metrics.span("build.add", chunks=len(new_docs)):
+                    vectordb.add_documents(
+                        new_docs, ids=[d.metadata["chunk_id"] for d in new_docs]
+                    )
+
+    if vectordb is None:
+        print(f"[build_vector_store] Building FAISS index ({FAISS_INDEX_TYPE})...")
+        vectordb = _build_vectordb(docs, embeddings)
+
+    with metrics.span("build.save", vectors=vectordb.index.ntotal):
+        save_vector_store(vectordb)
+    metrics.count("build.embedding_cache_hits", embeddings.hits)
+    metrics.count("build.embedded", embeddings.misses)
+    print(f"[build_vector_store] Embedding cache: {embeddings.hits} hits, {embeddings.misses} encoded")
+    _report_dedup(manifest.get("dedup", {}).get("removed", 0), vectordb.index.ntotal, time.perf_counter() - start)
+
+    manifest["index"] = {
+        "embedding_model_name": model_name,
+        "index_type": FAISS_INDEX_TYPE,
+        "precision": INDEX_PRECISION,
+        "num_vectors": vectordb.index.ntotal,
+    }
+    save_manifest(manifest)
 
     print(f"[build_vector_store] Saved FAISS index to {FAISS_INDEX_PATH}")
 
 
-def load_vector_store() -> FAISS:
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    vectordb = FAISS.load_local(
-        str(FAISS_INDEX_PATH),
+def _report_dedup(removed: int, num_vectors: int, build_s: float) -> None:
+    """
+    What the near-duplicates dropped before embedding would have cost,
+    at this build's index bytes and seconds per chunk.
+    """
+    if not removed or not num_vectors:
+        return
+    per_vector = INDEX_FILE.stat().st_size / num_vectors
+    print(
+        f"[build_vector_store] {removed} near-duplicate chunks skipped: "
+        f"~{removed * per_vector / 1024:.0f} KiB of index and ~{removed * build_s / num_vectors:.1f}s of build saved"
+    )
+
+
+def save_vector_store(vectordb: FAISS) -> None:
+    """
+    Writes index.faiss and a chunk store with one row per vector, in index
+    order. Replaces (and removes) the pickled index.pkl docstore.
+    """
+    FAISS_INDEX_PATH.mkdir(exist_ok=True, parents=True)
+    docs = (
+        vectordb.docstore.search(vectordb.index_to_docstore_id[i])
+        for i in range(vectordb.index.ntotal)
+    )
+    write_chunk_store(INDEX_CHUNK_STORE_DIR, docs)
+    write_index(vectordb.index, INDEX_FILE)
+    save_rescore_vectors(vectordb.index, vectordb.embeddings)
+    save_bm25_index()
+    save_filter_index()
+    LEGACY_DOCSTORE_FILE.unlink(missing_ok=True)
+
+
+def save_rescore_vectors(index, embeddings) -> None:
+    """
+    Writes the float32 vectors of the index chunk store's rows for
+    rescoring when index is scalar-quantized (from the embedding cache;
+    nothing is re-encoded), and removes a stale copy otherwise.
+    """
+    if not is_scalar_quantized(index):
+        VECTORS_FILE.unlink(missing_ok=True)
+        return
+    store = ChunkStore(INDEX_CHUNK_STORE_DIR)
+    try:
+        with metrics.span("build.rescore_vectors", rows=len(store)):
+            vectors = embeddings.embed_array([store.text(i) for i in range(len(store))])
+            save_vectors(vectors, VECTORS_FILE)
+    finally:
+        store.close()
+    print(f"[save_rescore_vectors] {len(vectors)} float32 vectors for rescoring")
+
+
+def save_bm25_index() -> None:
+    """
+    Rebuilds the BM25 index from the index chunk store, so its rows match
+    the FAISS rows.
+    """
+    store = ChunkStore(INDEX_CHUNK_STORE_DIR)
+    try:
+        with metrics.span("build.bm25", rows=len(store)):
+            bm25 = BM25Index.build((store.text(i) for i in range(len(store))), BM25_K1, BM25_B)
+            bm25.save(BM25_INDEX_DIR)
+    finally:
+        store.close()
+    print(f"[save_bm25_index] {len(bm25.vocab)} terms over {len(bm25)} chunks")
+
+
+def save_filter_index() -> None:
+    """
+    Rebuilds the metadata filter bitmaps from the index chunk store.
+    """
+    store = ChunkStore(INDEX_CHUNK_STORE_DIR)
+    try:
+        with metrics.span("build.filters", rows=len(store)):
+            filters = FilterIndex.build(store)
+            filters.save(FILTER_INDEX_DIR)
+    finally:
+        store.close()
+    sizes = ", ".join(f"{len(v)} {field}s" for field, v in filters.values.items())
+    print(f"[save_filter_index] Bitmaps for {sizes} over {filters.rows} chunks")
+
+
+def _load_for_update(embeddings) -> FAISS:
+    """
+    Loads the index with an in-memory, writable docstore keyed by chunk_id,
+    which is what add_documents()/delete() need during incremental builds.
+    """
+    store = ChunkStore(INDEX_CHUNK_STORE_DIR)
+    docs = list(store.iter_documents())
+    store.close()
+    return FAISS(
         embeddings,
-        allow_dangerous_deserialization=True,
+        read_index(INDEX_FILE, mmap=False),
+        InMemoryDocstore({d.metadata["chunk_id"]: d for d in docs}),
+        {i: d.metadata["chunk_id"] for i, d in enumerate(docs)},
+    )
+
+
+def _positioned(chunks):
+    """
+    Pairs each chunk with its (file name, page, ordinal within page) position,
+    which is what the streaming checkpoint records.
+    """
+    key, k = None, 0
+    for d in chunks:
+        cur = (Path(d.metadata["source"]).name, d.metadata["page"])
+        k = k + 1 if cur == key else 0
+        key = cur
+        yield (cur[0], cur[1], k), d
+
+
+def _save_checkpoint(state: dict) -> None:
+    tmp = STREAM_CHECKPOINT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    tmp.replace(STREAM_CHECKPOINT_PATH)
+
+
+def _unique(chunks, seen, dropped: list):
+    """
+    The (position, chunk) pairs whose chunk is not a near-duplicate of one
+    already added to seen (a dedup.Deduplicator); the others go to dropped.
+    """
+    for position, d in chunks:
+        if seen.add(d.metadata["chunk_id"], d.page_content) is None:
+            yield position, d
+        else:
+            dropped.append(d.metadata["chunk_id"])
+
+
+def build_vector_store_streaming(resume: bool = True) -> None:
+    """
+    Embeds the corpus in EMBED_BATCH_SIZE batches straight from the PDFs.
+
+    Vectors go straight into a FAISS index and chunk text is appended to the
+    index chunk store on disk, so only one page, one batch and the vectors
+    are in memory at a time. Every STREAM_COMMIT_EVERY batches both are
+    flushed and the position of the last embedded chunk is written to the
+    checkpoint; with resume=True a re-run over the same files and model
+    continues from there.
+    """
+    from ingest import file_sha256, iter_chunks, load_manifest, save_manifest
+
+    files = {p.name: file_sha256(p) for p in PDF_FILES if p.exists()}
+    state = {}
+    if resume and STREAM_CHECKPOINT_PATH.exists():
+        state = json.loads(STREAM_CHECKPOINT_PATH.read_text(encoding="utf-8"))
+    can_resume = (
+        state.get("embedding_model_name") == EMBEDDING_MODEL_NAME
+        and state.get("files") == files
+        and not state.get("done")
+        and state.get("dedup") == dedup.settings()
+        and state.get("position")
+        and INDEX_FILE.exists()
+        and ChunkStore.exists(INDEX_CHUNK_STORE_DIR)
     )
+
+    print(f"[build_vector_store_streaming] Using embedding model: {EMBEDDING_MODEL_NAME}")
+    embeddings = EmbeddingEngine(EMBEDDING_MODEL_NAME)
+    seen = dedup.Deduplicator() if DEDUP_ENABLED else None
+    dropped = []
+    start = time.perf_counter()
+
+    if can_resume:
+        committed = state["committed"]
+        if seen is not None:
+            # Later chunks are compared with the committed ones too
+            store = ChunkStore(INDEX_CHUNK_STORE_DIR)
+            for i in range(committed):
+                seen.add(store.chunk_id(i), store.text(i))
+            store.close()
+        index = read_index(INDEX_FILE, mmap=False)
+        if index.ntotal > committed:
+            # Saved after the checkpoint was last advanced; drop the extra rows
+            index.remove_ids(faiss.IDSelectorRange(committed, index.ntotal))
+        writer = ChunkStoreWriter(INDEX_CHUNK_STORE_DIR, resume_rows=committed)
+        last = tuple(state["position"])
+        chunks = itertools.dropwhile(
+            lambda item: item[0][:2] == last[:2] and item[0][2] <= last[2],
+            _positioned(iter_chunks(start=last[:2])),
+        )
+        print(f"[build_vector_store_streaming] Resuming after {committed} chunks at {last[0]} page {last[1]}")
+    else:
+        committed = 0
+        index = None
+        FAISS_INDEX_PATH.mkdir(exist_ok=True, parents=True)
+        writer = ChunkStoreWriter(INDEX_CHUNK_STORE_DIR)
+        chunks = _positioned(iter_chunks())
+        state = {"embedding_model_name": EMBEDDING_MODEL_NAME, "files": files, "dedup": dedup.settings()}
+    if seen is not None:
+        chunks = _unique(chunks, seen, dropped)
+
+    def commit(position, done=False):
+        with metrics.span("build.commit", chunks=committed):
+            write_index(index, INDEX_FILE)
+            writer.flush()
+            state.update(committed=committed, position=position, done=done)
+            _save_checkpoint(state)
+
+    position = state.get("position")
+    batches = 0
+    while True:
+        batch = list(itertools.islice(chunks, EMBED_BATCH_SIZE))
+        if not batch:
+            break
+
+        docs = [d for _, d in batch]
+        with metrics.span("build.embed", chunks=len(docs)):
+            vectors = embeddings.embed_array([d.page_content for d in docs])
+        with metrics.span("build.index"):
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+        writer.add_documents(docs)
+
+        committed += len(batch)
+        position = list(batch[-1][0])
+        batches += 1
+        if batches % STREAM_COMMIT_EVERY == 0:
+            commit(position)
+            print(f"[build_vector_store_streaming] Committed {committed} chunks")
+
+    if index is None:
+        writer.close()
+        print("[build_vector_store_streaming] No chunks to index.")
+        return
+
+    if FAISS_INDEX_TYPE != "flat" or INDEX_PRECISION != "float32":
+        # Batches were added to a flat index so the build stays resumable;
+        # convert once at the end
+        print(f"[build_vector_store_streaming] Converting to {FAISS_INDEX_TYPE} ({INDEX_PRECISION})")
+        with metrics.span("build.convert", index_type=FAISS_INDEX_TYPE):
+            vectors = index.reconstruct_n(0, index.ntotal)
+            index = make_index(vectors, FAISS_INDEX_TYPE)
+            index.add(vectors)
+        del vectors
+
+    commit(position, done=True)
+    writer.close()
+    save_rescore_vectors(index, embeddings)
+    save_bm25_index()
+    save_filter_index()
+    print(f"[build_vector_store_streaming] Embedding cache: {embeddings.hits} hits, {embeddings.misses} encoded")
+    if seen is not None:
+        print(f"[build_vector_store_streaming] Dropped {len(dropped)} near-duplicate chunks")
+        metrics.count("build.duplicates", len(dropped))
+        _report_dedup(len(dropped), index.ntotal, time.perf_counter() - start)
+    LEGACY_DOCSTORE_FILE.unlink(missing_ok=True)
+
+    manifest = load_manifest()
+    manifest["index"] = {
+        "embedding_model_name": EMBEDDING_MODEL_NAME,
+        "index_type": FAISS_INDEX_TYPE,
+        "precision": INDEX_PRECISION,
+        "num_vectors": index.ntotal,
+    }
+    save_manifest(manifest)
+
+    print(f"[build_vector_store_streaming] Indexed {committed} chunks into {FAISS_INDEX_PATH}")
+
+
+def index_version() -> str:
+    """
+    Token that changes whenever index.faiss is rewritten (mtime + size).
+    """
+    st = INDEX_FILE.stat()
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def load_vector_store(embeddings=None) -> FAISS:
+    """
+    Loads the FAISS index with a read-only, memory-mapped docstore.
+
+    The returned store carries .index_version (see index_version()), which
+    RAGBot uses to invalidate its result cache after a rebuild.
+
+    Indexes saved before the chunk store existed (index.pkl) still load via
+    FAISS.load_local; rebuild them to drop the pickle.
+
+    With INDEX_SHARDING on, returns a ShardedVectorStore over the shards.
+    """
+    with metrics.span("index.load"):
+        if INDEX_SHARDING != "none":
+            from sharded_index import load_sharded_store
+
+            return load_sharded_store(embeddings or get_embedding_engine(EMBEDDING_MODEL_NAME))
+        return _load_vector_store(embeddings)
+
+
+def _load_vector_store(embeddings) -> FAISS:
+    if embeddings is None:
+        embeddings = get_embedding_engine(EMBEDDING_MODEL_NAME)
+
+    version = index_version()
+    if not ChunkStore.exists(INDEX_CHUNK_STORE_DIR):
+        print(
+            "[load_vector_store] Legacy index.pkl found; run `python ingest.py` (writes the chunk store) "
+            "and then `python vector_store.py --full` to convert it."
+        )
+        vectordb = FAISS.load_local(
+            str(FAISS_INDEX_PATH),
+            embeddings,
+            allow_dangerous_deserialization=True,
+        )
+        vectordb.index_version = version
+        vectordb.bm25 = None
+        vectordb.filters = None
+        return vectordb
+
+    index = open_index(INDEX_FILE, VECTORS_FILE)
+    store = ChunkStore(INDEX_CHUNK_STORE_DIR)
+    docstore = ChunkStoreDocstore(store)
+    vectordb = FAISS(
+        embeddings,
+        index,
+        docstore,
+        docstore.index_to_docstore_id(),
+    )
+    vectordb.index_version = version
+    vectordb.bm25 = _load_bm25(index.ntotal)
+    vectordb.filters = load_filter_index(FILTER_INDEX_DIR, store, index.ntotal)
     return vectordb
 
 
+def load_filter_index(path, store: ChunkStore, num_vectors: int):
+    """
+    The saved filter bitmaps for an index, or bitmaps built from its chunk
+    store when they are missing or stale (indexes built before filters).
+    """
+    if FilterIndex.exists(path):
+        filters = FilterIndex.load(path, store.pages())
+        if filters.rows == num_vectors:
+            return filters
+    if len(store) != num_vectors:
+        print("[load_vector_store] Chunk store does not match the FAISS index; filtered search is off.")
+        return None
+    return FilterIndex.build(store)
+
+
+def _load_bm25(num_vectors: int):
+    if not BM25Index.exists(BM25_INDEX_DIR):
+        return None
+    bm25 = BM25Index.load(BM25_INDEX_DIR)
+    if len(bm25) != num_vectors:
+        print("[load_vector_store] BM25 index does not match the FAISS index; rebuild to use hybrid retrieval.")
+        return None
+    return bm25
+
+
 if __name__ == "__main__":
-    build_vector_store()
+    parser = argparse.ArgumentParser(description="Build the FAISS index from the ingest chunk store.")
+    parser.add_argument("--full", action="store_true", help="rebuild the index from scratch")
+    parser.add_argument("--stream", action="store_true", help="bounded-memory build straight from the PDFs")
+    parser.add_argument("--restart", action="store_true", help="with --stream, ignore the checkpoint")
+    parser.add_argument("--shard", action="append", help="with INDEX_SHARDING, rebuild only this shard (repeatable)")
+    parser.add_argument("--timings", action="store_true", help="print per-stage timings at the end")
+    args = parser.parse_args()
+
+    if args.timings:
+        metrics.enable()
+    if INDEX_SHARDING != "none":
+        if args.stream:
+            raise SystemExit("--stream builds a single index; set INDEX_SHARDING = \"none\" to use it.")
+        from sharded_index import build_shards
+
+        build_shards(only=args.shard, full_rebuild=args.full)
+    elif args.stream:
+        build_vector_store_streaming(resume=not args.restart)
+    else:
+        build_vector_store(full_rebuild=args.full)
+    if args.timings:
+        metrics.print_stats()